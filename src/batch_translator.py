@@ -0,0 +1,291 @@
+import os
+import json
+import time
+from .block_triage import COPY_THROUGH_LABELS
+
+class BatchTranslator:
+    """Message Batches模式的批量翻譯
+    
+    適合延遲不重要、成本和吞吐量優先的夜間批量任務：
+    1. collect()收集文檔中所有需要翻譯、翻譯記憶中還沒有的單元（文本塊、標題、公式、表格、圖片文字）
+    2. submit()把它們作為Message Batches提交（文本塊按令牌預算打包為編號段落）
+    3. wait()輪詢批次狀態，結束後下載結果，寫入ClaudeTranslator的術語記憶和翻譯記憶
+    之後按正常流程處理文檔時，這些單元直接命中記憶，未能取得結果的單元仍即時翻譯。
+    
+    批次狀態（批次ID和每個請求對應的原文）保存在state_path中，
+    進程重啟後resume()繼續輪詢已提交的批次，不會重複提交。
+    """
+    
+    # 狀態文件格式版本
+    STATE_VERSION = 1
+    
+    def __init__(self, translator, state_path=".cache/batches/state.json", poll_interval=60.0,
+                 max_requests_per_batch=10000, client=None):
+        """初始化批量翻譯器
+        
+        Args:
+            translator: ClaudeTranslator實例（提供提示模板和翻譯記憶）
+            state_path: 批次狀態文件路徑
+            poll_interval: 輪詢批次狀態的間隔（秒）
+            max_requests_per_batch: 每個批次最多包含的請求數
+            client: anthropic.Anthropic客戶端（None表示使用translator.client）
+        """
+        self.translator = translator
+        self.client = client or translator.client
+        # 共享客戶端關閉了SDK的自動重試，批次API調用同樣經過翻譯器的重試策略
+        self.retry_policy = translator.retry_policy
+        self.state_path = state_path
+        self.poll_interval = poll_interval
+        self.max_requests_per_batch = max_requests_per_batch
+        
+        # 待提交的單元: [(類型, 原文, 領域)]，以及已收集的鍵，用於去重
+        self._units = []
+        self._collected = set()
+        # 各領域使用的術語資料庫
+        self._terminology = {}
+        
+        # 統計
+        self.submitted_requests = 0
+        self.stored_translations = 0
+        self.failed_requests = 0
+        
+        self.state = self._load_state()
+    
+    def _load_state(self):
+        """讀取批次狀態文件"""
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get("version") == self.STATE_VERSION:
+                    return state
+                print(f"批次狀態文件版本不符，忽略: {self.state_path}")
+            except (OSError, ValueError) as e:
+                print(f"讀取批次狀態文件時出錯: {e}")
+        return {"version": self.STATE_VERSION, "batches": []}
+    
+    def _save_state(self):
+        """原子地寫入批次狀態文件"""
+        if os.path.dirname(self.state_path):
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+    
+    def _add_unit(self, kind, source, domain):
+        """加入一個待翻譯單元（記憶中已有或已收集時跳過）"""
+        if not source or not source.strip():
+            return
+        # 公式、圖像和表格的記憶不區分領域
+        domain = domain if kind == "text" else None
+        key = (kind, source, domain)
+        if key in self._collected:
+            return
+        self._collected.add(key)
+        if self.translator._recall(kind, source, domain) is not None:
+            return
+        self._units.append(key)
+    
+    def collect(self, pdf_data, terminology_db=None, domain=None):
+        """收集一個文檔中需要翻譯的單元
+        
+        與translate_document_section的處理方式一致：分流為copy/reference的塊跳過，
+        同一類頁眉頁腳只收集第一個塊。應在分流和頁眉頁腳檢測之後調用。
+        
+        Args:
+            pdf_data: PDFProcessor.process_pdf的解析結果
+            terminology_db: 專業術語資料庫
+            domain: 文檔領域
+        
+        Returns:
+            本文檔新增的待翻譯單元數
+        """
+        before = len(self._units)
+        self._terminology[domain] = terminology_db
+        furniture_seen = set()
+        
+        for page in pdf_data.get("text_data", []):
+            for block in page.get("blocks", []):
+                block_type = block.get("type")
+                if block.get("triage") in COPY_THROUGH_LABELS:
+                    continue
+                if block.get("furniture"):
+                    if block["furniture"] not in furniture_seen:
+                        furniture_seen.add(block["furniture"])
+                        self._add_unit("text", block.get("content", ""), domain)
+                    continue
+                
+                if block_type == "text":
+                    self._add_unit("text", block.get("content", ""), domain)
+                elif block_type == "formula":
+                    self._add_unit("formula", block.get("content", ""), domain)
+                elif block_type in ("image", "figure"):
+                    self._add_unit("image", block.get("text_in_image") or "", domain)
+                elif block_type == "table" and block.get("data"):
+                    self._add_unit("table", json.dumps(block["data"], ensure_ascii=False), domain)
+                if block_type in ("formula", "image", "figure", "table") and block.get("caption"):
+                    self._add_unit("text", block["caption"], domain)
+        
+        for page in pdf_data.get("table_data", []):
+            for table in page.get("tables", []):
+                if table.get("data"):
+                    self._add_unit("table", json.dumps(table["data"], ensure_ascii=False), domain)
+                if table.get("caption"):
+                    self._add_unit("text", table["caption"], domain)
+        
+        for img_info in pdf_data.get("images", []):
+            self._add_unit("image", img_info.get("text_in_image") or "", domain)
+        
+        return len(self._units) - before
+    
+    def _build_requests(self):
+        """把收集的單元轉為批次請求
+        
+        Returns:
+            [(custom_id, {"kind", "domain", "sources"}, params)]
+        """
+        translator = self.translator
+        requests = []
+        
+        def add_request(kind, sources, domain):
+            system, prompt, max_tokens = translator.create_batch_request(kind, sources, self._terminology.get(domain), domain)
+            custom_id = f"{kind}-{len(requests)}"
+            params = {
+                "model": translator.model,
+                "max_tokens": max_tokens,
+                "system": system,
+                "messages": [{"role": "user", "content": prompt}]
+            }
+            requests.append((custom_id, {"kind": kind, "domain": domain, "sources": sources}, params))
+        
+        # 文本按領域打包為編號段落，與即時翻譯的打包規則相同
+        texts = {}
+        for kind, source, domain in self._units:
+            if kind == "text" and translator.pack_segments:
+                texts.setdefault(domain, []).append(source)
+            else:
+                add_request(kind, [source], domain)
+        
+        for domain, sources in texts.items():
+            for pack in translator.chunker.pack(sources):
+                add_request("text", [sources[i] for i in pack], domain)
+        
+        return requests
+    
+    def submit(self):
+        """提交收集的單元
+        
+        Returns:
+            新提交的批次ID列表
+        """
+        requests = self._build_requests()
+        self._units = []
+        if not requests:
+            print("沒有需要批量翻譯的內容")
+            return []
+        
+        batch_ids = []
+        for start in range(0, len(requests), self.max_requests_per_batch):
+            chunk = requests[start:start + self.max_requests_per_batch]
+            batch = self.retry_policy.call(self.client.messages.batches.create, requests=[
+                {"custom_id": custom_id, "params": params} for custom_id, _, params in chunk
+            ])
+            # 提交後立即保存，進程重啟時繼續輪詢而不是重新提交
+            self.state["batches"].append({
+                "id": batch.id,
+                "status": batch.processing_status,
+                "submitted": time.time(),
+                "requests": {custom_id: unit for custom_id, unit, _ in chunk}
+            })
+            self._save_state()
+            self.submitted_requests += len(chunk)
+            batch_ids.append(batch.id)
+            print(f"已提交批次 {batch.id}，{len(chunk)} 個請求")
+        return batch_ids
+    
+    def pending_batches(self):
+        """尚未寫入結果的批次"""
+        return [entry for entry in self.state["batches"] if entry["status"] != "applied"]
+    
+    def poll(self):
+        """檢查所有未完成的批次，已結束的批次下載結果並寫入翻譯記憶
+        
+        Returns:
+            仍在處理中的批次數
+        """
+        pending = 0
+        for entry in self.pending_batches():
+            batch = self.retry_policy.call(self.client.messages.batches.retrieve, entry["id"])
+            entry["status"] = batch.processing_status
+            if batch.processing_status != "ended":
+                counts = batch.request_counts
+                print(f"批次 {entry['id']} 處理中: 完成 {counts.succeeded}，處理中 {counts.processing}")
+                pending += 1
+                continue
+            self._apply_results(entry)
+            # 結果已寫入翻譯記憶，不再保留原文
+            entry["status"] = "applied"
+            entry["request_count"] = len(entry.pop("requests"))
+            self._save_state()
+        return pending
+    
+    def _apply_results(self, entry):
+        """下載批次結果並寫入翻譯記憶"""
+        stored = 0
+        failed = 0
+        # 結果是流式下載的，整體下載完再處理，下載中途出錯時從頭重試
+        results = self.retry_policy.call(lambda: list(self.client.messages.batches.results(entry["id"])))
+        for result in results:
+            unit = entry["requests"].get(result.custom_id)
+            if unit is None:
+                continue
+            if result.result.type != "succeeded":
+                failed += 1
+                continue
+            self.translator.record_usage(result.result.message.usage)
+            response_text = "".join(
+                block.text for block in result.result.message.content if getattr(block, "type", "text") == "text"
+            )
+            truncated = getattr(result.result.message, "stop_reason", None) == "max_tokens"
+            stored += self.translator.store_batch_response(unit["kind"], unit["sources"], response_text, unit["domain"], truncated)
+        
+        self.stored_translations += stored
+        self.failed_requests += failed
+        print(f"批次 {entry['id']} 已結束: 寫入 {stored} 條譯文，失敗 {failed} 個請求（失敗的內容將即時翻譯）")
+    
+    def resume(self):
+        """繼續上次運行中已提交、尚未寫入結果的批次
+        
+        Returns:
+            處理中的批次數（0表示沒有未完成的批次）
+        """
+        pending = self.pending_batches()
+        if pending:
+            print(f"繼續輪詢上次提交的 {len(pending)} 個批次")
+        return self.wait()
+    
+    def wait(self, timeout=None):
+        """輪詢直到所有批次結束
+        
+        Args:
+            timeout: 最長等待秒數（None表示一直等待）
+        
+        Returns:
+            超時時仍在處理中的批次數
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            pending = self.poll()
+            if not pending or (deadline is not None and time.time() >= deadline):
+                return pending
+            time.sleep(self.poll_interval)
+    
+    def get_statistics(self):
+        """獲取批量翻譯統計"""
+        return {
+            "submitted_requests": self.submitted_requests,
+            "stored_translations": self.stored_translations,
+            "failed_requests": self.failed_requests,
+            "pending_batches": len(self.pending_batches())
+        }
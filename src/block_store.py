@@ -0,0 +1,263 @@
+import sys
+import numpy as np
+from collections.abc import MutableMapping
+
+class _Missing:
+    """缺失值標記（區別於值為None的字段），序列化後仍是同一個對象"""
+    
+    def __reduce__(self):
+        return "_MISSING"
+    
+    def __repr__(self):
+        return "<missing>"
+
+_MISSING = _Missing()
+
+# 常見塊類型的整數編碼，其他類型在存儲中首次出現時追加
+BLOCK_TYPES = ("text", "formula", "image", "figure", "table", "unknown")
+_NO_TYPE = 255
+
+# 用NumPy數組保存的數值字段: {字段名: (dtype, 缺失值)}
+_NUMERIC_FIELDS = {
+    "formula_score": (np.float64, np.nan),
+    "page_num": (np.int32, -1),
+    "xref": (np.int32, -1)
+}
+
+class BlockStore:
+    """緊湊的頁面塊存儲（按列保存）
+    
+    塊類型保存為uint8編碼（編碼表隨存儲一起保存），邊界框保存為float64的 (n, 4) 數組
+    （與Python浮點數相同，序列化結果不變），formula_score、page_num、xref等數值字段各用一個NumPy數組
+    （這些字段的非數值值保存在對象列中），其餘字段（content、content_translated、caption等）每個字段一個列表，
+    只有出現過的字段才建立列。通過索引或迭代得到的BlockView
+    與字典接口兼容，現有按 block["content"]、block.get("type") 訪問的代碼無需修改。
+    """
+    
+    def __init__(self, size=0):
+        """創建指定塊數的空存儲"""
+        self._size = size
+        self.type_names = list(BLOCK_TYPES)
+        self.types = np.full(size, _NO_TYPE, dtype=np.uint8)
+        self.bboxes = np.full((size, 4), np.nan, dtype=np.float64)
+        # {字段名: NumPy數組}
+        self._numeric = {}
+        # {字段名: 列表}，缺失值為_MISSING
+        self._objects = {}
+    
+    @classmethod
+    def from_dicts(cls, blocks):
+        """從字典形式的塊列表建立存儲
+        
+        Args:
+            blocks: 塊字典列表
+        
+        Returns:
+            BlockStore
+        """
+        store = cls(len(blocks))
+        for idx, block in enumerate(blocks):
+            for key, value in block.items():
+                store.set_field(idx, key, value)
+        return store
+    
+    def __len__(self):
+        return self._size
+    
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._size
+        if not 0 <= idx < self._size:
+            raise IndexError("塊索引超出範圍")
+        return BlockView(self, idx)
+    
+    def __iter__(self):
+        for idx in range(self._size):
+            yield BlockView(self, idx)
+    
+    def copy(self):
+        """複製整個存儲（數組和列表整體複製，不逐塊複製字典）"""
+        store = BlockStore.__new__(BlockStore)
+        store._size = self._size
+        store.type_names = list(self.type_names)
+        store.types = self.types.copy()
+        store.bboxes = self.bboxes.copy()
+        store._numeric = {key: column.copy() for key, column in self._numeric.items()}
+        store._objects = {key: list(column) for key, column in self._objects.items()}
+        return store
+    
+    def to_dicts(self):
+        """轉換回字典形式的塊列表（用於JSON序列化）"""
+        return [dict(view) for view in self]
+    
+    def get_field(self, idx, key):
+        """讀取字段，缺失時返回_MISSING"""
+        if key == "type":
+            code = self.types[idx]
+            return _MISSING if code == _NO_TYPE else self.type_names[code]
+        if key == "bbox":
+            bbox = self.bboxes[idx]
+            return _MISSING if np.isnan(bbox[0]) else tuple(float(coord) for coord in bbox)
+        if key in _NUMERIC_FIELDS:
+            column = self._numeric.get(key)
+            if column is not None:
+                value = column[idx]
+                missing = _NUMERIC_FIELDS[key][1]
+                if not (np.isnan(value) if np.isnan(missing) else value == missing):
+                    return value.item()
+            # 非數值值（如None）保存在對象列中
+        column = self._objects.get(key)
+        return _MISSING if column is None else column[idx]
+    
+    def set_field(self, idx, key, value):
+        """寫入字段，按需建立列"""
+        if key == "type":
+            self.types[idx] = self._type_code(value)
+        elif key == "bbox":
+            self.bboxes[idx] = value
+        elif key in _NUMERIC_FIELDS and isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            column = self._numeric.get(key)
+            if column is None:
+                dtype, missing = _NUMERIC_FIELDS[key]
+                column = self._numeric[key] = np.full(self._size, missing, dtype=dtype)
+            column[idx] = value
+            if key in self._objects:
+                self._objects[key][idx] = _MISSING
+        else:
+            if key in self._numeric:
+                self._numeric[key][idx] = _NUMERIC_FIELDS[key][1]
+            column = self._objects.get(key)
+            if column is None:
+                column = self._objects[key] = [_MISSING] * self._size
+            # 短字符串（如重複出現的標題、路徑）駐留後共用同一個對象
+            if isinstance(value, str) and len(value) <= 64:
+                value = sys.intern(value)
+            column[idx] = value
+    
+    def _type_code(self, name):
+        """獲取塊類型的整數編碼"""
+        try:
+            return self.type_names.index(name)
+        except ValueError:
+            if len(self.type_names) >= _NO_TYPE:
+                raise ValueError(f"塊類型過多，無法編碼: {name}")
+            self.type_names.append(name)
+            return len(self.type_names) - 1
+    
+    def delete_field(self, idx, key):
+        """刪除字段，字段不存在時拋出KeyError"""
+        if self.get_field(idx, key) is _MISSING:
+            raise KeyError(key)
+        if key == "type":
+            self.types[idx] = _NO_TYPE
+        elif key == "bbox":
+            self.bboxes[idx] = np.nan
+        else:
+            if key in self._numeric:
+                self._numeric[key][idx] = _NUMERIC_FIELDS[key][1]
+            if key in self._objects:
+                self._objects[key][idx] = _MISSING
+    
+    def field_names(self, idx):
+        """列出塊中存在的字段名"""
+        names = [key for key in ("type", "content", "bbox") if self.get_field(idx, key) is not _MISSING]
+        for key in self._numeric:
+            if self.get_field(idx, key) is not _MISSING:
+                names.append(key)
+        for key, column in self._objects.items():
+            if key != "content" and key not in self._numeric and column[idx] is not _MISSING:
+                names.append(key)
+        return names
+
+class BlockView(MutableMapping):
+    """BlockStore中單個塊的字典兼容視圖
+    
+    讀寫直接作用於存儲本身；copy()返回普通字典，
+    供需要獨立修改副本的現有代碼使用。
+    """
+    
+    __slots__ = ("_store", "index")
+    
+    def __init__(self, store, index):
+        self._store = store
+        self.index = index
+    
+    def __getitem__(self, key):
+        value = self._store.get_field(self.index, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        self._store.set_field(self.index, key, value)
+    
+    def __delitem__(self, key):
+        self._store.delete_field(self.index, key)
+    
+    def __iter__(self):
+        return iter(self._store.field_names(self.index))
+    
+    def __len__(self):
+        return len(self._store.field_names(self.index))
+    
+    def __contains__(self, key):
+        return self._store.get_field(self.index, key) is not _MISSING
+    
+    def copy(self):
+        return dict(self)
+    
+    def __repr__(self):
+        return f"BlockView({dict(self)!r})"
+
+# 微基準測試：比較字典列表與BlockStore的內存佔用和複製耗時
+if __name__ == "__main__":
+    import random
+    import time
+    import tracemalloc
+    
+    random.seed(0)
+    pages, blocks_per_page = 500, 40
+    words = ["network", "intrusion", "detection", "model", "learning", "the", "of", "and"]
+    
+    def make_page():
+        blocks = []
+        for _ in range(blocks_per_page):
+            x0, y0 = random.uniform(0, 500), random.uniform(0, 700)
+            blocks.append({
+                "type": random.choice(["text", "text", "text", "formula"]),
+                "content": " ".join(random.choice(words) for _ in range(30)),
+                "bbox": (x0, y0, x0 + 80.0, y0 + 12.0),
+                "formula_score": round(random.random(), 3)
+            })
+        return blocks
+    
+    tracemalloc.start()
+    dict_pages = [make_page() for _ in range(pages)]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    
+    # 內容字符串兩種表示共用，只比較塊結構本身的開銷
+    content_bytes = sum(sys.getsizeof(block["content"]) for page in dict_pages for block in page)
+    
+    tracemalloc.start()
+    store_pages = [BlockStore.from_dicts(page) for page in dict_pages]
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    
+    start = time.perf_counter()
+    for page in dict_pages:
+        copied = [block.copy() for block in page]
+    dict_copy_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for page in store_pages:
+        copied = page.copy()
+    store_copy_time = time.perf_counter() - start
+    
+    assert all(store.to_dicts() == page for store, page in zip(store_pages, dict_pages))
+    
+    print(f"頁數: {pages}，每頁塊數: {blocks_per_page}")
+    print(f"字典列表結構開銷: {(dict_bytes - content_bytes) / 1024 / 1024:.2f} MB")
+    print(f"BlockStore結構開銷: {store_bytes / 1024 / 1024:.2f} MB")
+    print(f"逐塊複製字典: {dict_copy_time * 1000:.1f} 毫秒")
+    print(f"複製BlockStore: {store_copy_time * 1000:.1f} 毫秒")
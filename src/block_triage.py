@@ -0,0 +1,232 @@
+import re
+
+# 分流標籤
+TRANSLATE = "translate"
+COPY = "copy"
+REFERENCE = "reference"
+
+# 不需要調用API的標籤
+COPY_THROUGH_LABELS = (COPY, REFERENCE)
+
+# 參考文獻章節標題（允許 "7 References"、"VII. REFERENCES" 等編號）
+REFERENCES_HEADING_PATTERN = re.compile(
+    r'^\s*(?:[0-9IVX]+\.?\s+)?(references|bibliography|works cited|literature cited|參考文獻|参考文献)\s*$',
+    re.IGNORECASE
+)
+# 參考文獻之後重新需要翻譯的章節
+SECTION_AFTER_REFERENCES_PATTERN = re.compile(
+    r'^\s*(?:[A-Z0-9]+\.?\s+)?(appendix|appendices|supplementary|附錄)\b',
+    re.IGNORECASE
+)
+# 帶編號的參考文獻條目，如 "[12] A. Smith, ... 2019."
+REFERENCE_ENTRY_PATTERN = re.compile(r'^\s*\[\d{1,3}\]\s+\S.*\b(19|20)\d{2}\b', re.DOTALL)
+
+# 不需要翻譯的標識符：DOI、URL、電子郵件、arXiv編號
+IDENTIFIER_PATTERN = re.compile(
+    r'(?:doi:\s*|https?://doi\.org/)?10\.\d{4,9}/\S+'
+    r'|https?://\S+|www\.\S+'
+    r'|[\w.+-]+@[\w-]+(?:\.[\w-]+)+'
+    r'|arXiv:\s*\d{4}\.\d{4,5}(?:v\d+)?',
+    re.IGNORECASE
+)
+WORD_PATTERN = re.compile(r'[A-Za-z]+')
+
+# 機構名稱關鍵詞，用於識別作者單位
+AFFILIATION_KEYWORDS = re.compile(
+    r'\b(university|universit[àäé]|institute|department|dept\.|school of|college|laboratory|labs?|'
+    r'academy|faculty|centre|center|inc\.|corporation)\b',
+    re.IGNORECASE
+)
+
+# 常見英文虛詞，正文中出現頻率很高
+ENGLISH_STOPWORDS = frozenset("""
+a an the of and or to in on at by for with from as is are was were be been being it its this that these
+those we our they their which who whom than then but not no can may will would should could has have had
+do does did into over under between such also however both each more most other only so very
+""".split())
+
+# 英文中最常見的字母二元組
+ENGLISH_BIGRAMS = frozenset("""
+th he in er an re on at en nd ti es or te of ed is it al ar st to nt ng se ha as ou io le ve co me de hi
+ri ro ic ne ea ra ce li ch ll be ma si om ur ca el ta la ns ge ly ei os no pe do su pa ec ac ot di ol tr
+""".split())
+
+def _char_class_table():
+    """建立str.translate的字符分類表
+    
+    ASCII字母映射為"a"，數字為"0"，中日韓文字和全角標點為"c"，
+    空白為" "，其他字符保持不變。單次translate後用count統計各類字符數。
+    """
+    table = {}
+    for code in range(0x4E00, 0xA000):
+        table[code] = "c"
+    for code in range(0x3400, 0x4DC0):
+        table[code] = "c"
+    for code in range(0x3000, 0x3040):
+        table[code] = "c"
+    for code in range(0xFF00, 0xFFF0):
+        table[code] = "c"
+    for char in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ":
+        table[ord(char)] = "a"
+    for char in "0123456789":
+        table[ord(char)] = "0"
+    for char in " \t\n\r\f\v":
+        table[ord(char)] = " "
+    return table
+
+_CHAR_CLASSES = _char_class_table()
+
+class BlockTriage:
+    """文本塊分流
+    
+    在翻譯前把文本塊標記為translate（需要翻譯）、copy（原樣保留：純數字、
+    DOI/URL/郵箱、作者單位、已經是中文的文本）或reference（參考文獻條目）。
+    判斷只用字符分類計數、英文虛詞和字母二元組比例，整頁一次性批量處理，
+    不對每個塊調用langdetect。copy和reference塊不會發送到API。
+    
+    參考文獻章節跨頁延續，因此分流器記錄是否已進入參考文獻章節；
+    處理新文檔前調用reset()。
+    """
+    
+    def __init__(self, min_letters=3, max_cjk_ratio=0.3, min_english_score=0.35):
+        """初始化分流器
+        
+        Args:
+            min_letters: 去掉標識符後至少有多少個英文字母才需要翻譯
+            max_cjk_ratio: 中文字符佔文字比例超過此值時視為已是目標語言
+            min_english_score: 四個詞以上、不含虛詞的塊，字母二元組得分低於此值時視為非正文
+        """
+        self.min_letters = min_letters
+        self.max_cjk_ratio = max_cjk_ratio
+        self.min_english_score = min_english_score
+        self.in_references = False
+    
+    def reset(self):
+        """開始處理新文檔"""
+        self.in_references = False
+    
+    def classify_batch(self, texts):
+        """批量判斷文本的分流標籤（不考慮參考文獻章節狀態）
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            與texts對應的標籤列表
+        """
+        return [self._classify(text) for text in texts]
+    
+    def _classify(self, text):
+        """判斷單個文本的分流標籤"""
+        text = text.strip()
+        if not text:
+            return COPY
+        
+        classes = text.translate(_CHAR_CLASSES)
+        cjk = classes.count("c")
+        letters = classes.count("a")
+        
+        # 已經是中文
+        if cjk and cjk / (cjk + letters) > self.max_cjk_ratio:
+            return COPY
+        
+        # 去掉DOI、URL、郵箱等標識符後幾乎沒有字母（頁碼、純數字、表格數值等）
+        stripped = IDENTIFIER_PATTERN.sub(" ", text) if letters else text
+        if stripped is not text:
+            letters = stripped.translate(_CHAR_CLASSES).count("a")
+        if letters < self.min_letters:
+            return COPY
+        
+        if REFERENCE_ENTRY_PATTERN.match(text):
+            return REFERENCE
+        
+        words = WORD_PATTERN.findall(stripped)
+        lower_words = [word.lower() for word in words]
+        stopwords = sum(1 for word in lower_words if word in ENGLISH_STOPWORDS)
+        
+        # 作者單位：短文本、含機構關鍵詞或郵箱，除虛詞外幾乎都是首字母大寫的專有名詞
+        if len(text) < 300 and (AFFILIATION_KEYWORDS.search(stripped) or stripped is not text):
+            lowercase_content = sum(
+                1 for word, lower in zip(words, lower_words)
+                if word[0].islower() and lower not in ENGLISH_STOPWORDS
+            )
+            capitalized = sum(1 for word in words if word[0].isupper())
+            if lowercase_content < 2 and capitalized >= 2:
+                return COPY
+        
+        # 四個詞以上卻沒有任何虛詞、字母組合也不像英文（標識符列表、代碼、亂碼）
+        if len(words) >= 4 and stopwords == 0 and self._english_score(lower_words) < self.min_english_score:
+            return COPY
+        
+        return TRANSLATE
+    
+    def _english_score(self, lower_words):
+        """字母二元組中屬於常見英文二元組的比例"""
+        total = 0
+        common = 0
+        for word in lower_words:
+            for i in range(len(word) - 1):
+                total += 1
+                if word[i:i + 2] in ENGLISH_BIGRAMS:
+                    common += 1
+        return common / total if total else 0.0
+    
+    def triage_page(self, blocks):
+        """標記一頁中文本塊的分流標籤（寫入block["triage"]）
+        
+        Args:
+            blocks: 頁面的塊列表或BlockStore
+        
+        Returns:
+            {標籤: 塊數}
+        """
+        text_blocks = [block for block in blocks if block.get("type") == "text"]
+        labels = self.classify_batch([block.get("content", "") for block in text_blocks])
+        
+        counts = {TRANSLATE: 0, COPY: 0, REFERENCE: 0}
+        for block, label in zip(text_blocks, labels):
+            content = block.get("content", "")
+            if REFERENCES_HEADING_PATTERN.match(content):
+                # 標題本身仍然翻譯，之後的條目原樣保留
+                self.in_references = True
+            elif self.in_references and SECTION_AFTER_REFERENCES_PATTERN.match(content):
+                self.in_references = False
+            elif self.in_references and label == TRANSLATE:
+                label = REFERENCE
+            
+            block["triage"] = label
+            counts[label] += 1
+        return counts
+    
+    def triage_pages(self, pages):
+        """標記整個文檔的文本塊
+        
+        Args:
+            pages: 頁面數據列表（每頁包含blocks）
+        
+        Returns:
+            {標籤: 塊數}
+        """
+        self.reset()
+        counts = {TRANSLATE: 0, COPY: 0, REFERENCE: 0}
+        for page in pages:
+            for label, count in self.triage_page(page.get("blocks", [])).items():
+                counts[label] += count
+        return counts
+
+# 簡單示例
+if __name__ == "__main__":
+    samples = [
+        "Introduction",
+        "Deep learning has been widely applied to network intrusion detection.",
+        "https://doi.org/10.1109/TNNLS.2020.1234567",
+        "12",
+        "0.931 0.912 0.887",
+        "Department of Computer Science, National Taiwan University, Taipei, Taiwan",
+        "alice@example.edu",
+        "本文提出一種新的入侵檢測方法。",
+        "[3] A. Smith and B. Lee, Attention is all you need, NeurIPS, 2017.",
+    ]
+    triage = BlockTriage()
+    for sample, label in zip(samples, triage.classify_batch(samples)):
+        print(f"{label:10s} {sample}")
@@ -0,0 +1,222 @@
+import re
+import threading
+from .rate_limiter import RateLimiter
+
+# 句子結束：句末標點（可跟右引號、右括號）之後是空白，且下一句以大寫字母、數字、引號、括號或中日韓字符開頭
+SENTENCE_END_PATTERN = re.compile(
+    r'(?<=[.!?。！？])["\'”’)\]]*\s+(?=["\'“‘(\[A-Z0-9㐀-鿿])'
+)
+# 段落分隔
+PARAGRAPH_PATTERN = re.compile(r'\n\s*\n')
+# 以這些縮寫結尾的句點不是句子結束
+ABBREVIATIONS = frozenset({
+    "al", "e.g", "i.e", "cf", "vs", "etc", "fig", "figs", "eq", "eqs", "sec", "secs", "tab",
+    "ref", "refs", "no", "nos", "vol", "pp", "ch", "dr", "mr", "mrs", "ms", "prof", "approx", "resp"
+})
+
+def split_sentences(text):
+    """在句子邊界切分文本，不在句子中間切分
+    
+    各句保留其後的空白，所有句子按順序連接後等於原文。
+    縮寫（e.g.、et al.、Fig. 等）和小數點後的句點不視為句子結束。
+    
+    Args:
+        text: 原文
+    
+    Returns:
+        句子列表
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        word = text[start:match.start()].rstrip("\"'”’)]").split()
+        last_word = word[-1].rstrip(".!?").lower() if word else ""
+        if last_word in ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha()):
+            continue
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+class TokenEstimator:
+    """按實際用量校準的令牌數估計
+    
+    以RateLimiter.estimate_tokens的字符數近似為基礎，每次請求後用response.usage
+    更新兩個校準係數（指數移動平均）：實際輸入令牌數/估計值，以及實際輸出令牌數/原文估計值。
+    """
+    
+    # 新觀測值的權重
+    SMOOTHING = 0.2
+    # 校準係數的範圍，避免個別異常回應把估計帶偏
+    MIN_RATIO = 0.25
+    MAX_RATIO = 8.0
+    
+    def __init__(self, input_ratio=1.0, output_ratio=2.0):
+        """初始化估計器
+        
+        Args:
+            input_ratio: 輸入令牌的初始校準係數
+            output_ratio: 譯文令牌數與原文估計令牌數之比的初始值（中文譯文通常比英文原文佔更多令牌）
+        """
+        self.input_ratio = input_ratio
+        self.output_ratio = output_ratio
+        self.observations = 0
+        self._lock = threading.Lock()
+    
+    def estimate(self, text):
+        """估計文本作為輸入的令牌數"""
+        return int(RateLimiter.estimate_tokens(text) * self.input_ratio) + 1 if text else 0
+    
+    def estimate_output(self, text):
+        """估計原文譯文的輸出令牌數"""
+        return int(RateLimiter.estimate_tokens(text) * self.output_ratio) + 1 if text else 0
+    
+    def observe(self, estimated_input, estimated_source, usage):
+        """用一次請求的實際用量更新校準係數
+        
+        Args:
+            estimated_input: 請求全部輸入（系統提示和使用者提示）的未校準估計值
+            estimated_source: 請求中原文的未校準估計值（0表示不更新輸出係數）
+            usage: response.usage
+        """
+        if usage is None or estimated_input <= 0:
+            return
+        actual_input = (getattr(usage, "input_tokens", 0) or 0) \
+            + (getattr(usage, "cache_creation_input_tokens", 0) or 0) \
+            + (getattr(usage, "cache_read_input_tokens", 0) or 0)
+        actual_output = getattr(usage, "output_tokens", 0) or 0
+        
+        with self._lock:
+            if actual_input > 0:
+                self.input_ratio = self._update(self.input_ratio, actual_input / estimated_input)
+            # 被max_tokens截斷的回應會低估輸出，由調用方決定是否傳入estimated_source
+            if estimated_source > 0 and actual_output > 0:
+                self.output_ratio = self._update(self.output_ratio, actual_output / estimated_source)
+            self.observations += 1
+    
+    def _update(self, current, observed):
+        observed = min(self.MAX_RATIO, max(self.MIN_RATIO, observed))
+        return current + self.SMOOTHING * (observed - current)
+    
+    def get_statistics(self):
+        """獲取校準統計"""
+        return {
+            "input_ratio": round(self.input_ratio, 3),
+            "output_ratio": round(self.output_ratio, 3),
+            "observations": self.observations
+        }
+
+class Chunker:
+    """按每個請求的輸入和輸出令牌預算分塊
+    
+    pack()把連續的段落打包，每包的原文估計令牌數不超過input_budget，
+    估計的譯文令牌數不超過output_budget的OUTPUT_MARGIN；
+    split()把單獨超出預算的段落在句子邊界切成多塊，不在句子中間切分。
+    """
+    
+    # 估計的譯文令牌數只用到輸出預算的這個比例，給估計誤差留餘量
+    OUTPUT_MARGIN = 0.75
+    
+    def __init__(self, estimator=None, input_budget=3000, output_budget=8000, max_segments=40):
+        """初始化分塊器
+        
+        Args:
+            estimator: TokenEstimator實例（None表示新建一個）
+            input_budget: 每個請求的原文估計令牌數上限
+            output_budget: 每個請求的輸出令牌上限（即max_tokens）
+            max_segments: 每包最多包含的段落數
+        """
+        self.estimator = estimator or TokenEstimator()
+        self.input_budget = input_budget
+        self.output_budget = output_budget
+        self.max_segments = max_segments
+        self.split_texts = 0
+    
+    @property
+    def output_limit(self):
+        """打包時估計的譯文令牌數上限"""
+        return int(self.output_budget * self.OUTPUT_MARGIN)
+    
+    def cost(self, text):
+        """(輸入令牌估計, 輸出令牌估計)"""
+        return self.estimator.estimate(text), self.estimator.estimate_output(text)
+    
+    def fits(self, text):
+        """文本單獨作為一個請求是否在預算以內"""
+        input_tokens, output_tokens = self.cost(text)
+        return input_tokens <= self.input_budget and output_tokens <= self.output_limit
+    
+    def pack(self, texts):
+        """把連續的段落打包
+        
+        段落保持原順序且不切分；單獨超出預算的段落自成一包。
+        
+        Args:
+            texts: 段落列表
+        
+        Returns:
+            每包的段落索引列表
+        """
+        packs = []
+        current, input_total, output_total = [], 0, 0
+        for i, text in enumerate(texts):
+            input_tokens, output_tokens = self.cost(text)
+            if current and (input_total + input_tokens > self.input_budget
+                            or output_total + output_tokens > self.output_limit
+                            or len(current) >= self.max_segments):
+                packs.append(current)
+                current, input_total, output_total = [], 0, 0
+            current.append(i)
+            input_total += input_tokens
+            output_total += output_tokens
+        if current:
+            packs.append(current)
+        return packs
+    
+    def split(self, text):
+        """把超出預算的文本在段落和句子邊界切成多塊
+        
+        先按段落切分，段落仍超出預算時再按句子切分；單句超出預算時保持完整
+        （回應被截斷時由續寫補全）。
+        
+        Args:
+            text: 原文
+        
+        Returns:
+            [(塊, 分隔符)]，分隔符是譯文中該塊之後應接的字符（段落之間為換行）
+        """
+        # [(句子或完整段落, 之後是否為段落分隔)]
+        units = []
+        position = 0
+        for match in list(PARAGRAPH_PATTERN.finditer(text)) + [None]:
+            end = match.start() if match else len(text)
+            paragraph = text[position:end]
+            position = match.end() if match else len(text)
+            if not paragraph.strip():
+                continue
+            sentences = [paragraph] if self.fits(paragraph) else split_sentences(paragraph)
+            units.extend((sentence, False) for sentence in sentences)
+            units[-1] = (units[-1][0], True)
+        
+        pieces = []
+        for pack in self.pack([unit for unit, _ in units]):
+            piece = ""
+            for i in pack:
+                sentence, paragraph_end = units[i]
+                piece += sentence.strip() + ("\n\n" if paragraph_end else " ")
+            pieces.append((piece.strip(), "\n\n" if units[pack[-1]][1] else ""))
+        if pieces:
+            pieces[-1] = (pieces[-1][0], "")
+        if len(pieces) > 1:
+            self.split_texts += 1
+        return pieces
+    
+    def get_statistics(self):
+        """獲取分塊統計"""
+        return {
+            "input_budget": self.input_budget,
+            "output_budget": self.output_budget,
+            "split_texts": self.split_texts,
+            **self.estimator.get_statistics()
+        }
@@ -1,43 +1,584 @@
 import os
 import json
 import time
+import asyncio
+import threading
 import anthropic
 import re
 import tqdm
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+from .block_store import BlockStore
+from .block_triage import COPY_THROUGH_LABELS
+from .page_furniture import apply_template_translation
+from .translation_memory import TranslationMemory
+from .rate_limiter import RateLimiter
+from .chunker import Chunker, TokenEstimator
+from .retry_policy import RetryPolicy, FailureLog
 
 # 載入環境變數（API密鑰）
 load_dotenv()
 
+# 提示模板版本，修改任何翻譯提示時遞增，使持久化翻譯記憶中的舊譯文失效
+PROMPT_VERSION = 2
+
+# 固定的翻譯指示放在系統提示中並標記為可緩存，每個請求只有原文部分不同
+TEXT_SYSTEM_PROMPT = """你是專業的學術文獻翻譯，負責把使用者提供的英文學術文本翻譯成繁體中文。請注意專業術語的準確性和學術風格。
+
+請遵循以下翻譯原則：
+
+保持學術風格和專業性
+保留原文的段落結構
+專有名詞、縮寫和數值保持原樣
+翻譯應流暢自然，避免直譯造成的不通順
+A, B, C等編號或列表保持原樣
+直接輸出翻譯結果，不要加上「翻譯結果：」等前綴
+不要使用markdown格式或代碼塊
+不要在輸出中加入任何解釋或說明
+"""
+
+PACKED_SYSTEM_PROMPT = """你是專業的學術文獻翻譯，負責把使用者提供的英文學術文本翻譯成繁體中文。請注意專業術語的準確性和學術風格。
+使用者提供的文本分為多段，每段以 [[編號]] 開頭，各段是獨立的文本塊，可能來自不同頁面。
+
+請遵循以下翻譯原則：
+
+保持學術風格和專業性
+專有名詞、縮寫和數值保持原樣
+翻譯應流暢自然，避免直譯造成的不通順
+逐段翻譯，每段譯文另起一行並以原文相同的 [[編號]] 開頭
+不要合併、拆分、省略或重新排序段落
+不要使用markdown格式或代碼塊
+不要在輸出中加入任何解釋或說明
+"""
+
+FORMULA_SYSTEM_PROMPT = """請將使用者提供的包含數學公式的英文文本翻譯成繁體中文。請注意：
+
+1. 保留所有數學符號、變數名稱和公式結構不變
+2. 只翻譯公式中的英文文字部分（如"where"、"for all"等）
+3. 對於變數的定義說明，請翻譯成中文
+4. 完全保留LaTeX格式和符號
+
+請輸出翻譯結果，不需要任何解釋。
+"""
+
+IMAGE_TEXT_SYSTEM_PROMPT = """請將使用者提供的、從圖像中提取的英文文本翻譯成繁體中文。
+
+請直接輸出翻譯結果，不需要任何解釋。如果文本不完整或無法理解，請盡量根據上下文進行合理翻譯。
+"""
+
+TABLE_SYSTEM_PROMPT = """請將使用者提供的JSON格式的表格數據從英文翻譯成繁體中文。表格結構是一個二維陣列，每個元素是單元格的文本內容。
+
+請遵循以下規則：
+
+直接輸出翻譯後的JSON格式表格數據，保持原始結構不變
+僅翻譯文本內容，不翻譯專有名詞、縮寫和數值
+保持表格標題和專業術語的準確性
+返回完整的JSON陣列，不要有額外文字
+
+請直接返回JSON格式的翻譯結果，不需要任何解釋或說明。
+"""
+
 class ClaudeTranslator:
     """使用Claude API的專業文獻翻譯系統"""
     
-    def __init__(self, api_key=None, model="claude-3-7-sonnet-20250219"):
+    # 打包隊列等待更多段落加入的時間（秒）
+    PACK_DELAY = 0.05
+    # 回應被max_tokens截斷時最多續寫的次數
+    MAX_CONTINUATIONS = 3
+    # 系統提示中術語對照表的最大條目數（對照表屬於可緩存前綴，可以比每請求的術語提示更長）
+    GLOSSARY_LIMIT = 200
+    # 編號段落的標記，如 "[[3]]"
+    SEGMENT_MARKER_PATTERN = re.compile(r'^[ \t]*\[\[(\d+)\]\][ \t]*', re.MULTILINE)
+    
+    def __init__(self, api_key=None, model="claude-3-7-sonnet-20250219", translation_memory=None, max_concurrency=8, rate_limiter=None,
+                 pack_segments=True, pack_token_budget=3000, pack_max_segments=40, base_url=None,
+                 retry_policy=None, failure_log=None, output_token_budget=8000, fuzzy_memory=None):
         """初始化Claude翻譯器
         
         Args:
             api_key: Anthropic API密鑰（如果為None，則從環境變數中獲取）
             model: 使用的Claude模型名稱
+            translation_memory: TranslationMemory實例（None表示只在進程內記憶譯文）
+            max_concurrency: 同時進行中的API請求數上限
+            rate_limiter: RateLimiter實例（None表示使用默認限額新建一個）
+            pack_segments: 是否把多個文本塊打包為編號段落在一個請求中翻譯
+            pack_token_budget: 每個請求的原文估計令牌數上限（打包和長文本分塊都使用）
+            pack_max_segments: 每個打包請求最多包含的段落數
+            base_url: API端點（None表示默認端點；測試時可指向FakeBatchServer）
+            retry_policy: RetryPolicy實例（重試、退避和斷路器，可與其他組件共享）
+            failure_log: FailureLog實例，記錄重試後仍失敗的單元（None表示只記錄在內存中）
+            output_token_budget: 每個文本請求的輸出令牌上限（max_tokens），估計的譯文超出時分塊
+            fuzzy_memory: FuzzyMemory實例，近似重複的段落沿用或參考已有譯文（None表示只做精確匹配）
         """
         # 獲取API密鑰
         self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("需要Anthropic API密鑰")
             
-        # 初始化Claude客戶端
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        # 初始化Claude客戶端（同步客戶端保留給外部直接調用，翻譯請求都通過異步客戶端發出）
+        # 重試由retry_policy統一處理，關閉SDK內置的重試，避免兩層重試疊加
+        self.client = anthropic.Anthropic(api_key=self.api_key, base_url=base_url, max_retries=0)
+        self.async_client = anthropic.AsyncAnthropic(api_key=self.api_key, base_url=base_url, max_retries=0)
         self.model = model
         
+        # 所有異步請求在同一個後台事件循環中執行，同步方法提交協程後等待結果
+        self.max_concurrency = max(1, int(max_concurrency or 1))
+        self._loop = None
+        self._loop_thread = None
+        self._semaphore = None
+        # 進行中的翻譯: {(類型, 原文, 領域): Task}，並發的相同請求共用一個
+        self._pending = {}
+        
+        # 段落打包：並發提交的文本塊（可跨頁）先進入隊列，
+        # 達到令牌預算或等待PACK_DELAY秒後一起發出
+        self.pack_segments = pack_segments
+        # {(領域, 術語庫id): 隊列}
+        self._pack_queues = {}
+        self.packed_requests = 0
+        self.packed_segments = 0
+        self.pack_retried_segments = 0
+        
+        # 按輸入和輸出令牌預算分塊，令牌估計按每次回應的usage校準
+        self.chunker = Chunker(TokenEstimator(), pack_token_budget, output_token_budget, pack_max_segments)
+        # 被max_tokens截斷的回應數和續寫請求數
+        self.truncated_responses = 0
+        self.continuations = 0
+        
         # 請求記錄
         self.request_history = []
         
-        # 計數器，用於限制API調用速率
-        self.request_counter = 0
-        self.last_request_time = time.time()
+        # 按response.usage累計的令牌數
+        self.token_usage = {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0
+        }
+        
+        # 按請求數、輸入和輸出令牌數限速（可與其他使用同一API密鑰的組件共享）
+        self.rate_limiter = rate_limiter or RateLimiter()
         
-        # 術語記憶，保持翻譯一致性
+        # 可重試錯誤的重試和斷路器；重試後仍失敗的單元記錄下來，不寫入任何記憶
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.failure_log = failure_log if failure_log is not None else FailureLog(None)
+        
+        # 術語記憶，保持翻譯一致性（進程內，鍵為(類型, 完整原文, 領域)，與持久化記憶的鍵一致）
         self.term_memory = {}
+        
+        # 持久化翻譯記憶，跨進程、跨運行沿用譯文
+        self.translation_memory = translation_memory
+        
+        # 模糊翻譯記憶，精確匹配未命中時查找近似重複的段落
+        self.fuzzy_memory = fuzzy_memory
+        
+        # 分流為copy/reference、未調用API直接保留原文的塊數
+        self.copied_blocks = 0
+        
+        # 頁眉頁腳翻譯: {類的鍵: (原文, 翻譯Task)}，同一類只翻譯一次
+        self.furniture_memory = {}
+        self.furniture_reused = 0
+    
+    def _run(self, coro):
+        """在後台事件循環中運行協程並等待結果（同步接口使用）"""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, name="translator-loop", daemon=True)
+            self._loop_thread.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def run_concurrently(self, coroutines, desc: Optional[str] = None) -> List[Any]:
+        """並發執行一組翻譯協程，結果按傳入順序返回
+        
+        同時進行中的API請求數由max_concurrency限制，與協程數量無關。
+        
+        Args:
+            coroutines: 翻譯協程列表（如atranslate_document_section(...)的返回值）
+            desc: 進度條說明（None表示不顯示進度條）
+            
+        Returns:
+            與coroutines順序一致的結果列表
+        """
+        return self._run(self._gather(coroutines, desc))
+    
+    async def _gather(self, coroutines, desc=None):
+        """等待所有協程完成，並更新進度條"""
+        coroutines = list(coroutines)
+        if desc is None:
+            return await asyncio.gather(*coroutines)
+        
+        progress = tqdm.tqdm(total=len(coroutines), desc=desc)
+        
+        async def tracked(coro):
+            result = await coro
+            progress.update(1)
+            return result
+        
+        try:
+            return await asyncio.gather(*(tracked(coro) for coro in coroutines))
+        finally:
+            progress.close()
+    
+    async def _create_message(self, prompt: str, max_tokens: int, system: Optional[List[Dict]] = None,
+                              source: Optional[str] = None, prefill: Optional[str] = None):
+        """發出一個API請求，受並發上限和速率限制約束，可重試的錯誤按retry_policy重試
+        
+        Args:
+            prompt: 使用者提示（每個請求不同的部分）
+            max_tokens: 輸出令牌上限
+            system: 系統提示內容塊（固定指示和術語表，標記為可緩存）
+            source: 請求中的原文，用於估計和校準輸出令牌數（None表示按使用者提示估計）
+            prefill: 助手回應的開頭（續寫被截斷的回應時為已取得的部分）
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        estimator = self.chunker.estimator
+        raw_input = RateLimiter.estimate_tokens(prompt) + RateLimiter.estimate_tokens(prefill)
+        if system:
+            raw_input += sum(RateLimiter.estimate_tokens(block["text"]) for block in system)
+        input_tokens = int(raw_input * estimator.input_ratio) + 1
+        # 輸出令牌按校準後的譯文/原文比例估計，不超過max_tokens
+        output_tokens = min(max_tokens, estimator.estimate_output(source if source is not None else prompt))
+        
+        messages = [{"role": "user", "content": prompt}]
+        if prefill:
+            messages.append({"role": "assistant", "content": prefill})
+        kwargs = {"system": system} if system else {}
+        
+        async def attempt():
+            # 每次嘗試都是一個請求，分別計入限速
+            await self.rate_limiter.aacquire(input_tokens, output_tokens)
+            try:
+                response = await self.async_client.messages.create(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    messages=messages,
+                    **kwargs
+                )
+            except Exception:
+                self.rate_limiter.reconcile(input_tokens, output_tokens)
+                raise
+            usage = getattr(response, "usage", None)
+            self.rate_limiter.reconcile(input_tokens, output_tokens, usage)
+            self.record_usage(usage)
+            # 截斷或續寫的回應不代表完整譯文的長度，只校準輸入係數
+            complete = source is not None and not prefill and getattr(response, "stop_reason", None) != "max_tokens"
+            estimator.observe(raw_input, RateLimiter.estimate_tokens(source) if complete else 0, usage)
+            return response
+        
+        async with self._semaphore:
+            return await self.retry_policy.acall(attempt)
+    
+    async def _complete_truncated(self, response, prompt: str, system: Optional[List[Dict]], max_tokens: int):
+        """取得回應文本，被max_tokens截斷時以已取得的部分為開頭續寫
+        
+        Args:
+            response: _create_message的回應
+            prompt: 原請求的使用者提示
+            system: 原請求的系統提示
+            max_tokens: 每次續寫的輸出令牌上限
+            
+        Returns:
+            (回應文本, 是否完整)；續寫MAX_CONTINUATIONS次仍被截斷時不完整
+        """
+        text = response.content[0].text
+        if getattr(response, "stop_reason", None) != "max_tokens":
+            return text, True
+        self.truncated_responses += 1
+        for _ in range(self.MAX_CONTINUATIONS):
+            # 助手回應的開頭不能以空白結尾
+            text = text.rstrip()
+            self.continuations += 1
+            response = await self._create_message(prompt, max_tokens=max_tokens, system=system, prefill=text)
+            text += response.content[0].text
+            if getattr(response, "stop_reason", None) != "max_tokens":
+                return text, True
+        return text, False
+    
+    def record_usage(self, usage):
+        """累計response.usage中的令牌數（包括prompt caching的寫入和讀取）
+        
+        Args:
+            usage: response.usage（None時忽略）
+        """
+        if usage is None:
+            return
+        for field in self.token_usage:
+            self.token_usage[field] += getattr(usage, field, 0) or 0
+    
+    async def _translate_once(self, kind: str, source: str, domain: Optional[str], translate):
+        """查找記憶，未命中時調用translate()；並發的相同請求只發出一次
+        
+        Args:
+            kind: 調用類型（text、formula、table、image）
+            source: 完整原文
+            domain: 領域
+            translate: 無參數函數，返回實際調用API的協程
+            
+        Returns:
+            譯文
+        """
+        cached = self._recall(kind, source, domain)
+        if cached is not None:
+            return cached
+        
+        key = (kind, source, domain)
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(translate())
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await task
+    
+    async def atranslate_segment(self, 
+                                 text: str, 
+                                 terminology_db: Optional[Dict] = None,
+                                 domain: Optional[str] = None) -> str:
+        """翻譯一個文本塊，與同時提交的其他文本塊打包成一個請求
+        
+        與atranslate_text共用翻譯記憶；未啟用打包或文本單獨超出令牌預算時等同於atranslate_text。
+        
+        Args:
+            text: 要翻譯的英文文本
+            terminology_db: 專業術語資料庫（可選）
+            domain: 文本所屬領域（可選）
+            
+        Returns:
+            翻譯後的中文文本
+        """
+        if not self.pack_segments or not self.chunker.fits(text):
+            return await self.atranslate_text(text, terminology_db, domain)
+        if not text or text.strip() == "":
+            return ""
+        
+        return await self._translate_once(
+            "text", text, domain, lambda: self._atranslate_fuzzy(text, terminology_db, domain, self._enqueue_segment)
+        )
+    
+    async def _enqueue_segment(self, text, terminology_db, domain) -> str:
+        """把段落加入打包隊列並等待譯文"""
+        loop = asyncio.get_running_loop()
+        key = (domain, id(terminology_db))
+        chunker = self.chunker
+        tokens, output_tokens = chunker.cost(text)
+        
+        queue = self._pack_queues.get(key)
+        if queue is not None and (queue["tokens"] + tokens > chunker.input_budget
+                                  or queue["output_tokens"] + output_tokens > chunker.output_limit):
+            self._flush_pack(key)
+            queue = None
+        if queue is None:
+            queue = {"terminology_db": terminology_db, "domain": domain, "segments": [],
+                     "tokens": 0, "output_tokens": 0, "handle": None}
+            self._pack_queues[key] = queue
+        
+        future = loop.create_future()
+        queue["segments"].append((text, future))
+        queue["tokens"] += tokens
+        queue["output_tokens"] += output_tokens
+        
+        if (queue["tokens"] >= chunker.input_budget or queue["output_tokens"] >= chunker.output_limit
+                or len(queue["segments"]) >= chunker.max_segments):
+            self._flush_pack(key)
+        elif queue["handle"] is None:
+            queue["handle"] = loop.call_later(self.PACK_DELAY, self._flush_pack, key)
+        
+        return await future
+    
+    def _flush_pack(self, key):
+        """發出打包隊列中的段落"""
+        queue = self._pack_queues.pop(key, None)
+        if queue is None:
+            return
+        if queue["handle"] is not None:
+            queue["handle"].cancel()
+        asyncio.ensure_future(self._resolve_pack(queue["segments"], queue["terminology_db"], queue["domain"]))
+    
+    async def _resolve_pack(self, segments, terminology_db, domain):
+        """翻譯一個打包隊列，把譯文交給等待各段落的Future"""
+        try:
+            translations = await self._atranslate_packed([text for text, _ in segments], terminology_db, domain)
+        except Exception as e:
+            for _, future in segments:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), translation in zip(segments, translations):
+            if not future.done():
+                future.set_result(translation)
+    
+    async def _atranslate_packed(self, texts, terminology_db, domain, retry=True) -> List[str]:
+        """在一個請求中翻譯多個編號段落
+        
+        模型按 "[[編號]] 譯文" 的格式逐段返回，按編號精確放回各段落。
+        編號缺失、重複或譯文為空的段落重新打包翻譯一次，仍失敗的逐段單獨翻譯。
+        回應被max_tokens截斷時，最後一段和之後的段落按令牌預算重新分包發出。
+        
+        Args:
+            texts: 段落列表
+            terminology_db: 專業術語資料庫
+            domain: 文本所屬領域
+            retry: 失敗的段落是否重新打包（False時逐段單獨翻譯）
+            
+        Returns:
+            與texts對應的譯文列表
+        """
+        if len(texts) == 1:
+            return [await self._atranslate_text(texts[0], terminology_db, domain)]
+        
+        system, prompt = self._create_packed_prompt(texts, terminology_db, domain)
+        try:
+            response = await self._create_message(prompt, max_tokens=self.chunker.output_budget, system=system,
+                                                  source="\n\n".join(texts))
+        except Exception as e:
+            # 已按retry_policy重試過，不再逐段重新請求；記錄失敗，譯文留空且不寫入記憶
+            print(f"打包翻譯時出錯: {str(e)}")
+            for text in texts:
+                self._record_failure("text", text, domain, e)
+            return [""] * len(texts)
+        segments = self._parse_packed_response(response.content[0].text, len(texts))
+        truncated = getattr(response, "stop_reason", None) == "max_tokens"
+        if truncated:
+            # 最後返回的一段可能只譯了一半，不採用
+            self.truncated_responses += 1
+            if segments:
+                del segments[max(segments)]
+        
+        translations = [segments.get(i + 1) for i in range(len(texts))]
+        for text, translation in zip(texts, translations):
+            if translation:
+                self._remember("text", text, translation, domain)
+        
+        self.packed_requests += 1
+        self.packed_segments += len(texts)
+        self.request_history.append({
+            "timestamp": time.time(),
+            "type": "packed",
+            "segments": len(texts),
+            "input_length": sum(len(text) for text in texts),
+            "output_length": sum(len(translation) for translation in translations if translation),
+            "domain": domain,
+            "model": self.model
+        })
+        
+        # 只重新翻譯未能對應的段落
+        failed = [i for i, translation in enumerate(translations) if not translation]
+        if failed and truncated:
+            print(f"打包翻譯的回應被截斷，重新發出其餘 {len(failed)}/{len(texts)} 段")
+            failed_texts = [texts[i] for i in failed]
+            packs = self.chunker.pack(failed_texts)
+            if len(failed) == len(texts) and len(packs) == 1:
+                # 沒有一段完整返回，對半拆分以保證每次重新發出的請求都更小
+                half = len(failed_texts) // 2
+                packs = [list(range(half)), list(range(half, len(failed_texts)))]
+            results = await asyncio.gather(*(
+                self._atranslate_packed([failed_texts[j] for j in pack], terminology_db, domain, retry)
+                for pack in packs
+            ))
+            for i, translation in zip(failed, [translation for result in results for translation in result]):
+                translations[i] = translation
+        elif failed:
+            print(f"打包翻譯中 {len(failed)}/{len(texts)} 段未能對應，重新翻譯這些段落")
+            self.pack_retried_segments += len(failed)
+            failed_texts = [texts[i] for i in failed]
+            if retry:
+                retried = await self._atranslate_packed(failed_texts, terminology_db, domain, retry=False)
+            else:
+                retried = await asyncio.gather(*(
+                    self._atranslate_text(text, terminology_db, domain) for text in failed_texts
+                ))
+            for i, translation in zip(failed, retried):
+                translations[i] = translation
+        
+        return translations
+    
+    def _parse_packed_response(self, response_text: str, count: int) -> Dict[int, str]:
+        """解析編號段落格式的回應
+        
+        Args:
+            response_text: 模型的回應
+            count: 請求中的段落數
+            
+        Returns:
+            {編號: 譯文}，只包含編號在範圍內且只出現一次的段落
+        """
+        parts = self.SEGMENT_MARKER_PATTERN.split(response_text)
+        segments = {}
+        duplicated = set()
+        # parts = [前綴, 編號1, 譯文1, 編號2, 譯文2, ...]
+        for number, body in zip(parts[1::2], parts[2::2]):
+            number = int(number)
+            if not 1 <= number <= count:
+                continue
+            if number in segments:
+                duplicated.add(number)
+            segments[number] = self._clean_translation(body)
+        for number in duplicated:
+            del segments[number]
+        return segments
+    
+    def create_batch_request(self, kind: str, sources: List[str],
+                             terminology_db: Optional[Dict] = None,
+                             domain: Optional[str] = None):
+        """為Message Batches生成一個請求的提示（與即時翻譯使用相同的提示）
+        
+        Args:
+            kind: 調用類型（text、formula、table、image）
+            sources: 原文列表；text可包含多段（打包為編號段落），其他類型只有一個
+            terminology_db: 專業術語資料庫
+            domain: 文本所屬領域
+            
+        Returns:
+            (系統提示, 使用者提示, max_tokens)
+        """
+        if kind == "text":
+            if len(sources) == 1:
+                return (*self._create_translation_prompt(sources[0], terminology_db, domain), self.chunker.output_budget)
+            return (*self._create_packed_prompt(sources, terminology_db, domain), self.chunker.output_budget)
+        if kind == "formula":
+            return (*self._create_formula_prompt(sources[0]), 1000)
+        if kind == "image":
+            return (*self._create_image_text_prompt(sources[0]), 1000)
+        if kind == "table":
+            return (*self._create_table_prompt(sources[0]), 2000)
+        raise ValueError(f"不支持的調用類型: {kind}")
+    
+    def store_batch_response(self, kind: str, sources: List[str], response_text: str,
+                             domain: Optional[str] = None, truncated: bool = False) -> int:
+        """把Message Batches返回的譯文寫入術語記憶和翻譯記憶
+        
+        之後的即時翻譯直接命中記憶；未能解析的原文不寫入，仍按即時翻譯處理。
+        
+        Args:
+            kind: 調用類型
+            sources: create_batch_request使用的原文列表
+            response_text: 模型的回應
+            domain: 文本所屬領域
+            truncated: 回應是否被max_tokens截斷（截斷的譯文不寫入，打包回應只丟棄最後一段）
+            
+        Returns:
+            寫入的譯文數
+        """
+        if truncated:
+            self.truncated_responses += 1
+        if kind == "text" and len(sources) > 1:
+            segments = self._parse_packed_response(response_text, len(sources))
+            if truncated and segments:
+                del segments[max(segments)]
+            translations = [segments.get(i + 1) for i in range(len(sources))]
+        elif truncated:
+            translations = [None]
+        elif kind == "table":
+            translations = [self._parse_table_response(response_text)]
+        else:
+            translations = [self._clean_translation(response_text)]
+        
+        stored = 0
+        for source, translation in zip(sources, translations):
+            if translation:
+                # 公式、圖像和表格的記憶不區分領域
+                self._remember(kind, source, translation, domain if kind == "text" else None)
+                stored += 1
+        return stored
     
     def translate_text(self, 
                       text: str, 
@@ -53,39 +594,67 @@ class ClaudeTranslator:
         Returns:
             翻譯後的中文文本
         """
+        return self._run(self.atranslate_text(text, terminology_db, domain))
+    
+    async def atranslate_text(self, 
+                              text: str, 
+                              terminology_db: Optional[Dict] = None,
+                              domain: Optional[str] = None) -> str:
+        """translate_text的異步版本"""
         # 檢查文本是否為空
         if not text or text.strip() == "":
             return ""
-            
-        # 檢查是否已翻譯過相同或極為相似的文本
-        # 使用文本的前50個字符作為指紋
-        text_fingerprint = text[:50] if len(text) > 50 else text
         
-        if text_fingerprint in self.term_memory:
-            return self.term_memory[text_fingerprint]
+        # 檢查是否已翻譯過完全相同的文本
+        return await self._translate_once(
+            "text", text, domain, lambda: self._atranslate_fuzzy(text, terminology_db, domain, self._atranslate_text)
+        )
+    
+    async def _atranslate_fuzzy(self, text, terminology_db, domain, translate) -> str:
+        """精確匹配未命中時查找模糊翻譯記憶
         
-        # 限制API調用速率
-        self._rate_limit()
+        近似重複且可直接沿用時不調用API；相似度較低時帶著參考譯文單獨翻譯；
+        沒有相似段落時調用translate(text, terminology_db, domain)。
+        沿用的譯文不是這段原文的翻譯，不寫入任何記憶，下次仍按模糊匹配處理。
+        """
+        match = self.fuzzy_memory.match(text, domain) if self.fuzzy_memory is not None else None
+        if match is None:
+            return await translate(text, terminology_db, domain)
+        if match.reusable:
+            return match.translation
+        return await self._atranslate_text(text, terminology_db, domain, reference=match)
+    
+    async def _atranslate_text(self, text, terminology_db, domain, reference=None) -> str:
+        """調用API翻譯普通文本
+        
+        超出令牌預算的文本在段落和句子邊界分塊翻譯後合併（各塊分別查找模糊翻譯記憶）；
+        回應被max_tokens截斷時續寫餘下部分。reference是模糊翻譯記憶中的相似段落（FuzzyMatch）。
+        """
+        if not self.chunker.fits(text):
+            pieces = self.chunker.split(text)
+            if len(pieces) > 1:
+                return await self._atranslate_pieces(text, pieces, terminology_db, domain)
         
         # 準備提示
-        prompt = self._create_translation_prompt(text, terminology_db, domain)
+        system, prompt = self._create_translation_prompt(text, terminology_db, domain, reference)
         
         # 調用Claude API
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            max_tokens = self.chunker.output_budget
+            response = await self._create_message(prompt, max_tokens=max_tokens, system=system, source=text)
             
-            # 提取翻譯結果
-            translated_text = response.content[0].text
+            # 提取翻譯結果，被截斷時續寫
+            translated_text, complete = await self._complete_truncated(response, prompt, system, max_tokens)
             
             # 清理翻譯結果，移除可能的格式化元素
             translated_text = self._clean_translation(translated_text)
             
+            if not complete:
+                # 不完整的譯文可以先用於輸出，但不寫入記憶，下次重新翻譯
+                print(f"譯文續寫 {self.MAX_CONTINUATIONS} 次後仍被截斷")
+                self._record_failure("text", text, domain, "譯文被max_tokens截斷")
+                return translated_text
+            
             # 記錄請求
             self.request_history.append({
                 "timestamp": time.time(),
@@ -95,15 +664,41 @@ class ClaudeTranslator:
                 "model": self.model
             })
             
-            # 儲存到術語記憶
-            self.term_memory[text_fingerprint] = translated_text
+            # 儲存到術語記憶和翻譯記憶
+            self._remember("text", text, translated_text, domain)
             
             return translated_text
             
         except Exception as e:
             print(f"翻譯時出錯: {str(e)}")
+            self._record_failure("text", text, domain, e)
             return ""
     
+    async def _atranslate_pieces(self, text, pieces, terminology_db, domain) -> str:
+        """分塊翻譯超出令牌預算的文本，譯文按原文的段落結構合併
+        
+        各塊作為獨立文本翻譯（有各自的翻譯記憶），全部成功時整段寫入記憶。
+        
+        Args:
+            text: 完整原文
+            pieces: Chunker.split的結果 [(塊, 分隔符)]
+            terminology_db: 專業術語資料庫
+            domain: 文本所屬領域
+            
+        Returns:
+            合併後的譯文
+        """
+        translations = await asyncio.gather(*(
+            self.atranslate_text(piece, terminology_db, domain) for piece, _ in pieces
+        ))
+        translated_text = "".join(
+            translation + separator for translation, (_, separator) in zip(translations, pieces)
+        ).strip()
+        # 失敗的塊已記錄在失敗記錄中，整段不寫入記憶
+        if all(translations):
+            self._remember("text", text, translated_text, domain)
+        return translated_text
+    
     def _clean_translation(self, text: str) -> str:
         """清理翻譯結果，移除可能的格式化元素"""
         # 移除可能的前綴說明
@@ -127,41 +722,23 @@ class ClaudeTranslator:
         Returns:
             翻譯後的公式
         """
+        return self._run(self.atranslate_formula(formula))
+    
+    async def atranslate_formula(self, formula: str) -> str:
+        """translate_formula的異步版本"""
         # 檢查是否為空
         if not formula or formula.strip() == "":
             return ""
         
         # 檢查快取
-        if formula in self.term_memory:
-            return self.term_memory[formula]
-        
-        # 限制API調用速率
-        self._rate_limit()
-        
-        # 創建專門用於公式翻譯的提示
-        prompt = f"""
-請將以下包含數學公式的英文文本翻譯成繁體中文。請注意：
-
-1. 保留所有數學符號、變數名稱和公式結構不變
-2. 只翻譯公式中的英文文字部分（如"where"、"for all"等）
-3. 對於變數的定義說明，請翻譯成中文
-4. 完全保留LaTeX格式和符號
-
-以下是需要翻譯的公式文本：
-
-{formula}
-
-請輸出翻譯結果，不需要任何解釋。
-"""
+        return await self._translate_once("formula", formula, None, lambda: self._atranslate_formula(formula))
+    
+    async def _atranslate_formula(self, formula: str) -> str:
+        """調用API翻譯數學公式"""
+        system, prompt = self._create_formula_prompt(formula)
         
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=1000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            response = await self._create_message(prompt, max_tokens=1000, system=system)
             
             # 提取翻譯結果
             translated_formula = response.content[0].text
@@ -178,15 +755,60 @@ class ClaudeTranslator:
                 "model": self.model
             })
             
-            # 儲存到術語記憶
-            self.term_memory[formula] = translated_formula
+            # 儲存到術語記憶和翻譯記憶
+            self._remember("formula", formula, translated_formula)
             
             return translated_formula
             
         except Exception as e:
             print(f"翻譯公式時出錯: {str(e)}")
+            self._record_failure("formula", formula, None, e)
             return formula  # 出錯時返回原始公式
     
+    def translate_furniture(self,
+                            furniture_key: str,
+                            text: str,
+                            terminology_db: Optional[Dict] = None,
+                            domain: Optional[str] = None) -> str:
+        """翻譯頁眉、頁腳等跨頁重複的文本，同一類只調用一次API
+        
+        Args:
+            furniture_key: PageFurnitureDetector標記的類的鍵
+            text: 本塊的原文
+            terminology_db: 專業術語資料庫（可選）
+            domain: 文本所屬領域（可選）
+            
+        Returns:
+            翻譯後的中文文本
+        """
+        return self._run(self.atranslate_furniture(furniture_key, text, terminology_db, domain))
+    
+    async def atranslate_furniture(self,
+                                   furniture_key: str,
+                                   text: str,
+                                   terminology_db: Optional[Dict] = None,
+                                   domain: Optional[str] = None) -> str:
+        """translate_furniture的異步版本（並發的同類塊等待第一個塊的翻譯）
+        
+        譯文中的數字無法逐一對應到本塊的數字時（如模型調整了數字順序），單獨翻譯本塊。
+        """
+        if furniture_key in self.furniture_memory:
+            source, task = self.furniture_memory[furniture_key]
+            translated = apply_template_translation(source, await task, text)
+            # 第一個塊翻譯失敗（空譯文）時同樣單獨翻譯本塊
+            if translated:
+                self.furniture_reused += 1
+                return translated
+            return await self.atranslate_text(text, terminology_db, domain)
+        
+        task = asyncio.ensure_future(self.atranslate_text(text, terminology_db, domain))
+        self.furniture_memory[furniture_key] = (text, task)
+        translated = await task
+        if not translated:
+            # 翻譯失敗時不沿用空結果，下一個同類塊重新翻譯
+            self.furniture_memory.pop(furniture_key, None)
+        return translated
+    
     def translate_image_text(self, text_in_image: str) -> str:
         """翻譯圖像中的文字
         
@@ -196,34 +818,23 @@ class ClaudeTranslator:
         Returns:
             翻譯後的中文文本
         """
+        return self._run(self.atranslate_image_text(text_in_image))
+    
+    async def atranslate_image_text(self, text_in_image: str) -> str:
+        """translate_image_text的異步版本"""
         # 檢查是否為空
         if not text_in_image or text_in_image.strip() == "":
             return ""
         
         # 檢查快取
-        if text_in_image in self.term_memory:
-            return self.term_memory[text_in_image]
-        
-        # 限制API調用速率
-        self._rate_limit()
-        
-        # 創建專門用於圖像文字翻譯的提示
-        prompt = f"""
-請將以下從圖像中提取的英文文本翻譯成繁體中文：
-
-{text_in_image}
-
-請直接輸出翻譯結果，不需要任何解釋。如果文本不完整或無法理解，請盡量根據上下文進行合理翻譯。
-"""
+        return await self._translate_once("image", text_in_image, None, lambda: self._atranslate_image_text(text_in_image))
+    
+    async def _atranslate_image_text(self, text_in_image: str) -> str:
+        """調用API翻譯圖像中的文字"""
+        system, prompt = self._create_image_text_prompt(text_in_image)
         
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=1000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            response = await self._create_message(prompt, max_tokens=1000, system=system)
             
             # 提取翻譯結果
             translated_text = response.content[0].text
@@ -240,13 +851,14 @@ class ClaudeTranslator:
                 "model": self.model
             })
             
-            # 儲存到術語記憶
-            self.term_memory[text_in_image] = translated_text
+            # 儲存到術語記憶和翻譯記憶
+            self._remember("image", text_in_image, translated_text)
             
             return translated_text
             
         except Exception as e:
             print(f"翻譯圖像文字時出錯: {str(e)}")
+            self._record_failure("image", text_in_image, None, e)
             return text_in_image  # 出錯時返回原始文本
     
     def translate_table(self, table_data: List[List[str]]) -> List[List[str]]:
@@ -258,193 +870,288 @@ class ClaudeTranslator:
         Returns:
             翻譯後的表格數據
         """
+        return self._run(self.atranslate_table(table_data))
+    
+    async def atranslate_table(self, table_data: List[List[str]]) -> List[List[str]]:
+        """translate_table的異步版本"""
         # 檢查是否為空
         if not table_data or len(table_data) == 0:
             return []
         
-        # 創建表格指紋
-        table_fingerprint = str(table_data[:2])  # 使用前兩行作為指紋
-        if table_fingerprint in self.term_memory:
-            return self.term_memory[table_fingerprint]
-        
-        # 限制API調用速率
-        self._rate_limit()
-        
-        # 將表格轉換為JSON字符串
+        # 以完整表格內容作為鍵
         table_json = json.dumps(table_data, ensure_ascii=False)
-        
-        # 創建專門用於表格翻譯的提示
-        prompt = f"""
-請將以下JSON格式的表格數據從英文翻譯成繁體中文。表格結構是一個二維陣列，每個元素是單元格的文本內容：
-
-```json
-{table_json}
-請遵循以下規則：
-
-直接輸出翻譯後的JSON格式表格數據，保持原始結構不變
-僅翻譯文本內容，不翻譯專有名詞、縮寫和數值
-保持表格標題和專業術語的準確性
-返回完整的JSON陣列，不要有額外文字
-
-請直接返回JSON格式的翻譯結果，不需要任何解釋或說明。
-"""
+        return await self._translate_once("table", table_json, None, lambda: self._atranslate_table(table_data, table_json))
+    
+    async def _atranslate_table(self, table_data: List[List[str]], table_json: str) -> List[List[str]]:
+        """調用API翻譯表格數據"""
+        system, prompt = self._create_table_prompt(table_json)
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=2000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            response = await self._create_message(prompt, max_tokens=2000, system=system)
             
-            # 提取翻譯結果
-            result_text = response.content[0].text
+            translated_table = self._parse_table_response(response.content[0].text)
+            if translated_table is None:
+                self._record_failure("table", table_json, None, "翻譯後的表格無法解析")
+                return table_data
             
-            # 提取JSON部分
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', result_text)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # 如果沒有找到JSON標記，嘗試直接解析整個響應
-                json_str = result_text.strip()
+            # 記錄請求
+            self.request_history.append({
+                "timestamp": time.time(),
+                "input_cells": sum(len(row) for row in table_data),
+                "output_cells": sum(len(row) for row in translated_table),
+                "type": "table",
+                "model": self.model
+            })
             
-            # 清理JSON字符串
-            json_str = re.sub(r'^[\s\n]*', '', json_str)  # 移除開頭的空白和換行
-            json_str = re.sub(r'[\s\n]*$', '', json_str)  # 移除結尾的空白和換行
+            # 儲存到術語記憶和翻譯記憶
+            self._remember("table", table_json, translated_table)
             
-            # 解析JSON
-            try:
-                translated_table = json.loads(json_str)
-                
-                # 驗證表格結構
-                if not isinstance(translated_table, list) or not all(isinstance(row, list) for row in translated_table):
-                    raise ValueError("翻譯後的表格結構無效")
-                
-                # 記錄請求
-                self.request_history.append({
-                    "timestamp": time.time(),
-                    "input_cells": sum(len(row) for row in table_data),
-                    "output_cells": sum(len(row) for row in translated_table),
-                    "type": "table",
-                    "model": self.model
-                })
-                
-                # 儲存到術語記憶
-                self.term_memory[table_fingerprint] = translated_table
-                
-                return translated_table
-            except json.JSONDecodeError as e:
-                print(f"無法解析翻譯後的表格JSON: {e}")
-                # 嘗試修復JSON
-                try:
-                    # 嘗試修復常見的JSON問題
-                    fixed_json = re.sub(r"'", '"', json_str)  # 將單引號替換為雙引號
-                    fixed_json = re.sub(r",\s*]", "]", fixed_json)  # 移除尾部逗號
-                    fixed_json = re.sub(r",\s*}", "}", fixed_json)  # 移除尾部逗號
-                    translated_table = json.loads(fixed_json)
-                    return translated_table
-                except:
-                    return table_data
+            return translated_table
             
         except Exception as e:
             print(f"翻譯表格時出錯: {str(e)}")
+            self._record_failure("table", table_json, None, e)
             return table_data  # 出錯時返回原始表格
-
+    
+    def _create_formula_prompt(self, formula: str):
+        """創建公式翻譯的提示
+        
+        Returns:
+            (系統提示, 使用者提示)
+        """
+        return self._cached_system(FORMULA_SYSTEM_PROMPT), formula
+    
+    def _create_image_text_prompt(self, text_in_image: str):
+        """創建圖像文字翻譯的提示
+        
+        Returns:
+            (系統提示, 使用者提示)
+        """
+        return self._cached_system(IMAGE_TEXT_SYSTEM_PROMPT), text_in_image
+    
+    def _create_table_prompt(self, table_json: str):
+        """創建表格翻譯的提示
+        
+        Returns:
+            (系統提示, 使用者提示)
+        """
+        return self._cached_system(TABLE_SYSTEM_PROMPT), f"```json\n{table_json}\n```"
+    
+    def _parse_table_response(self, result_text: str) -> Optional[List[List[str]]]:
+        """從回應中解析翻譯後的表格
+        
+        Args:
+            result_text: 模型的回應
+            
+        Returns:
+            二維列表，無法解析或結構無效時返回None
+        """
+        # 提取JSON部分
+        json_match = re.search(r'```json\s*([\s\S]*?)\s*```', result_text)
+        if json_match:
+            json_str = json_match.group(1)
+        else:
+            # 如果沒有找到JSON標記，嘗試直接解析整個響應
+            json_str = result_text.strip()
+        
+        # 清理JSON字符串
+        json_str = re.sub(r'^[\s\n]*', '', json_str)  # 移除開頭的空白和換行
+        json_str = re.sub(r'[\s\n]*$', '', json_str)  # 移除結尾的空白和換行
+        
+        # 解析JSON
+        try:
+            translated_table = json.loads(json_str)
+        except json.JSONDecodeError as e:
+            print(f"無法解析翻譯後的表格JSON: {e}")
+            # 嘗試修復常見的JSON問題
+            try:
+                fixed_json = re.sub(r"'", '"', json_str)  # 將單引號替換為雙引號
+                fixed_json = re.sub(r",\s*]", "]", fixed_json)  # 移除尾部逗號
+                fixed_json = re.sub(r",\s*}", "}", fixed_json)  # 移除尾部逗號
+                translated_table = json.loads(fixed_json)
+            except ValueError:
+                return None
+        
+        # 驗證表格結構
+        if not isinstance(translated_table, list) or not all(isinstance(row, list) for row in translated_table):
+            print("翻譯後的表格結構無效")
+            return None
+        return translated_table
+    
+    def _recall(self, kind: str, source: str, domain: Optional[str] = None):
+        """按完整原文查找已有譯文：先查進程內記憶，再查持久化翻譯記憶
+        
+        Args:
+            kind: 調用類型（text、formula、table、image）
+            source: 完整原文（表格為JSON字符串）
+            domain: 領域
+            
+        Returns:
+            譯文，未找到時返回None
+        """
+        memory_key = (kind, source, domain)
+        if memory_key in self.term_memory:
+            return self.term_memory[memory_key]
+        if self.translation_memory is None:
+            return None
+        
+        key = TranslationMemory.make_key(kind, source, self.model, domain, PROMPT_VERSION)
+        translation = self.translation_memory.get(key)
+        if translation is not None:
+            self.term_memory[memory_key] = translation
+        return translation
+    
+    def _remember(self, kind: str, source: str, translation, domain: Optional[str] = None):
+        """把譯文寫入進程內記憶、持久化翻譯記憶和模糊翻譯記憶"""
+        self.term_memory[(kind, source, domain)] = translation
+        if kind == "text" and self.fuzzy_memory is not None:
+            self.fuzzy_memory.add(source, translation, domain)
+        if self.translation_memory is not None:
+            key = TranslationMemory.make_key(kind, source, self.model, domain, PROMPT_VERSION)
+            self.translation_memory.put(key, kind, source, translation, self.model, domain, PROMPT_VERSION)
+        if len(self.failure_log):
+            self.failure_log.remove(kind, source, domain)
+    
+    def _record_failure(self, kind: str, source: str, domain: Optional[str], error):
+        """記錄重試後仍失敗的單元（不寫入任何記憶，下次翻譯時重新請求）"""
+        self.failure_log.add(kind, source, domain, error)
+    
+    def retry_failures(self, terminology_db: Optional[Dict] = None) -> int:
+        """只重新翻譯失敗記錄中的單元
+        
+        成功的單元寫入翻譯記憶並從失敗記錄中刪除，之後重新處理受影響的文檔時直接命中記憶。
+        
+        Args:
+            terminology_db: 專業術語資料庫
+            
+        Returns:
+            仍然失敗的單元數
+        """
+        coroutines = []
+        for entry in list(self.failure_log.entries):
+            kind, source, domain = entry["kind"], entry["source"], entry["domain"]
+            if kind == "text":
+                coroutines.append(self.atranslate_text(source, terminology_db, domain))
+            elif kind == "formula":
+                coroutines.append(self.atranslate_formula(source))
+            elif kind == "image":
+                coroutines.append(self.atranslate_image_text(source))
+            elif kind == "table":
+                coroutines.append(self.atranslate_table(json.loads(source)))
+        if coroutines:
+            self.run_concurrently(coroutines, desc="重新翻譯失敗的單元")
+        return len(self.failure_log)
+    
+    def _cached_system(self, text: str) -> List[Dict]:
+        """把系統提示包裝為帶prompt caching標記的內容塊
+        
+        相同的系統提示在緩存有效期內只在第一次請求時計入完整輸入令牌，
+        之後按緩存讀取計費；短於模型最小緩存長度的提示不會被緩存，但不影響請求。
+        """
+        return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+    
+    def _glossary_prompt(self, 
+                         terminology_db: Optional[Dict] = None,
+                         domain: Optional[str] = None) -> str:
+        """生成系統提示中的專業術語對照表
+        
+        同一文檔（同一領域）的所有請求使用相同的對照表，作為可緩存前綴的一部分，
+        因此可以比放在每個請求中時包含更多術語。
+        
+        Args:
+            terminology_db: 專業術語資料庫
+            domain: 文本所屬領域
+            
+        Returns:
+            術語對照表文本（沒有術語時為空字符串）
+        """
+        if not (terminology_db and domain and domain in terminology_db):
+            return ""
+        
+        section = "\n翻譯時，請使用以下專業術語對照表（英文 -> 中文）：\n\n"
+        for term in terminology_db[domain]['terms'][:self.GLOSSARY_LIMIT]:
+            english = term['english']
+            chinese = term['chinese']
+            section += f"- {english} -> {chinese}\n"
+        section += "\n請確保使用上述術語的標準翻譯。\n"
+        return section
+    
+    def _consistent_terms_prompt(self, text: str, domain: Optional[str] = None) -> str:
+        """生成使用者提示中與本段原文相關的已翻譯術語（隨原文變化，不放入緩存前綴）
+        
+        Args:
+            text: 要翻譯的文本
+            domain: 文本所屬領域（只使用同一領域的術語譯文）
+            
+        Returns:
+            術語提示文本（沒有術語時為空字符串）
+        """
+        consistent_terms = []
+        words = re.findall(r'\b\w+\b', text.lower())
+        for word in sorted(set(words)):
+            if len(word) > 3 and ("text", word, domain) in self.term_memory:
+                consistent_terms.append((word, self.term_memory[("text", word, domain)]))
+        
+        if not consistent_terms:
+            return ""
+        
+        section = "為確保術語一致性，請在翻譯中使用以下對應關係：\n\n"
+        for eng, chi in consistent_terms[:20]:  # 限制數量，避免提示過長
+            section += f"- {eng} -> {chi}\n"
+        return section + "\n"
+    
     def _create_translation_prompt(self, 
                                 text: str, 
                                 terminology_db: Optional[Dict] = None,
-                                domain: Optional[str] = None) -> str:
+                                domain: Optional[str] = None,
+                                reference=None):
         """創建翻譯提示
         
         Args:
             text: 要翻譯的文本
             terminology_db: 專業術語資料庫
             domain: 文本所屬領域
+            reference: 相似段落的FuzzyMatch（有時要求模型以其譯文為基礎只修改不同之處）
             
         Returns:
-            格式化的提示文本
+            (系統提示, 使用者提示)；系統提示包含固定指示和術語對照表，標記為可緩存
         """
-        # 基本提示
-        prompt = "請將以下英文學術文本翻譯成繁體中文。請注意專業術語的準確性和學術風格：\n\n"
-        prompt += text + "\n\n"
-        
-        # 添加已翻譯術語，確保術語一致性
-        consistent_terms = []
-        words = re.findall(r'\b\w+\b', text.lower())
-        for word in set(words):
-            if len(word) > 3 and word in self.term_memory:
-                consistent_terms.append((word, self.term_memory[word]))
-        
-        # 如果有已翻譯術語，添加到提示中
-        if consistent_terms:
-            prompt += "為確保術語一致性，請在翻譯中使用以下對應關係：\n\n"
-            for eng, chi in consistent_terms[:20]:  # 限制數量，避免提示過長
-                prompt += f"- {eng} -> {chi}\n"
-            prompt += "\n"
-        
-        # 如果有專業術語資料庫，添加到提示中
-        if terminology_db and domain and domain in terminology_db:
-            prompt += "翻譯時，請使用以下專業術語對照表（英文 -> 中文）：\n\n"
-            
-            for term in terminology_db[domain]['terms'][:20]:  # 限制數量，避免提示過長
-                english = term['english']
-                chinese = term['chinese']
-                prompt += f"- {english} -> {chinese}\n"
-                
-            prompt += "\n請確保使用上述術語的標準翻譯。\n"
-        
-        # 特殊指示
-        prompt += """
-請遵循以下翻譯原則：
-
-保持學術風格和專業性
-保留原文的段落結構
-專有名詞、縮寫和數值保持原樣
-翻譯應流暢自然，避免直譯造成的不通順
-A, B, C等編號或列表保持原樣
-直接輸出翻譯結果，不要加上「翻譯結果：」等前綴
-不要使用markdown格式或代碼塊
-不要在輸出中加入任何解釋或說明
-
-請直接輸出翻譯結果，不需要任何解釋。
-"""
-        return prompt
-
-    def _rate_limit(self, max_requests_per_minute: int = 50):
-        """限制API調用速率
+        system = self._cached_system(TEXT_SYSTEM_PROMPT + self._glossary_prompt(terminology_db, domain))
+        if reference is None:
+            prompt = text + "\n\n" + self._consistent_terms_prompt(text, domain)
+        else:
+            prompt = "以下「相似原文」已有審定的譯文。請以「參考譯文」為基礎翻譯「原文」，" \
+                     "只修改與相似原文不同之處，其餘措辭保持一致，只輸出原文的譯文。\n\n"
+            prompt += f"相似原文：\n{reference.source}\n\n參考譯文：\n{reference.translation}\n\n"
+            prompt += f"原文：\n{text}\n\n" + self._consistent_terms_prompt(text, domain)
+        return system, prompt.rstrip() + "\n"
+    
+    def _create_packed_prompt(self, 
+                              texts: List[str], 
+                              terminology_db: Optional[Dict] = None,
+                              domain: Optional[str] = None):
+        """創建打包翻譯的提示
         
         Args:
-            max_requests_per_minute: 每分鐘最大請求數
-        """
-        self.request_counter += 1
-        
-        # 檢查是否需要限制
-        current_time = time.time()
-        elapsed = current_time - self.last_request_time
-        
-        if elapsed < 60 and self.request_counter >= max_requests_per_minute:
-            # 需要等待的時間
-            wait_time = 60 - elapsed
-            print(f"達到速率限制，等待 {wait_time:.2f} 秒...")
-            time.sleep(wait_time)
-            
-            # 重置計數器和時間
-            self.request_counter = 0
-            self.last_request_time = time.time()
-        elif elapsed >= 60:
-            # 重置計數器和時間
-            self.request_counter = 1
-            self.last_request_time = current_time
-
+            texts: 段落列表
+            terminology_db: 專業術語資料庫
+            domain: 文本所屬領域
+            
+        Returns:
+            (系統提示, 使用者提示)
+        """
+        system = self._cached_system(PACKED_SYSTEM_PROMPT + self._glossary_prompt(terminology_db, domain))
+        numbered = "\n\n".join(f"[[{i}]] {text.strip()}" for i, text in enumerate(texts, 1))
+        prompt = f"以下共 {len(texts)} 段：\n\n{numbered}\n\n"
+        prompt += self._consistent_terms_prompt("\n".join(texts), domain)
+        prompt += f"請直接輸出編號的翻譯結果，共 {len(texts)} 段。\n"
+        return system, prompt
+    
     def get_usage_statistics(self):
         """獲取API使用統計
         
         Returns:
             使用統計數據
         """
-        if not self.request_history:
-            return {"total_requests": 0}
-            
         total_requests = len(self.request_history)
         total_input_chars = sum(req.get("input_length", 0) for req in self.request_history)
         total_output_chars = sum(req.get("output_length", 0) for req in self.request_history)
@@ -462,6 +1169,11 @@ A, B, C等編號或列表保持原樣
             if domain:
                 domains[domain] = domains.get(domain, 0) + 1
         
+        # prompt caching：緩存讀取佔全部輸入令牌的比例
+        total_input_tokens = (self.token_usage["input_tokens"]
+                              + self.token_usage["cache_creation_input_tokens"]
+                              + self.token_usage["cache_read_input_tokens"])
+        
         return {
             "total_requests": total_requests,
             "total_input_chars": total_input_chars,
@@ -469,9 +1181,25 @@ A, B, C等編號或列表保持原樣
             "request_types": request_types,
             "domains": domains,
             "terms_in_memory": len(self.term_memory),
+            "copied_blocks": self.copied_blocks,
+            "furniture_translated": len(self.furniture_memory),
+            "furniture_reused": self.furniture_reused,
+            "packed_requests": self.packed_requests,
+            "packed_segments": self.packed_segments,
+            "pack_retried_segments": self.pack_retried_segments,
+            "truncated_responses": self.truncated_responses,
+            "continuations": self.continuations,
+            "chunking": self.chunker.get_statistics(),
+            "token_usage": dict(self.token_usage),
+            "cache_read_ratio": self.token_usage["cache_read_input_tokens"] / total_input_tokens if total_input_tokens > 0 else 0,
+            "translation_memory": self.translation_memory.get_statistics() if self.translation_memory is not None else None,
+            "fuzzy_memory": self.fuzzy_memory.get_statistics() if self.fuzzy_memory is not None else None,
+            "rate_limiter": self.rate_limiter.get_statistics(),
+            "retry": self.retry_policy.get_statistics(),
+            "failed_units": len(self.failure_log),
             "avg_output_input_ratio": total_output_chars / total_input_chars if total_input_chars > 0 else 0
         }
-
+    
     def translate_document_section(self, 
                                 blocks: List[Dict], 
                                 terminology_db: Optional[Dict] = None,
@@ -479,14 +1207,30 @@ A, B, C等編號或列表保持原樣
         """翻譯文檔的一個部分（多個連續文本塊）
         
         Args:
-            blocks: 文本塊列表
+            blocks: 文本塊列表或BlockStore
             terminology_db: 專業術語資料庫
             domain: 文檔所屬領域
             
         Returns:
-            翻譯後的文本塊列表
+            翻譯後的文本塊列表（輸入為BlockStore時返回翻譯後的BlockStore）
         """
-        translated_blocks = []
+        return self._run(self.atranslate_document_section(blocks, terminology_db, domain))
+    
+    async def atranslate_document_section(self, 
+                                          blocks: List[Dict], 
+                                          terminology_db: Optional[Dict] = None,
+                                          domain: Optional[str] = None) -> List[Dict]:
+        """translate_document_section的異步版本
+        
+        各組並發翻譯，結果按組的原始順序放回，與串行翻譯的結果順序相同。
+        """
+        # BlockStore整體複製一次，翻譯結果直接寫入副本中對應的塊，不再逐塊複製字典
+        if isinstance(blocks, BlockStore):
+            translated_store = blocks.copy()
+            copy_block = lambda block: translated_store[block.index]
+        else:
+            translated_store = None
+            copy_block = lambda block: block.copy()
         
         # 將文本塊分組，相似的文本塊合併處理
         grouped_blocks = []
@@ -495,6 +1239,12 @@ A, B, C等編號或列表保持原樣
         
         for block in blocks:
             block_type = block.get("type", "unknown")
+            # 分流為copy/reference的塊不參與合併，也不調用API
+            if block.get("triage") in COPY_THROUGH_LABELS:
+                block_type = "copy"
+            # 頁眉頁腳單獨成組，不與正文合併
+            elif block.get("furniture"):
+                block_type = "furniture"
             
             # 如果類型改變或者是圖片/表格/公式，創建新組
             if block_type != current_type or block_type in ["image", "figure", "table", "formula"]:
@@ -510,81 +1260,145 @@ A, B, C等編號或列表保持原樣
         if current_group:
             grouped_blocks.append((current_type, current_group))
         
-        # 處理每一組文本塊
-        for block_type, group in grouped_blocks:
-            if block_type == "text":
-                # 合併文本進行翻譯
-                text_contents = [block.get("content", "") for block in group]
-                combined_text = "\n\n".join(text_contents)
+        # 各組並發翻譯，gather按傳入順序返回結果
+        group_results = await asyncio.gather(*(
+            self._atranslate_group(block_type, group, copy_block, terminology_db, domain)
+            for block_type, group in grouped_blocks
+        ))
+        
+        if translated_store is not None:
+            return translated_store
+        return [block for result in group_results for block in result]
+    
+    async def _atranslate_group(self, block_type, group, copy_block, terminology_db, domain):
+        """翻譯一組文本塊
+        
+        Args:
+            block_type: 組的類型
+            group: 組內的塊
+            copy_block: 取得可寫入翻譯結果的塊副本的函數
+            terminology_db: 專業術語資料庫
+            domain: 文檔所屬領域
+            
+        Returns:
+            翻譯後的塊列表
+        """
+        translated_blocks = []
+        if block_type == "text" and self.pack_segments:
+            # 每個塊作為一個編號段落翻譯，譯文按編號精確放回，不再按長度比例切分
+            translations = await asyncio.gather(*(
+                self.atranslate_segment(block.get("content", ""), terminology_db, domain) for block in group
+            ))
+            for block, translation in zip(group, translations):
+                translated_block = copy_block(block)
+                if block.get("content", "").strip():
+                    translated_block["content_translated"] = translation
+                translated_blocks.append(translated_block)
+        elif block_type == "text":
+            # 按令牌預算把連續的塊分成多個請求，避免合併的文本過長、譯文被截斷
+            contents = [block.get("content", "") for block in group]
+            results = await asyncio.gather(*(
+                self._atranslate_combined([group[i] for i in pack], copy_block, terminology_db, domain)
+                for pack in self.chunker.pack(contents)
+            ))
+            translated_blocks = [block for result in results for block in result]
+        else:
+            # 處理非文本塊（圖片、表格、公式等）
+            for block in group:
+                translated_block = copy_block(block)
+                
+                if block_type == "copy":
+                    translated_block["content_translated"] = block.get("content", "")
+                    self.copied_blocks += 1
+                
+                elif block_type == "furniture":
+                    translated_block["content_translated"] = await self.atranslate_furniture(
+                        block["furniture"], block.get("content", ""), terminology_db, domain
+                    )
+                
+                elif block_type == "formula":
+                    translated_block["content_translated"] = await self.atranslate_formula(block.get("content", ""))
+                    if "caption" in block:
+                        translated_block["caption_translated"] = await self.atranslate_text(block.get("caption", ""), terminology_db, domain)
                 
-                if combined_text.strip():  # 確保有內容需要翻譯
-                    translated_text = self.translate_text(combined_text, terminology_db, domain)
+                elif block_type in ["image", "figure"]:
+                    if "text_in_image" in block and block["text_in_image"]:
+                        translated_block["text_in_image_translated"] = await self.atranslate_image_text(block["text_in_image"])
+                    if "caption" in block:
+                        translated_block["caption_translated"] = await self.atranslate_text(block.get("caption", ""), terminology_db, domain)
+                
+                elif block_type == "table" and "data" in block:
+                    translated_block["data_translated"] = await self.atranslate_table(block["data"])
+                    if "caption" in block:
+                        translated_block["caption_translated"] = await self.atranslate_text(block.get("caption", ""), terminology_db, domain)
+                
+                translated_blocks.append(translated_block)
+        
+        return translated_blocks
+    
+    async def _atranslate_combined(self, group, copy_block, terminology_db, domain):
+        """合併一組文本塊在一個請求中翻譯，譯文按原文長度比例分配回各塊
+        
+        Args:
+            group: 文本塊（合計在令牌預算以內）
+            copy_block: 取得可寫入翻譯結果的塊副本的函數
+            terminology_db: 專業術語資料庫
+            domain: 文檔所屬領域
+            
+        Returns:
+            翻譯後的塊列表
+        """
+        translated_blocks = []
+        # 合併文本進行翻譯
+        text_contents = [block.get("content", "") for block in group]
+        combined_text = "\n\n".join(text_contents)
+        
+        if combined_text.strip():  # 確保有內容需要翻譯
+            translated_text = await self.atranslate_text(combined_text, terminology_db, domain)
+            
+            # 嘗試將翻譯結果分配回各個塊
+            # 如果文本塊之間有明顯的段落界限，使用這些界限分割翻譯結果
+            if len(text_contents) > 1:
+                # 使用較複雜的啟發式方法分割翻譯文本
+                # 基於原文的長度比例分配翻譯文本
+                original_lengths = [len(text) for text in text_contents]
+                total_original_length = sum(original_lengths)
+                total_translated_length = len(translated_text)
+                
+                start_pos = 0
+                for i, block in enumerate(group):
+                    # 計算分配比例
+                    ratio = original_lengths[i] / total_original_length
+                    char_count = int(ratio * total_translated_length)
                     
-                    # 嘗試將翻譯結果分配回各個塊
-                    # 如果文本塊之間有明顯的段落界限，使用這些界限分割翻譯結果
-                    if len(text_contents) > 1:
-                        # 使用較複雜的啟發式方法分割翻譯文本
-                        # 基於原文的長度比例分配翻譯文本
-                        original_lengths = [len(text) for text in text_contents]
-                        total_original_length = sum(original_lengths)
-                        total_translated_length = len(translated_text)
-                        
-                        start_pos = 0
-                        for i, block in enumerate(group):
-                            # 計算分配比例
-                            ratio = original_lengths[i] / total_original_length
-                            char_count = int(ratio * total_translated_length)
-                            
-                            # 分配翻譯文本
-                            if i == len(group) - 1:  # 最後一個塊獲取剩餘所有文本
-                                block_translated = translated_text[start_pos:]
-                            else:
-                                # 嘗試找一個更好的斷點（句號、換行等）
-                                end_pos = min(start_pos + char_count, len(translated_text))
-                                # 向後尋找斷點
-                                better_end = translated_text.find('。', end_pos)
-                                if better_end == -1 or better_end > end_pos + 20:  # 如果找不到合適的斷點
-                                    better_end = translated_text.find('\n', end_pos)
-                                if better_end == -1 or better_end > end_pos + 20:
-                                    better_end = end_pos
-                                
-                                block_translated = translated_text[start_pos:better_end+1]
-                                start_pos = better_end + 1
-                            
-                            translated_block = block.copy()
-                            translated_block["content_translated"] = block_translated.strip()
-                            translated_blocks.append(translated_block)
+                    # 分配翻譯文本
+                    if i == len(group) - 1:  # 最後一個塊獲取剩餘所有文本
+                        block_translated = translated_text[start_pos:]
                     else:
-                        # 只有一個塊，直接使用整個翻譯
-                        translated_block = group[0].copy()
-                        translated_block["content_translated"] = translated_text
-                        translated_blocks.append(translated_block)
-                else:
-                    # 空文本，直接添加原始塊
-                    for block in group:
-                        translated_blocks.append(block.copy())
-            else:
-                # 處理非文本塊（圖片、表格、公式等）
-                for block in group:
-                    translated_block = block.copy()
-                    
-                    if block_type == "formula":
-                        translated_block["content_translated"] = self.translate_formula(block.get("content", ""))
-                        if "caption" in block:
-                            translated_block["caption_translated"] = self.translate_text(block.get("caption", ""), terminology_db, domain)
-                    
-                    elif block_type in ["image", "figure"]:
-                        if "text_in_image" in block and block["text_in_image"]:
-                            translated_block["text_in_image_translated"] = self.translate_image_text(block["text_in_image"])
-                        if "caption" in block:
-                            translated_block["caption_translated"] = self.translate_text(block.get("caption", ""), terminology_db, domain)
-                    
-                    elif block_type == "table" and "data" in block:
-                        translated_block["data_translated"] = self.translate_table(block["data"])
-                        if "caption" in block:
-                            translated_block["caption_translated"] = self.translate_text(block.get("caption", ""), terminology_db, domain)
+                        # 嘗試找一個更好的斷點（句號、換行等）
+                        end_pos = min(start_pos + char_count, len(translated_text))
+                        # 向後尋找斷點
+                        better_end = translated_text.find('。', end_pos)
+                        if better_end == -1 or better_end > end_pos + 20:  # 如果找不到合適的斷點
+                            better_end = translated_text.find('\n', end_pos)
+                        if better_end == -1 or better_end > end_pos + 20:
+                            better_end = end_pos
+                        
+                        block_translated = translated_text[start_pos:better_end+1]
+                        start_pos = better_end + 1
                     
+                    translated_block = copy_block(block)
+                    translated_block["content_translated"] = block_translated.strip()
                     translated_blocks.append(translated_block)
+            else:
+                # 只有一個塊，直接使用整個翻譯
+                translated_block = copy_block(group[0])
+                translated_block["content_translated"] = translated_text
+                translated_blocks.append(translated_block)
+        else:
+            # 空文本，直接添加原始塊
+            for block in group:
+                translated_blocks.append(copy_block(block))
         
         return translated_blocks
     
@@ -0,0 +1,287 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEGMENT_PATTERN = re.compile(r'^\[\[(\d+)\]\] (.*)$', re.MULTILINE)
+TABLE_PATTERN = re.compile(r'```json\n(.*)\n')
+
+def default_responder(params):
+    """根據請求生成確定性的模擬譯文
+    
+    編號段落逐段返回 "[[n]] 〔譯〕原文"，表格原樣返回JSON，
+    其他請求返回帶提示摘要的佔位譯文。
+    
+    Args:
+        params: Messages API的請求參數
+    
+    Returns:
+        回應文本
+    """
+    prompt = [message for message in params["messages"] if message["role"] == "user"][-1]["content"]
+    if isinstance(prompt, list):
+        prompt = "".join(block.get("text", "") for block in prompt)
+    
+    segments = SEGMENT_PATTERN.findall(prompt)
+    if segments:
+        return "\n".join(f"[[{number}]] 〔譯〕{text}" for number, text in segments)
+    
+    table = TABLE_PATTERN.search(prompt)
+    if table:
+        return table.group(1)
+    
+    return f"〔譯〕{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}"
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace("+00:00", "Z")
+
+class FakeBatchServer:
+    """本地模擬的Anthropic Messages和Message Batches端點
+    
+    在本機HTTP端口上實現 POST /v1/messages、POST /v1/messages/batches、
+    GET /v1/messages/batches/{id} 和 GET /v1/messages/batches/{id}/results，
+    anthropic客戶端把base_url指向url即可在無網絡的環境下端到端測試批量翻譯。
+    批次提交processing_seconds秒後變為ended；譯文由responder生成。
+    """
+    
+    def __init__(self, host="127.0.0.1", port=0, processing_seconds=2.0, responder=None):
+        """初始化模擬服務器
+        
+        Args:
+            host: 監聽地址
+            port: 監聽端口（0表示自動選擇）
+            processing_seconds: 批次從提交到結束的時間（秒）
+            responder: 函數(params) -> 回應文本（None表示使用default_responder）
+        """
+        self.processing_seconds = processing_seconds
+        self.responder = responder or default_responder
+        self.batches = {}
+        self.message_requests = 0
+        self._cached_prefixes = set()
+        # 注入的錯誤: {端點: [(狀態碼, retry-after)]}，依次用於之後對該端點的請求
+        self._injected_errors = {"messages": [], "batches": []}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+    
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        """在後台線程中啟動服務器"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-batch-server", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """停止服務器"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+    
+    def inject_errors(self, count, status=529, retry_after=None, endpoint="messages"):
+        """讓之後的count個請求返回錯誤，用於測試重試和斷路器
+        
+        Args:
+            count: 返回錯誤的請求數
+            status: HTTP狀態碼（529為過載，429為限流）
+            retry_after: retry-after回應頭的秒數（None表示不帶）
+            endpoint: "messages"（/v1/messages）或"batches"（/v1/messages/batches下的所有請求）
+        """
+        with self._lock:
+            self._injected_errors[endpoint].extend([(status, retry_after)] * count)
+    
+    def _next_error(self, endpoint):
+        with self._lock:
+            errors = self._injected_errors[endpoint]
+            return errors.pop(0) if errors else None
+    
+    def _message(self, params):
+        """生成一個Message對象
+        
+        帶cache_control的系統提示按prompt caching計費：第一次出現時計為緩存寫入，
+        之後計為緩存讀取。輸出按每令牌2個字符計，超過max_tokens時截斷並返回
+        stop_reason "max_tokens"；最後一條消息是助手回應的開頭時返回其後的部分（續寫）。
+        """
+        prompt = json.dumps(params.get("messages", []), ensure_ascii=False)
+        text = self.responder(params)
+        messages = params.get("messages", [])
+        if messages and messages[-1]["role"] == "assistant":
+            prefill = messages[-1]["content"]
+            text = text[len(prefill):] if text.startswith(prefill) else text
+        stop_reason = "end_turn"
+        max_tokens = params.get("max_tokens")
+        if max_tokens and len(text) > max_tokens * 2:
+            text = text[:max_tokens * 2]
+            stop_reason = "max_tokens"
+        
+        cache_creation = 0
+        cache_read = 0
+        system = params.get("system")
+        if isinstance(system, list) and any("cache_control" in block for block in system):
+            system_text = "".join(block.get("text", "") for block in system)
+            with self._lock:
+                cached = system_text in self._cached_prefixes
+                self._cached_prefixes.add(system_text)
+            if cached:
+                cache_read = max(1, len(system_text) // 4)
+            else:
+                cache_creation = max(1, len(system_text) // 4)
+        elif system:
+            prompt += json.dumps(system, ensure_ascii=False)
+        
+        return {
+            "id": f"msg_fake_{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": params.get("model", "fake-model"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": max(1, len(prompt) // 4),
+                "output_tokens": max(1, len(text) // 2),
+                "cache_creation_input_tokens": cache_creation,
+                "cache_read_input_tokens": cache_read
+            }
+        }
+    
+    def _batch_object(self, batch_id):
+        """生成批次的MessageBatch對象"""
+        batch = self.batches[batch_id]
+        ended = time.time() >= batch["created"] + self.processing_seconds
+        total = len(batch["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0
+            },
+            "created_at": _timestamp(batch["created"]),
+            "expires_at": _timestamp(batch["created"] + timedelta(days=1).total_seconds()),
+            "ended_at": _timestamp(batch["created"] + self.processing_seconds) if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None
+        }
+    
+    def _create_batch(self, body):
+        """處理批次提交"""
+        requests = body.get("requests") or []
+        custom_ids = [request.get("custom_id") for request in requests]
+        if not requests or len(set(custom_ids)) != len(custom_ids):
+            return 400, {"type": "error", "error": {"type": "invalid_request_error", "message": "custom_id必須唯一且不能為空"}}
+        with self._lock:
+            batch_id = f"msgbatch_fake_{len(self.batches) + 1:04d}"
+            self.batches[batch_id] = {"created": time.time(), "requests": requests}
+        return 200, self._batch_object(batch_id)
+    
+    def _batch_results(self, batch_id):
+        """生成批次結果的JSONL"""
+        lines = []
+        for request in self.batches[batch_id]["requests"]:
+            lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "result": {"type": "succeeded", "message": self._message(request["params"])}
+            }, ensure_ascii=False))
+        return "\n".join(lines) + "\n"
+    
+    def _handler_class(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+            
+            def _send(self, status, payload, content_type="application/json", headers=None):
+                data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+                data = data.encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def _send_injected_error(self, endpoint):
+                """有待返回的錯誤時發送錯誤回應並返回True"""
+                error = server._next_error(endpoint)
+                if error is None:
+                    return False
+                status, retry_after = error
+                headers = {"retry-after": str(retry_after)} if retry_after is not None else None
+                error_type = "overloaded_error" if status == 529 else "api_error"
+                self._send(status, {"type": "error", "error": {"type": error_type, "message": "模擬錯誤"}}, headers=headers)
+                return True
+            
+            def _not_found(self):
+                self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            
+            def _path_parts(self):
+                return [part for part in self.path.split("?")[0].split("/") if part]
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                parts = self._path_parts()
+                if parts == ["v1", "messages"]:
+                    with server._lock:
+                        server.message_requests += 1
+                    if not self._send_injected_error("messages"):
+                        self._send(200, server._message(body))
+                elif parts == ["v1", "messages", "batches"]:
+                    if not self._send_injected_error("batches"):
+                        self._send(*server._create_batch(body))
+                else:
+                    self._not_found()
+            
+            def do_GET(self):
+                parts = self._path_parts()
+                if len(parts) < 4 or parts[:3] != ["v1", "messages", "batches"] or parts[3] not in server.batches:
+                    self._not_found()
+                    return
+                if self._send_injected_error("batches"):
+                    return
+                batch = server._batch_object(parts[3])
+                if len(parts) == 4:
+                    self._send(200, batch)
+                elif len(parts) == 5 and parts[4] == "results" and batch["processing_status"] == "ended":
+                    self._send(200, server._batch_results(parts[3]), "application/binary")
+                else:
+                    self._not_found()
+        
+        return Handler
+
+# 單獨運行時提供一個本地端點，供 ANTHROPIC_BASE_URL 指向
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="本地模擬的Message Batches端點")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--processing-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    
+    fake_server = FakeBatchServer(port=args.port, processing_seconds=args.processing_seconds)
+    print(f"模擬服務器已啟動: {fake_server.url}")
+    try:
+        fake_server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        fake_server._httpd.server_close()
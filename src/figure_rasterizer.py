@@ -0,0 +1,223 @@
+import os
+import io
+import json
+import time
+import hashlib
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from .parse_cache import ParseCache
+from .pdf_source import open_fitz, worker_path
+
+# 支持的輸出格式: {格式: 擴展名}
+FIGURE_FORMATS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+class FigureRasterizer:
+    """圖表區域柵格化
+
+    收集所有需要截圖的圖表區域後統一渲染，可分配到進程池並行執行。
+    每次渲染以 (PDF內容哈希, 頁碼, 區域, DPI, 格式) 為鍵記錄在圖片存儲的
+    renders目錄中，相同的渲染已存在時直接引用存儲中的文件，不再重新渲染。
+    """
+
+    RENDERS_DIRNAME = "renders"
+
+    def __init__(self, image_store, dpi=144, image_format="png", workers=1, quality=90):
+        """初始化柵格化器
+
+        Args:
+            image_store: 圖片存儲（ImageStore實例）
+            dpi: 渲染分辨率（144相當於原來的2倍縮放）
+            image_format: 輸出格式，png、jpeg或webp
+            workers: 並行渲染的進程數（1表示在當前進程中渲染）
+            quality: JPEG/WebP的壓縮質量
+        """
+        image_format = (image_format or "png").lower()
+        if image_format == "jpg":
+            image_format = "jpeg"
+        if image_format not in FIGURE_FORMATS:
+            raise ValueError(f"不支持的圖表輸出格式: {image_format}")
+
+        self.image_store = image_store
+        self.dpi = int(dpi)
+        self.image_format = image_format
+        self.workers = max(1, int(workers or 1))
+        self.quality = int(quality)
+        self.renders_dir = os.path.join(image_store.root_dir, self.RENDERS_DIRNAME)
+        os.makedirs(self.renders_dir, exist_ok=True)
+
+        # {PDF路徑: 內容哈希}
+        self._pdf_hashes = {}
+
+        # 統計
+        self.rendered = 0
+        self.reused = 0
+
+    def _pdf_hash(self, pdf_path):
+        """計算並緩存PDF內容哈希"""
+        if pdf_path not in self._pdf_hashes:
+            self._pdf_hashes[pdf_path] = ParseCache.hash_file(pdf_path)
+        return self._pdf_hashes[pdf_path]
+
+    def render_key(self, pdf_hash, page_num, clip):
+        """生成渲染記錄的鍵"""
+        clip_key = ",".join(f"{coord:.2f}" for coord in clip)
+        raw_key = f"{pdf_hash}|{page_num}|{clip_key}|{self.dpi}|{self.image_format}"
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def _record_path(self, key):
+        return os.path.join(self.renders_dir, key[:2], f"{key}.json")
+
+    def _load_record(self, key):
+        """讀取渲染記錄，記錄的圖片文件已不存在時返回None"""
+        record_path = self._record_path(key)
+        if not os.path.exists(record_path):
+            return None
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except Exception as e:
+            print(f"讀取圖表渲染記錄時出錯: {e}")
+            return None
+        if not os.path.exists(os.path.join(self.image_store.root_dir, record["blob_path"])):
+            return None
+        return record
+
+    def _save_record(self, key, record):
+        """原子寫入渲染記錄"""
+        record_path = self._record_path(key)
+        os.makedirs(os.path.dirname(record_path), exist_ok=True)
+        tmp_path = f"{record_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, record_path)
+
+    def rasterize(self, pdf_path, figures, doc=None, pdf_hash=None):
+        """渲染圖表區域並填寫圖片信息
+
+        figures中每項需包含page_num和clip；渲染後原地填寫image_path、
+        render_time（渲染耗時，秒）和render_cached（是否沿用已有渲染）。
+
+        Args:
+            pdf_path: PDF文件路徑或PDFSource
+            figures: 待渲染的圖表信息列表
+            doc: 已打開的PyMuPDF文檔對象（在當前進程渲染時使用）
+            pdf_hash: 已計算的PDF內容哈希（None表示在此計算；同一文檔多次調用時應傳入，避免重複讀取整個文件）
+
+        Returns:
+            figures
+        """
+        if not figures:
+            return figures
+
+        if pdf_hash is None:
+            pdf_hash = self._pdf_hash(pdf_path)
+
+        # 先查找已有渲染，只渲染缺失的區域
+        pending = []
+        for figure in figures:
+            key = self.render_key(pdf_hash, figure["page_num"], figure["clip"])
+            record = self._load_record(key)
+            if record is not None:
+                self._fill(figure, record, cached=True)
+                self.reused += 1
+            else:
+                pending.append((key, figure))
+
+        if not pending:
+            return figures
+
+        jobs = [(figure["page_num"], tuple(figure["clip"])) for _, figure in pending]
+
+        # 純內存的文檔無法在工作進程中按路徑重新打開，只在當前進程渲染
+        if self.workers > 1 and len(jobs) > 1 and worker_path(pdf_path) is not None:
+            # 按工作進程數均分任務，每個進程只打開一次文檔
+            chunk_size = -(-len(jobs) // self.workers)
+            chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+            rendered = []
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                futures = [
+                    executor.submit(_render_clips_worker, worker_path(pdf_path), chunk, self.dpi, self.image_format, self.quality)
+                    for chunk in chunks
+                ]
+                for future in futures:
+                    rendered.extend(future.result())
+        else:
+            rendered = _render_clips(doc, pdf_path, jobs, self.dpi, self.image_format, self.quality)
+
+        for (key, figure), (data, render_time) in zip(pending, rendered):
+            if data is None:
+                continue
+            blob_path = self.image_store.put_bytes(data, FIGURE_FORMATS[self.image_format])
+            record = {"blob_path": blob_path, "render_time": render_time}
+            self._save_record(key, record)
+            self._fill(figure, record, cached=False)
+            self.rendered += 1
+
+        return figures
+
+    def _fill(self, figure, record, cached):
+        """把渲染結果寫入圖表信息"""
+        figure["image_path"] = os.path.join("images", record["blob_path"])
+        figure["render_time"] = round(record["render_time"], 4)
+        figure["render_cached"] = cached
+        figure["dpi"] = self.dpi
+        figure["format"] = self.image_format
+
+    def get_statistics(self):
+        """獲取渲染統計"""
+        return {
+            "rendered": self.rendered,
+            "reused": self.reused
+        }
+
+def _encode_pixmap(pix, image_format, quality):
+    """把pixmap編碼為指定格式的字節數據"""
+    if image_format == "png":
+        return pix.tobytes("png")
+
+    mode = "RGBA" if pix.alpha else "RGB"
+    img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    if image_format == "jpeg" and img.mode == "RGBA":
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format.upper(), quality=quality)
+    return buffer.getvalue()
+
+def _render_clips(doc, pdf_path, jobs, dpi, image_format, quality):
+    """渲染一組圖表區域
+
+    Args:
+        doc: 已打開的PyMuPDF文檔對象（None時按路徑打開）
+        pdf_path: PDF文件路徑
+        jobs: [(頁碼, 區域), ...]
+        dpi: 渲染分辨率
+        image_format: 輸出格式
+        quality: JPEG/WebP的壓縮質量
+
+    Returns:
+        [(字節數據, 渲染耗時), ...]，渲染失敗的項為 (None, 0)
+    """
+    own_doc = doc is None
+    if own_doc:
+        doc = open_fitz(pdf_path)
+
+    results = []
+    try:
+        for page_num, clip in jobs:
+            start = time.perf_counter()
+            try:
+                pix = doc[page_num - 1].get_pixmap(clip=clip, dpi=dpi)
+                data = _encode_pixmap(pix, image_format, quality)
+                results.append((data, time.perf_counter() - start))
+            except Exception as e:
+                print(f"截取圖表區域時出錯: {e}")
+                results.append((None, 0))
+    finally:
+        if own_doc:
+            doc.close()
+
+    return results
+
+def _render_clips_worker(pdf_path, jobs, dpi, image_format, quality):
+    """進程池工作函數：按路徑打開文檔並渲染一組圖表區域"""
+    return _render_clips(None, pdf_path, jobs, dpi, image_format, quality)
@@ -117,6 +117,19 @@ def fix_image_paths(json_path, save=True):
                     print(f"找到頁面圖片: 頁面 {page_num}: {img_path}")
                 break
     
+    # 圖片存儲清單中的條目優先（文件名是內容哈希，無法從文件名解析頁碼）
+    manifest_path = os.path.join(base_dir, "images", "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        for logical_name, blob_path in manifest.items():
+            match = re.fullmatch(re.escape(base_name) + r'/page(\d+)_img(\d+)', logical_name)
+            if match:
+                page_num = int(match.group(1))
+                img_num = int(match.group(2))
+                image_dict[page_num][img_num] = os.path.join("images", blob_path)
+                print(f"清單中的圖片: 頁面 {page_num}, 圖片 {img_num}: {blob_path}")
+    
     # 更新JSON中的圖片路徑
     fixed_count = 0
     for page_idx, page in enumerate(data.get("text_data", [])):
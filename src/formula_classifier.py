@@ -0,0 +1,200 @@
+import numpy as np
+
+# 數學符號：出現任意一個即可能是公式
+MATH_SYMBOLS = ['∫', '∑', '∏', '√', '≈', '≠', '≤', '≥', '±', '∞', '∂', '∇', '∆', '∈', '∉', '∩', '∪']
+# 公式指標：短文本中出現多種時可能是公式
+FORMULA_INDICATORS = ['=', '+', '-', '*', '/', '^', '(', ')', '[', ']', '{', '}']
+
+# 分隔符，拼接文本時放在塊與塊之間
+_SEPARATOR = "\x00"
+# 數學符號UTF-8編碼的前兩個字節（∑、≤等為0xE2 0x88/0x89，±為0xC2 0xB1）
+_SYMBOL_PREFIXES = sorted({symbol.encode("utf-8")[:2] for symbol in MATH_SYMBOLS})
+
+class FormulaClassifier:
+    """批量公式分類器
+    
+    規則與逐塊檢查相同：含LaTeX公式標記、含至少min_symbols種數學符號，
+    或長度小於max_length且含至少min_indicators種公式指標的文本視為公式。
+    
+    批量模式把所有塊用分隔符拼接成一個UTF-8字節串，用bytes.translate在C層
+    一次刪除所有無關字節，只留下分隔符、公式指標以及數學符號編碼的前兩個
+    字節；剩下的少量字節再用NumPy按塊統計公式指標。刪除後相鄰的符號前綴
+    只說明塊中可能有數學符號，這些候選塊再逐個精確確認。
+    """
+    
+    def __init__(self, min_symbols=1, min_indicators=4, max_length=100):
+        """初始化分類器
+        
+        Args:
+            min_symbols: 判定為公式所需的最少數學符號種類數
+            min_indicators: 判定為公式所需的最少公式指標種類數
+            max_length: 僅憑公式指標判定時文本長度的上限（不含）
+        """
+        self.min_symbols = min_symbols
+        self.min_indicators = min_indicators
+        self.max_length = max_length
+        
+        # 字節到公式指標類別的查找表：0為其他字節，1..12為公式指標
+        self._num_classes = len(FORMULA_INDICATORS) + 1
+        self._lut = np.zeros(256, dtype=np.int64)
+        for class_id, indicator in enumerate(FORMULA_INDICATORS):
+            self._lut[ord(indicator)] = class_id + 1
+        
+        # 相鄰兩字節（首字節 << 8 | 第二字節）是否為數學符號前綴的查找表
+        self._prefix_lut = np.zeros(1 << 16, dtype=bool)
+        for prefix in _SYMBOL_PREFIXES:
+            self._prefix_lut[(prefix[0] << 8) | prefix[1]] = True
+        
+        # bytes.translate需要刪除的字節（保留分隔符、公式指標和符號前綴字節）
+        keep = {ord(_SEPARATOR)} | {ord(indicator) for indicator in FORMULA_INDICATORS}
+        for prefix in _SYMBOL_PREFIXES:
+            keep.update(prefix)
+        self._delete_bytes = bytes(byte for byte in range(256) if byte not in keep)
+    
+    def classify_one(self, text):
+        """逐塊檢查單個文本是否可能是數學公式（參考實現）"""
+        if '\\begin{equation}' in text or '\\end{equation}' in text:
+            return True
+        
+        symbol_count = sum(1 for symbol in MATH_SYMBOLS if symbol in text)
+        indicator_count = sum(1 for indicator in FORMULA_INDICATORS if indicator in text)
+        
+        return (symbol_count >= self.min_symbols) or (indicator_count >= self.min_indicators and len(text) < self.max_length)
+    
+    def score_batch(self, texts):
+        """批量計算每個文本的公式特徵和分數
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            字典，各值均為長度與texts相同的NumPy數組：
+            symbol_count（數學符號種類數）、indicator_count（公式指標種類數）、
+            length（字符數）、latex（是否含LaTeX公式標記）、
+            score（分數，大於等於1表示判定為公式）
+        """
+        n = len(texts)
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=n)
+        symbol_count = np.zeros(n, dtype=np.int64)
+        indicator_count = np.zeros(n, dtype=np.int64)
+        latex = np.zeros(n, dtype=bool)
+        
+        joined = _SEPARATOR.join(texts)
+        kept = np.frombuffer(joined.encode("utf-8", "surrogatepass").translate(None, self._delete_bytes), dtype=np.uint8)
+        is_separator = kept == 0
+        
+        if n and np.count_nonzero(is_separator) == n - 1:
+            # 刪除無關字節後，剩下的字節流中每個分隔符標誌著進入下一個塊
+            block_ids = np.cumsum(is_separator)
+            
+            # 每個塊中每個公式指標是否出現
+            classes = self._lut[kept]
+            hit = np.flatnonzero(classes)
+            presence = np.zeros(n * self._num_classes, dtype=bool)
+            presence[block_ids[hit] * self._num_classes + classes[hit]] = True
+            indicator_count = presence.reshape(n, self._num_classes).sum(axis=1)
+            
+            # 相鄰的符號前綴只是候選，逐塊精確統計數學符號種類
+            pair_codes = (kept[:-1].astype(np.int32) << 8) | kept[1:]
+            candidates = np.zeros(n, dtype=bool)
+            candidates[block_ids[:-1][self._prefix_lut[pair_codes]]] = True
+            for block_idx in np.flatnonzero(candidates):
+                symbol_count[block_idx] = sum(map(texts[block_idx].__contains__, MATH_SYMBOLS))
+            
+            # LaTeX標記很少出現，在拼接文本中查找後按字符偏移映射回塊
+            positions = []
+            for marker in ('\\begin{equation}', '\\end{equation}'):
+                pos = joined.find(marker)
+                while pos != -1:
+                    positions.append(pos)
+                    pos = joined.find(marker, pos + len(marker))
+            if positions:
+                block_ends = np.cumsum(lengths + 1)
+                latex[np.searchsorted(block_ends, positions, side="right")] = True
+        else:
+            # 文本本身含有分隔符時無法按塊切分，退回逐塊統計
+            for block_idx, text in enumerate(texts):
+                symbol_count[block_idx] = sum(1 for symbol in MATH_SYMBOLS if symbol in text)
+                indicator_count[block_idx] = sum(1 for indicator in FORMULA_INDICATORS if indicator in text)
+                latex[block_idx] = '\\begin{equation}' in text or '\\end{equation}' in text
+        
+        symbol_score = symbol_count / max(self.min_symbols, 1)
+        indicator_score = np.where(lengths < self.max_length, indicator_count / max(self.min_indicators, 1), 0.0)
+        score = np.maximum(symbol_score, indicator_score)
+        score = np.where(latex, np.maximum(score, 1.0), score)
+        
+        return {
+            "symbol_count": symbol_count,
+            "indicator_count": indicator_count,
+            "length": lengths,
+            "latex": latex,
+            "score": score
+        }
+    
+    def classify_batch(self, texts):
+        """批量判斷文本是否可能是數學公式
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            布爾值列表
+        """
+        return self.decide(self.score_batch(texts))
+    
+    def decide(self, scores):
+        """根據score_batch的結果按閾值判斷
+        
+        Args:
+            scores: score_batch返回的字典
+        
+        Returns:
+            布爾值列表
+        """
+        is_formula = (
+            scores["latex"]
+            | (scores["symbol_count"] >= self.min_symbols)
+            | ((scores["indicator_count"] >= self.min_indicators) & (scores["length"] < self.max_length))
+        )
+        return is_formula.tolist()
+    
+    def fingerprint(self):
+        """閾值的簡短標識，用於區分不同閾值下的解析緩存"""
+        return f"f{self.min_symbols}.{self.min_indicators}.{self.max_length}"
+
+# 微基準測試：比較逐塊檢查與批量分類
+if __name__ == "__main__":
+    import random
+    import time
+    
+    random.seed(0)
+    words = ["the", "network", "model", "intrusion", "detection", "learning", "accuracy", "of", "and", "in",
+             "“NSL-KDD”", "(RNN-IDS)", "2017", "state-of-the-art"]
+    formula_parts = ["x", "y", "=", "+", "-", "(", ")", "^2", "∑", "≤", "/", "[", "]", "\\begin{equation}"]
+    
+    corpus = []
+    for _ in range(200000):
+        if random.random() < 0.8:
+            corpus.append(" ".join(random.choice(words) for _ in range(random.randint(5, 80))) + " ")
+        else:
+            corpus.append(" ".join(random.choice(formula_parts) for _ in range(random.randint(3, 30))) + " ")
+    
+    classifier = FormulaClassifier()
+    
+    # 各取5次中的最短時間，減少機器負載波動的影響
+    per_block_time = batch_time = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        expected = [classifier.classify_one(text) for text in corpus]
+        per_block_time = min(per_block_time, time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        actual = classifier.classify_batch(corpus)
+        batch_time = min(batch_time, time.perf_counter() - start)
+    
+    assert expected == actual, "批量分類結果與逐塊檢查不一致"
+    
+    print(f"文本塊數量: {len(corpus)}，公式數量: {sum(actual)}")
+    print(f"逐塊檢查: {per_block_time:.3f} 秒")
+    print(f"批量分類: {batch_time:.3f} 秒")
+    print(f"加速比: {per_block_time / batch_time:.1f}x")
@@ -0,0 +1,216 @@
+import re
+import zlib
+import threading
+from collections import namedtuple
+import numpy as np
+
+# 字符n-gram的長度
+SHINGLE_SIZE = 5
+# MinHash排列使用的梅森素數；哈希值小於2^31，乘積不會溢出uint64
+_PRIME = (1 << 31) - 1
+# 數字序列，數字不同的近似重複段落（年份、編號、金額）不直接沿用譯文
+NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)*')
+
+# 模糊匹配結果：相似原文、其譯文、相似度（字符n-gram的Jaccard係數）、是否可直接沿用
+FuzzyMatch = namedtuple("FuzzyMatch", ["source", "translation", "similarity", "reusable"])
+
+def normalize(text):
+    """規範化文本：接回行尾連字符斷開的單詞，合併空白，轉為小寫"""
+    text = re.sub(r'-[ \t]*\n\s*', '', text)
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+def shingles(text, size=SHINGLE_SIZE):
+    """規範化文本的字符n-gram集合"""
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def jaccard(a, b):
+    """兩個集合的Jaccard係數"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class FuzzyMemory:
+    """近似重複段落的模糊翻譯記憶
+    
+    對已翻譯的文本塊計算字符n-gram的MinHash簽名，用LSH分桶建立內存索引。
+    查詢時只比較與新段落落入同一桶的候選，按n-gram的Jaccard係數精確計算相似度：
+    不低於reuse_threshold且數字完全相同時直接沿用譯文，
+    不低於reference_threshold時把相似原文和譯文作為參考發給模型，只需修改不同之處。
+    適用於資料集描述、版權聲明、基金致謝等在不同論文中小幅改動後重複出現的段落。
+    """
+    
+    # 每次查詢精確計算相似度的候選數上限（按簽名碰撞的分桶數排序）
+    MAX_CANDIDATES = 8
+    
+    def __init__(self, reuse_threshold=0.95, reference_threshold=0.7, min_chars=60,
+                 max_entries=100000, num_perm=64, bands=16, seed=1):
+        """初始化模糊翻譯記憶
+        
+        Args:
+            reuse_threshold: 直接沿用譯文的最低相似度
+            reference_threshold: 作為參考譯文的最低相似度
+            min_chars: 參與索引和查詢的最短文本長度（短文本的n-gram相似度不可靠）
+            max_entries: 索引的最大條目數
+            num_perm: MinHash簽名長度
+            bands: LSH分桶數（每桶num_perm // bands行）
+            seed: 生成MinHash排列的隨機種子
+        """
+        self.reuse_threshold = reuse_threshold
+        self.reference_threshold = reference_threshold
+        self.min_chars = min_chars
+        self.max_entries = max_entries
+        self.bands = bands
+        self.rows = num_perm // bands
+        
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+        
+        self._lock = threading.Lock()
+        # 條目: [(領域, 原文, 譯文)]，以及 {(領域, 原文): 索引}
+        self._entries = []
+        self._positions = {}
+        # LSH分桶: {(領域, 桶號, 簽名片段): [條目索引]}
+        self._buckets = {}
+        
+        # 統計
+        self.lookups = 0
+        self.reused = 0
+        self.referenced = 0
+        # 最相似候選的相似度分布，按0.1分檔
+        self.similarity_histogram = [0] * 10
+    
+    def signature(self, shingle_set):
+        """計算n-gram集合的MinHash簽名"""
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) % _PRIME for shingle in shingle_set),
+            dtype=np.uint64, count=len(shingle_set)
+        )
+        return ((np.multiply.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+    
+    def _band_keys(self, domain, signature):
+        return [
+            (domain, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+    
+    def add(self, source, translation, domain=None):
+        """加入一條譯文（已有的原文更新譯文）
+        
+        Args:
+            source: 原文
+            translation: 譯文
+            domain: 領域
+        """
+        if not translation or len(source) < self.min_chars:
+            return
+        key = (domain, source)
+        with self._lock:
+            position = self._positions.get(key)
+            if position is not None:
+                self._entries[position] = (domain, source, translation)
+                return
+            if len(self._entries) >= self.max_entries:
+                return
+        
+        shingle_set = shingles(source)
+        if not shingle_set:
+            return
+        band_keys = self._band_keys(domain, self.signature(shingle_set))
+        
+        with self._lock:
+            if key in self._positions:
+                return
+            position = len(self._entries)
+            self._entries.append((domain, source, translation))
+            self._positions[key] = position
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, []).append(position)
+    
+    def load(self, translation_memory, model, prompt_version):
+        """從持久化翻譯記憶載入文本譯文，最近訪問的優先
+        
+        只載入同一模型和提示模板版本的譯文，與精確匹配的鍵一致。
+        
+        Args:
+            translation_memory: TranslationMemory實例
+            model: 模型名稱
+            prompt_version: 提示模板版本
+        
+        Returns:
+            載入後的條目數
+        """
+        entries = translation_memory.iter_entries("text", model, prompt_version, limit=self.max_entries)
+        for source, translation, domain in entries:
+            if isinstance(translation, str):
+                self.add(source, translation, domain)
+        return len(self)
+    
+    def match(self, text, domain=None):
+        """查找最相似的已翻譯段落
+        
+        Args:
+            text: 原文
+            domain: 領域（只匹配同一領域的譯文）
+        
+        Returns:
+            相似度不低於reference_threshold時返回FuzzyMatch，否則返回None
+        """
+        if len(text) < self.min_chars or not self._entries:
+            return None
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return None
+        
+        collisions = {}
+        with self._lock:
+            for band_key in self._band_keys(domain, self.signature(shingle_set)):
+                for position in self._buckets.get(band_key, ()):
+                    collisions[position] = collisions.get(position, 0) + 1
+            candidates = [
+                self._entries[position]
+                for position in sorted(collisions, key=collisions.get, reverse=True)[:self.MAX_CANDIDATES]
+            ]
+        
+        best = None
+        for _, source, translation in candidates:
+            similarity = jaccard(shingle_set, shingles(source))
+            if best is None or similarity > best[0]:
+                best = (similarity, source, translation)
+        
+        with self._lock:
+            self.lookups += 1
+            if best is None:
+                return None
+            similarity, source, translation = best
+            self.similarity_histogram[min(int(similarity * 10), 9)] += 1
+            if similarity < self.reference_threshold:
+                return None
+            reusable = (similarity >= self.reuse_threshold
+                        and NUMBER_PATTERN.findall(text) == NUMBER_PATTERN.findall(source))
+            if reusable:
+                self.reused += 1
+            else:
+                self.referenced += 1
+        return FuzzyMatch(source, translation, similarity, reusable)
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get_statistics(self):
+        """獲取沿用率和相似度分布"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "reused": self.reused,
+                "referenced": self.referenced,
+                "reuse_rate": self.reused / self.lookups if self.lookups else 0.0,
+                "reference_rate": self.referenced / self.lookups if self.lookups else 0.0,
+                "similarity_histogram": {
+                    f"{i / 10:.1f}-{(i + 1) / 10:.1f}": count for i, count in enumerate(self.similarity_histogram)
+                }
+            }
@@ -138,13 +138,13 @@ def clean_html_content(content):
     content = re.sub(r'>\s+<', '><', content)
     return content
 
-def create_toggle_html(json_path, output_path=None, copy_images=True):
+def create_toggle_html(json_path, output_path=None, copy_images=False):
     """創建可切換原文/翻譯的 HTML
     
     Args:
         json_path: 翻譯數據 JSON 文件路徑
         output_path: 輸出 HTML 文件路徑
-        copy_images: 是否複製圖片到輸出目錄
+        copy_images: 是否複製圖片到輸出目錄（默認直接引用圖片存儲中的文件）
     
     Returns:
         HTML 文件路徑
@@ -169,9 +169,10 @@ def create_toggle_html(json_path, output_path=None, copy_images=True):
     # 確保輸出目錄存在
     os.makedirs(output_dir, exist_ok=True)
     
-    # 圖片處理 - 創建目標圖片目錄
+    # 圖片處理 - 僅在需要複製圖片時創建目標圖片目錄
     images_dir = os.path.join(output_dir, "output_images")
-    os.makedirs(images_dir, exist_ok=True)
+    if copy_images:
+        os.makedirs(images_dir, exist_ok=True)
     
     # 獲取 JSON 文件所在的基礎目錄
     source_base_dir = os.path.dirname(json_path)
@@ -191,91 +192,48 @@ def create_toggle_html(json_path, output_path=None, copy_images=True):
         if "blocks" in page:
             page["blocks"] = merge_adjacent_blocks(page["blocks"])
     
-    # 更新JSON中的圖片路徑，指向新位置
-    if copy_images:
-        # 從JSON中尋找並複製所有圖片
-        copied_images = []
-        
-        # 處理text_data中的圖片
-        for page_idx, page in enumerate(data.get("text_data", [])):
-            for block_idx, block in enumerate(page.get("blocks", [])):
-                if block.get("type") in ["image", "figure"]:
-                    # 獲取或設置圖片路徑
-                    image_path = block.get("image_path", "")
-                    
-                    # 如果路徑為空，嘗試設置一個默認路徑
-                    if not image_path:
-                        basename = os.path.splitext(os.path.basename(json_path))[0]
-                        default_image_name = f"{basename}_page{page_idx+1}_img{block_idx+1}.png"
-                        
-                        # 嘗試在可用圖片中查找匹配的文件
-                        for img in available_images:
-                            if default_image_name in img:
-                                image_path = img
-                                block["image_path"] = image_path
-                                print(f"為空路徑找到匹配圖片: {image_path}")
-                                break
-                    else:
-                        # 嘗試修正現有路徑
-                        matched_path = find_matching_image(source_base_dir, image_path)
-                        if matched_path and matched_path != image_path:
-                            image_path = matched_path
-                            block["image_path"] = matched_path
-                            print(f"修正圖片路徑: {image_path} -> {matched_path}")
-                    
-                    if not image_path:
-                        print(f"警告: 頁面 {page_idx+1} 的塊 {block_idx} 未找到有效圖片路徑")
-                        continue
-                    
-                    # 源圖片路徑
-                    src_path = os.path.join(source_base_dir, image_path)
-                    
-                    # 獲取圖片文件名
-                    image_filename = os.path.basename(image_path)
-                    
-                    # 新的目標路徑
-                    dst_path = os.path.join(images_dir, image_filename)
-                    
-                    # 更新JSON中的圖片路徑
-                    relative_dst_path = os.path.join("output_images", image_filename)
-                    block["image_path"] = relative_dst_path
-                    
-                    # 確保目標目錄存在
-                    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-                    
-                    # 複製圖片
-                    if os.path.exists(src_path):
-                        try:
-                            # 檢查是否需要複製（避免源和目標相同）
-                            if os.path.normpath(src_path) != os.path.normpath(dst_path):
-                                shutil.copy2(src_path, dst_path)
-                                copied_images.append(src_path)
-                                print(f"已複製圖片: {src_path} -> {dst_path}")
-                        except Exception as e:
-                            print(f"複製圖片時出錯: {e}")
-                    else:
-                        print(f"圖片源文件不存在: {src_path}")
-        
-        # 處理images中的圖片
-        for img_info in data.get("images", []):
-            if "image_path" in img_info:
+    # 更新JSON中的圖片路徑，指向圖片存儲中的文件（或複製後的新位置）
+    copied_images = []
+    
+    # 處理text_data中的圖片
+    for page_idx, page in enumerate(data.get("text_data", [])):
+        for block_idx, block in enumerate(page.get("blocks", [])):
+            if block.get("type") in ["image", "figure"]:
                 # 獲取或設置圖片路徑
-                image_path = img_info.get("image_path", "")
+                image_path = block.get("image_path", "")
                 
-                # 如果路徑為空，繼續下一個
+                # 如果路徑為空，嘗試設置一個默認路徑
                 if not image_path:
-                    continue
+                    basename = os.path.splitext(os.path.basename(json_path))[0]
+                    default_image_name = f"{basename}_page{page_idx+1}_img{block_idx+1}.png"
+                    
+                    # 嘗試在可用圖片中查找匹配的文件
+                    for img in available_images:
+                        if default_image_name in img:
+                            image_path = img
+                            block["image_path"] = image_path
+                            print(f"為空路徑找到匹配圖片: {image_path}")
+                            break
+                else:
+                    # 嘗試修正現有路徑
+                    matched_path = find_matching_image(source_base_dir, image_path)
+                    if matched_path and matched_path != image_path:
+                        image_path = matched_path
+                        block["image_path"] = matched_path
+                        print(f"修正圖片路徑: {image_path} -> {matched_path}")
                 
-                # 嘗試修正現有路徑
-                matched_path = find_matching_image(source_base_dir, image_path)
-                if matched_path and matched_path != image_path:
-                    image_path = matched_path
-                    img_info["image_path"] = matched_path
-                    print(f"修正圖片路徑: {image_path} -> {matched_path}")
+                if not image_path:
+                    print(f"警告: 頁面 {page_idx+1} 的塊 {block_idx} 未找到有效圖片路徑")
+                    continue
                 
                 # 源圖片路徑
                 src_path = os.path.join(source_base_dir, image_path)
                 
+                # 默認直接引用存儲中的圖片，不再複製
+                if not copy_images:
+                    block["image_path"] = os.path.relpath(src_path, output_dir)
+                    continue
+                
                 # 獲取圖片文件名
                 image_filename = os.path.basename(image_path)
                 
@@ -284,7 +242,7 @@ def create_toggle_html(json_path, output_path=None, copy_images=True):
                 
                 # 更新JSON中的圖片路徑
                 relative_dst_path = os.path.join("output_images", image_filename)
-                img_info["image_path"] = relative_dst_path
+                block["image_path"] = relative_dst_path
                 
                 # 確保目標目錄存在
                 os.makedirs(os.path.dirname(dst_path), exist_ok=True)
@@ -302,6 +260,57 @@ def create_toggle_html(json_path, output_path=None, copy_images=True):
                 else:
                     print(f"圖片源文件不存在: {src_path}")
     
+    # 處理images中的圖片
+    for img_info in data.get("images", []):
+        if "image_path" in img_info:
+            # 獲取或設置圖片路徑
+            image_path = img_info.get("image_path", "")
+            
+            # 如果路徑為空，繼續下一個
+            if not image_path:
+                continue
+            
+            # 嘗試修正現有路徑
+            matched_path = find_matching_image(source_base_dir, image_path)
+            if matched_path and matched_path != image_path:
+                image_path = matched_path
+                img_info["image_path"] = matched_path
+                print(f"修正圖片路徑: {image_path} -> {matched_path}")
+            
+            # 源圖片路徑
+            src_path = os.path.join(source_base_dir, image_path)
+            
+            # 默認直接引用存儲中的圖片，不再複製
+            if not copy_images:
+                img_info["image_path"] = os.path.relpath(src_path, output_dir)
+                continue
+            
+            # 獲取圖片文件名
+            image_filename = os.path.basename(image_path)
+            
+            # 新的目標路徑
+            dst_path = os.path.join(images_dir, image_filename)
+            
+            # 更新JSON中的圖片路徑
+            relative_dst_path = os.path.join("output_images", image_filename)
+            img_info["image_path"] = relative_dst_path
+            
+            # 確保目標目錄存在
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            
+            # 複製圖片
+            if os.path.exists(src_path):
+                try:
+                    # 檢查是否需要複製（避免源和目標相同）
+                    if os.path.normpath(src_path) != os.path.normpath(dst_path):
+                        shutil.copy2(src_path, dst_path)
+                        copied_images.append(src_path)
+                        print(f"已複製圖片: {src_path} -> {dst_path}")
+                except Exception as e:
+                    print(f"複製圖片時出錯: {e}")
+            else:
+                print(f"圖片源文件不存在: {src_path}")
+
     # 創建 HTML 內容
     html = """<!DOCTYPE html>
 <html>
@@ -871,10 +880,10 @@ def main():
     parser = argparse.ArgumentParser(description="創建原文/翻譯切換查看 HTML")
     parser.add_argument("json_file", help="翻譯數據 JSON 文件路徑")
     parser.add_argument("--output", "-o", help="輸出 HTML 文件路徑")
-    parser.add_argument("--no-copy-images", action="store_true", help="不複製圖片文件")
+    parser.add_argument("--copy-images", action="store_true", help="複製圖片文件到輸出目錄（默認直接引用圖片存儲）")
     args = parser.parse_args()
     
-    create_toggle_html(args.json_file, args.output, not args.no_copy_images)
+    create_toggle_html(args.json_file, args.output, args.copy_images)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+
+class ImageStore:
+    """內容尋址的圖片存儲
+
+    圖片按內容的SHA-256保存為 blobs/<前兩位>/<哈希>.<擴展名>，相同內容只保存一次
+    （例如每篇論文都重複出現的出版商標誌）。清單文件把邏輯名稱
+    （"<PDF名>/page<頁碼>_img<編號>" 或 "<PDF名>/page<頁碼>_fig<塊索引>"）
+    映射到存儲中的文件，輸出只引用這些文件而不再複製。
+    """
+
+    MANIFEST_FILENAME = "manifest.json"
+
+    def __init__(self, root_dir):
+        """初始化圖片存儲
+
+        Args:
+            root_dir: 存儲根目錄（通常是translated_pdfs/images）
+        """
+        self.root_dir = root_dir
+        self.blobs_dir = os.path.join(root_dir, "blobs")
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+        # 同一文檔內按xref去重: {(文檔鍵, xref): 存儲路徑}
+        self._xref_index = {}
+
+        # 統計
+        self.blobs_written = 0
+        self.blobs_reused = 0
+
+    def blob_path(self, digest, ext):
+        """根據哈希和擴展名得到存儲文件的相對路徑（相對於root_dir）"""
+        return os.path.join("blobs", digest[:2], f"{digest}.{ext}")
+
+    def put_bytes(self, data, ext):
+        """保存圖片數據，內容已存在時不重複寫入
+
+        Args:
+            data: 圖片字節數據
+            ext: 圖片擴展名
+
+        Returns:
+            存儲文件的相對路徑（相對於root_dir）
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        rel_path = self.blob_path(digest, ext)
+        full_path = os.path.join(self.root_dir, rel_path)
+
+        if os.path.exists(full_path):
+            self.blobs_reused += 1
+            return rel_path
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        # 原子替換，並行工作進程寫入同一內容時不會互相破壞
+        os.replace(tmp_path, full_path)
+
+        self.blobs_written += 1
+        return rel_path
+
+    def lookup_xref(self, doc_key, xref):
+        """查詢同一文檔中已保存過的xref，返回存儲路徑或None"""
+        return self._xref_index.get((doc_key, xref))
+
+    def remember_xref(self, doc_key, xref, rel_path):
+        """記錄同一文檔中xref對應的存儲路徑"""
+        self._xref_index[(doc_key, xref)] = rel_path
+
+    def load_manifest(self):
+        """讀取清單文件
+
+        Returns:
+            {邏輯名稱: 存儲路徑}
+        """
+        manifest_path = os.path.join(self.root_dir, self.MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"讀取圖片清單時出錯: {e}")
+            return {}
+
+    def update_manifest(self, entries):
+        """合併並保存清單條目
+
+        Args:
+            entries: {邏輯名稱: 存儲路徑}
+        """
+        if not entries:
+            return
+
+        manifest = self.load_manifest()
+        manifest.update(entries)
+
+        manifest_path = os.path.join(self.root_dir, self.MANIFEST_FILENAME)
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+    @staticmethod
+    def logical_name(pdf_basename, page_num, kind, index):
+        """生成清單中的邏輯名稱，例如 "paper/page3_img2" 或 "paper/page3_fig7" """
+        return f"{pdf_basename}/page{page_num}_{kind}{index}"
@@ -1,13 +1,27 @@
 import os
 import json
+import asyncio
 import argparse
 import logging
 from tqdm import tqdm
-from .pdf_processor import PDFProcessor
+from .pdf_processor import PDFProcessor, PARSER_VERSION
 from .terminology_rag import TerminologyRAG
-from .claude_translator import ClaudeTranslator
+from .claude_translator import ClaudeTranslator, PROMPT_VERSION
+from .parse_cache import ParseCache
+from .block_store import BlockStore
+from .page_fingerprints import PageFingerprintStore
+from .pdf_source import PDFSource, open_fitz
+from .translation_memory import TranslationMemory
+from .fuzzy_memory import FuzzyMemory
+from .rate_limiter import RateLimiter
+from .batch_translator import BatchTranslator
+from .retry_policy import RetryPolicy, CircuitBreaker, FailureLog
+from .block_triage import BlockTriage
+from .page_furniture import PageFurnitureDetector
+from .image_store import ImageStore
 import time
 from pathlib import Path
+from collections.abc import Mapping
 import fitz  # PyMuPDF
 
 # 配置日誌
@@ -33,10 +47,90 @@ class PDFTranslationSystem:
         # 載入配置
         self.config = self._load_config(config)
         
+        # 解析緩存
+        parse_cache = None
+        if self.config.get("parse_cache", True):
+            parse_cache = ParseCache(
+                cache_dir=self.config.get("parse_cache_dir", ".cache/parse"),
+                max_size_mb=self.config.get("parse_cache_max_mb", 512)
+            )
+        
         # 初始化組件
-        self.pdf_processor = PDFProcessor(pdf_dir=self.config.get("pdf_dir", "raw_pdfs"))
+        self.pdf_processor = PDFProcessor(
+            pdf_dir=self.config.get("pdf_dir", "raw_pdfs"),
+            parse_workers=self.config.get("parse_workers", 1),
+            parse_chunk_size=self.config.get("parse_chunk_size", 8),
+            parse_cache=parse_cache,
+            formula_thresholds=self.config.get("formula_thresholds"),
+            figure_dpi=self.config.get("figure_dpi", 144),
+            figure_format=self.config.get("figure_format", "png"),
+            figure_workers=self.config.get("figure_workers", 1),
+            table_screening=self.config.get("table_screening", True),
+            compact_blocks=self.config.get("compact_blocks", True),
+            ocr_enabled=self.config.get("ocr_enabled", True),
+            ocr_lang=self.config.get("ocr_lang", "eng"),
+            ocr_dpi=self.config.get("ocr_dpi", 300),
+            ocr_workers=self.config.get("ocr_workers", 1),
+            ocr_min_chars=self.config.get("ocr_min_chars", 20),
+            ocr_cache_dir=self.config.get("ocr_cache_dir", ".cache/ocr")
+        )
+        self.block_triage = BlockTriage() if self.config.get("block_triage", True) else None
+        self.furniture_detector = PageFurnitureDetector(
+            min_pages=self.config.get("furniture_min_pages", 3)
+        ) if self.config.get("detect_furniture", True) else None
         self.terminology_rag = TerminologyRAG(embedding_model=self.config.get("embedding_model", "paraphrase-multilingual-MiniLM-L12-v2"))
-        self.translator = ClaudeTranslator(model=self.config.get("claude_model", "claude-3-7-sonnet-20250219"))
+        # 持久化翻譯記憶
+        translation_memory = None
+        if self.config.get("translation_memory", True):
+            translation_memory = TranslationMemory(
+                db_path=self.config.get("translation_memory_path", ".cache/translation_memory.sqlite"),
+                max_entries=self.config.get("translation_memory_max_entries", 200000),
+                max_age_days=self.config.get("translation_memory_max_age_days", 180)
+            )
+        # 模糊翻譯記憶，從持久化翻譯記憶載入已有譯文建立近似重複索引
+        fuzzy_memory = None
+        if self.config.get("fuzzy_memory", True):
+            fuzzy_memory = FuzzyMemory(
+                reuse_threshold=self.config.get("fuzzy_reuse_threshold", 0.95),
+                reference_threshold=self.config.get("fuzzy_reference_threshold", 0.7),
+                min_chars=self.config.get("fuzzy_min_chars", 60),
+                max_entries=self.config.get("fuzzy_max_entries", 100000)
+            )
+        # 同一API密鑰的所有調用共用一個限速器
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=self.config.get("rate_limit_requests_per_minute", 50),
+            input_tokens_per_minute=self.config.get("rate_limit_input_tokens_per_minute", 20000),
+            output_tokens_per_minute=self.config.get("rate_limit_output_tokens_per_minute", 8000)
+        )
+        # 重試、退避和斷路器，重試後仍失敗的單元記錄到失敗記錄中
+        self.retry_policy = RetryPolicy(
+            max_retries=self.config.get("retry_max_retries", 5),
+            base_delay=self.config.get("retry_base_delay", 1.0),
+            max_delay=self.config.get("retry_max_delay", 60.0),
+            breaker=CircuitBreaker(
+                failure_threshold=self.config.get("circuit_breaker_threshold", 5),
+                cooldown=self.config.get("circuit_breaker_cooldown", 30.0)
+            )
+        )
+        self.failure_log = FailureLog(self.config.get("failures_path", ".cache/translation_failures.json"))
+        self.translator = ClaudeTranslator(
+            model=self.config.get("claude_model", "claude-3-7-sonnet-20250219"),
+            translation_memory=translation_memory,
+            max_concurrency=self.config.get("max_concurrency", 8),
+            rate_limiter=self.rate_limiter,
+            pack_segments=self.config.get("pack_segments", True),
+            pack_token_budget=self.config.get("pack_token_budget", 3000),
+            pack_max_segments=self.config.get("pack_max_segments", 40),
+            base_url=self.config.get("api_base_url"),
+            retry_policy=self.retry_policy,
+            failure_log=self.failure_log,
+            output_token_budget=self.config.get("output_token_budget", 8000),
+            fuzzy_memory=fuzzy_memory
+        )
+        # 模糊翻譯記憶只載入當前模型和提示模板版本的譯文
+        if fuzzy_memory is not None and translation_memory is not None:
+            loaded = fuzzy_memory.load(translation_memory, self.translator.model, PROMPT_VERSION)
+            logger.info(f"模糊翻譯記憶已載入 {loaded} 條譯文")
         
         # 輸出目錄
         self.output_dir = self.config.get("output_dir", "translated_pdfs")
@@ -53,7 +147,57 @@ class PDFTranslationSystem:
             "terminology_dir": "terminology",
             "embedding_model": "paraphrase-multilingual-MiniLM-L12-v2",
             "claude_model": "claude-3-7-sonnet-20250219",
-            "default_domain": "general"
+            "default_domain": "general",
+            "parse_workers": 1,
+            "parse_chunk_size": 8,
+            "stream_pages": False,
+            "parse_cache": True,
+            "parse_cache_dir": ".cache/parse",
+            "parse_cache_max_mb": 512,
+            "formula_thresholds": {"min_symbols": 1, "min_indicators": 4, "max_length": 100},
+            "figure_dpi": 144,
+            "figure_format": "png",
+            "figure_workers": 1,
+            "table_screening": True,
+            "compact_blocks": True,
+            "ocr_enabled": True,
+            "ocr_lang": "eng",
+            "ocr_dpi": 300,
+            "ocr_workers": 1,
+            "ocr_min_chars": 20,
+            "ocr_cache_dir": ".cache/ocr",
+            "block_triage": True,
+            "mmap_input": True,
+            "translation_memory": True,
+            "translation_memory_path": ".cache/translation_memory.sqlite",
+            "translation_memory_max_entries": 200000,
+            "translation_memory_max_age_days": 180,
+            "fuzzy_memory": True,
+            "fuzzy_reuse_threshold": 0.95,
+            "fuzzy_reference_threshold": 0.7,
+            "fuzzy_min_chars": 60,
+            "fuzzy_max_entries": 100000,
+            "detect_furniture": True,
+            "furniture_min_pages": 3,
+            "max_concurrency": 8,
+            "rate_limit_requests_per_minute": 50,
+            "rate_limit_input_tokens_per_minute": 20000,
+            "rate_limit_output_tokens_per_minute": 8000,
+            "pack_segments": True,
+            "pack_token_budget": 3000,
+            "pack_max_segments": 40,
+            "output_token_budget": 8000,
+            "api_base_url": None,
+            "batch_state_path": ".cache/batches/state.json",
+            "batch_poll_interval": 60,
+            "batch_max_requests": 10000,
+            "retry_max_retries": 5,
+            "retry_base_delay": 1.0,
+            "retry_max_delay": 60.0,
+            "circuit_breaker_threshold": 5,
+            "circuit_breaker_cooldown": 30.0,
+            "failures_path": ".cache/translation_failures.json",
+            "incremental": True
         }
         
         if config is None:
@@ -113,21 +257,44 @@ class PDFTranslationSystem:
         if not loaded:
             logger.warning(f"在 {terminology_dir} 中沒有找到有效的術語文件")
     
-    def process_pdf(self, pdf_filename):
+    def process_pdf(self, pdf_filename, pdf_data=None):
         """處理單個PDF文件 - 增強版
         
         Args:
             pdf_filename: PDF文件名（不含路徑）
+            pdf_data: 內存中的PDF數據（bytes、memoryview或mmap，例如網絡上傳的文檔），
+                      提供時不讀取pdf_dir中的文件
                 
         Returns:
             處理結果
         """
         pdf_path = os.path.join(self.config["pdf_dir"], pdf_filename)
         
-        if not os.path.exists(pdf_path):
+        if pdf_data is not None:
+            pdf_path = PDFSource(pdf_data, pdf_path)
+        elif not os.path.exists(pdf_path):
             logger.error(f"文件不存在: {pdf_path}")
             return None
+        elif self.config.get("mmap_input", True):
+            # 文件只映射一次，指紋計算、解析和生成PDF共用
+            pdf_path = PDFSource.from_file(pdf_path)
         
+        try:
+            return self._process_pdf_source(pdf_path, pdf_filename)
+        finally:
+            if isinstance(pdf_path, PDFSource):
+                pdf_path.close()
+    
+    def _process_pdf_source(self, pdf_path, pdf_filename):
+        """處理單個PDF文件
+        
+        Args:
+            pdf_path: PDF文件路徑或PDFSource
+            pdf_filename: PDF文件名（不含路徑）
+                
+        Returns:
+            處理結果
+        """
         # 創建明確的輸出目錄結構
         output_dir = self.output_dir
         images_dir = os.path.join(output_dir, "images")
@@ -138,45 +305,59 @@ class PDFTranslationSystem:
         logger.info(f"輸出目錄: {output_dir}")
         logger.info(f"圖片目錄: {images_dir}")
         
-        # 第一步：解析PDF
-        logger.info(f"解析PDF: {pdf_filename}")
-        pdf_data = self.pdf_processor.process_pdf(pdf_path)
+        # 流式模式：逐頁解析、翻譯和輸出，內存不隨文檔長度增長
+        if self.config.get("stream_pages", False):
+            return self._process_pdf_streaming(pdf_path, pdf_filename)
         
-        # 新增步驟：專門提取圖片
-        logger.info(f"提取圖片: {pdf_filename}")
-        images = self.pdf_processor.extract_images(pdf_path)
-        pdf_data["images"] = images
+        json_output = os.path.join(self.output_dir, f"{os.path.splitext(pdf_filename)[0]}_translation_data.json")
         
-        # 新增步驟：專門提取表格
-        logger.info(f"提取表格: {pdf_filename}")
-        tables = self.pdf_processor.extract_tables(pdf_path)
+        # 增量處理：與上次運行的頁面指紋比較，未改變的頁面沿用上次的解析和翻譯結果
+        fingerprint_store = None
+        reused_pages = {}
+        if self.config.get("incremental", True):
+            fingerprint_store = PageFingerprintStore(json_output)
+            fingerprints = PageFingerprintStore.compute(pdf_path)
+            incremental_settings = self._incremental_settings()
+            reused_pages = self._load_reused_pages(fingerprint_store, fingerprints, incremental_settings)
         
-        # 按頁面組織表格數據
-        table_data = []
-        max_page = max([table["page_num"] for table in tables], default=0)
-        for page_num in range(1, max_page + 1):
-            page_tables = [table for table in tables if table["page_num"] == page_num]
-            if page_tables:
-                table_data.append({
-                    "page_num": page_num,
-                    "tables": page_tables
-                })
-        pdf_data["table_data"] = table_data
+        # 第一步：解析PDF（單次遍歷提取文本、圖片和表格）
+        logger.info(f"解析PDF: {pdf_filename}")
+        if reused_pages:
+            changed_pages = [page_idx for page_idx in range(len(fingerprints)) if page_idx not in reused_pages]
+            pdf_data = self.pdf_processor.process_pages(pdf_path, changed_pages)
+        else:
+            pdf_data = self.pdf_processor.process_pdf(pdf_path)
         
         # 第二步：確定文檔領域
         domain = self.config.get("default_domain", "general")
         
-        # 第三步：翻譯文檔
+        # 第三步：翻譯文檔（增量處理時只翻譯改變的頁面）
         logger.info(f"開始翻譯: {pdf_filename}")
-        translated_data = self._translate_document(pdf_data, domain)
+        self.failure_log.document = pdf_filename
+        context_pages = [page["text_page"] for page in reused_pages.values()]
+        translated_data = self._translate_document(pdf_data, domain, context_pages)
+        new_failures = self.failure_log.document_failures()
+        if reused_pages:
+            translated_data = self._merge_reused_pages(translated_data, reused_pages)
+        
+        pages_total = len(translated_data["text_data"])
+        pages_reused = len(reused_pages)
+        logger.info(f"頁面處理: 沿用上次結果 {pages_reused} 頁，重新計算 {pages_total - pages_reused} 頁")
         
         # 第四步：保存翻譯數據
-        json_output = os.path.join(self.output_dir, f"{os.path.splitext(pdf_filename)[0]}_translation_data.json")
         with open(json_output, 'w', encoding='utf-8') as f:
             # 移除無法序列化的部分
             serializable_data = self._prepare_for_serialization(translated_data)
             json.dump(serializable_data, f, ensure_ascii=False, indent=2)
         
+        if fingerprint_store is not None:
+            if new_failures > 0:
+                # 有單元翻譯失敗時不記錄指紋，下次運行不會沿用帶空缺的頁面
+                logger.warning(f"{new_failures} 個單元翻譯失敗，已記錄到 {self.failure_log.path}，可使用 --retry-failures 只重新翻譯這些單元")
+                fingerprint_store.clear()
+            else:
+                fingerprint_store.save(fingerprints, incremental_settings)
+        
         # 第五步：修復圖片路徑
         try:
             from .fix_image_paths import fix_image_paths
@@ -208,11 +389,14 @@ class PDFTranslationSystem:
         logger.info(f"提取的表格頁數: {table_pages}")
         logger.info(f"提取的表格數量: {table_count}")
         
-        # 檢查圖片文件
+        # 檢查圖片存儲（圖片內容按哈希保存在images/blobs和images/renders，清單記錄邏輯名稱到存儲路徑的映射）
         images_dir = os.path.join(self.output_dir, "images")
         if os.path.exists(images_dir):
-            image_files = len([f for f in os.listdir(images_dir) if f.endswith(('.png', '.jpg', '.jpeg', '.gif'))])
-            logger.info(f"圖片目錄中的文件數量: {image_files}")
+            manifest = ImageStore(images_dir).load_manifest()
+            prefix = f"{os.path.splitext(pdf_filename)[0]}/"
+            entries = {name: path for name, path in manifest.items() if name.startswith(prefix)}
+            logger.info(f"圖片清單中本文檔的條目數: {len(entries)}（共 {len(set(entries.values()))} 個存儲文件）")
+            logger.info(f"圖片清單的條目總數: {len(manifest)}")
         
         logger.info("=== 診斷結束 ===\n")
         
@@ -220,16 +404,247 @@ class PDFTranslationSystem:
             "original_pdf": pdf_filename,
             "translated_pdf": f"translated_{pdf_filename}",
             "translation_data": json_output,
+            "pages_reused": pages_reused,
+            "pages_recomputed": pages_total - pages_reused,
             "image_count": image_count,
             "table_count": table_count
         }
     
-    def _translate_document(self, pdf_data, domain):
+    def _incremental_settings(self):
+        """影響解析和翻譯結果的設置，任一項改變時不沿用上次的頁面結果"""
+        return {
+            "parser_version": PARSER_VERSION,
+            "formula_classifier": self.pdf_processor.formula_classifier.fingerprint(),
+            "figure": f"{self.pdf_processor.figure_dpi}{self.pdf_processor.figure_format}",
+            "table_screening": self.pdf_processor.table_screening,
+            "ocr": self.pdf_processor._ocr_fingerprint(),
+            "model": self.translator.model,
+            "domain": self.config.get("default_domain", "general"),
+            "block_triage": self.block_triage is not None,
+            "furniture": self.furniture_detector.min_pages if self.furniture_detector is not None else None
+        }
+    
+    def _load_reused_pages(self, fingerprint_store, fingerprints, settings):
+        """從上次的翻譯數據中取出指紋未改變的頁面
+        
+        Args:
+            fingerprint_store: PageFingerprintStore
+            fingerprints: 本次計算的頁面指紋
+            settings: 本次的設置
+            
+        Returns:
+            {本次頁面索引: 頁面數據}，頁面數據包含text_page、tables、images、
+            table_screening和primary_language，頁碼已改為本次的頁碼
+        """
+        matches = fingerprint_store.match(fingerprints, settings)
+        if not matches or not os.path.exists(fingerprint_store.json_output):
+            return {}
+        
+        try:
+            with open(fingerprint_store.json_output, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except Exception as e:
+            logger.warning(f"讀取上次的翻譯數據失敗，完整重新處理: {str(e)}")
+            return {}
+        
+        def by_page(items):
+            grouped = {}
+            for item in items or []:
+                grouped.setdefault(item.get("page_num"), []).append(item)
+            return grouped
+        
+        text_pages = {page.get("page_num"): page for page in previous.get("text_data", [])}
+        table_pages = {page.get("page_num"): page.get("tables", []) for page in previous.get("table_data", [])}
+        images = by_page(previous.get("images"))
+        screenings = {item.get("page_num"): item for item in previous.get("table_screening", [])}
+        
+        reused_pages = {}
+        for page_idx, previous_idx in matches.items():
+            previous_num = previous_idx + 1
+            if previous_num not in text_pages:
+                continue
+            
+            page_images = images.get(previous_num, [])
+            # 上次的圖片文件已被刪除時重新提取該頁
+            if not all(os.path.exists(os.path.join(self.output_dir, img["image_path"]))
+                       for img in page_images if img.get("image_path")):
+                continue
+            
+            page_num = page_idx + 1
+            reused_pages[page_idx] = {
+                "text_page": self._renumber_page(text_pages[previous_num], page_num),
+                "tables": [self._renumber_page(table, page_num) for table in table_pages.get(previous_num, [])],
+                "images": [self._renumber_page(img, page_num) for img in page_images],
+                "table_screening": self._renumber_page(screenings[previous_num], page_num) if previous_num in screenings else None,
+                "primary_language": previous.get("primary_language", "unknown")
+            }
+        
+        return reused_pages
+    
+    def _renumber_page(self, item, page_num):
+        """複製頁面數據並把其中的頁碼改為page_num"""
+        item = dict(item, page_num=page_num)
+        if "blocks" in item:
+            item["blocks"] = [dict(block, page_num=page_num) if "page_num" in block else block for block in item["blocks"]]
+        return item
+    
+    def _merge_reused_pages(self, translated_data, reused_pages):
+        """把沿用的頁面合併到本次翻譯結果中，按頁碼排序"""
+        merged = dict(translated_data)
+        page_key = lambda item: item["page_num"]
+        
+        merged["text_data"] = sorted(
+            list(translated_data["text_data"]) + [page["text_page"] for page in reused_pages.values()],
+            key=page_key
+        )
+        merged["table_data"] = sorted(
+            list(translated_data.get("table_data", [])) + [
+                {"page_num": page_idx + 1, "tables": page["tables"]}
+                for page_idx, page in reused_pages.items() if page["tables"]
+            ],
+            key=page_key
+        )
+        merged["images"] = sorted(
+            list(translated_data.get("images", [])) + [img for page in reused_pages.values() for img in page["images"]],
+            key=page_key
+        )
+        merged["table_screening"] = sorted(
+            list(translated_data.get("table_screening", [])) + [
+                page["table_screening"] for page in reused_pages.values() if page["table_screening"]
+            ],
+            key=page_key
+        )
+        
+        # 改變的頁面中沒有正文時沿用上次檢測的語言
+        if merged.get("primary_language", "unknown") == "unknown":
+            merged["primary_language"] = next(iter(reused_pages.values()))["primary_language"]
+        
+        return merged
+    
+    def _process_pdf_streaming(self, pdf_path, pdf_filename):
+        """逐頁處理PDF文件（流式模式）
+        
+        通過PDFProcessor.iter_pages逐頁取得解析結果，翻譯後立即寫入翻譯數據JSON
+        和翻譯PDF，每頁處理完即釋放，適合上千頁的掃描文檔。
+        
+        Args:
+            pdf_path: PDF文件路徑或PDFSource
+            pdf_filename: PDF文件名（不含路徑）
+            
+        Returns:
+            處理結果
+        """
+        domain = self.config.get("default_domain", "general")
+        terminology_db = self._get_terminology_db()
+        
+        json_output = os.path.join(self.output_dir, f"{os.path.splitext(pdf_filename)[0]}_translation_data.json")
+        output_path = os.path.join(self.output_dir, f"translated_{pdf_filename}")
+        
+        # 表格、圖片和表格預篩選信息只包含元數據，體積很小，累積到最後一起寫出
+        table_data = []
+        images = []
+        table_screening = []
+        language_sample = ""
+        page_count = 0
+        
+        if self.block_triage is not None:
+            self.block_triage.reset()
+        if self.furniture_detector is not None:
+            self.furniture_detector.reset()
+        
+        self.failure_log.document = pdf_filename
+        logger.info(f"流式解析並翻譯: {pdf_filename}")
+        src_doc = open_fitz(pdf_path)
+        dst_doc = fitz.open()
+        
+        with open(json_output, 'w', encoding='utf-8') as f:
+            f.write('{\n  "filename": ' + json.dumps(pdf_filename, ensure_ascii=False) + ',\n  "text_data": [')
+            
+            for page in tqdm(self.pdf_processor.iter_pages(pdf_path), desc="翻譯頁面"):
+                page_idx = page["page_num"] - 1
+                
+                # 取樣前1000個字符用於語言檢測
+                if len(language_sample) < 1000:
+                    for block in page["blocks"]:
+                        if block["type"] == "text":
+                            language_sample += block["content"] + " "
+                
+                if self.block_triage is not None:
+                    self.block_triage.triage_page(page["blocks"])
+                if self.furniture_detector is not None:
+                    self.furniture_detector.tag_page(page["page_num"], page["blocks"])
+                
+                # 本頁的文本塊、表格和圖片文字並發翻譯
+                translated_blocks, translated_tables, translated_images = self.translator.run_concurrently([
+                    self._translate_page_blocks(page["blocks"], terminology_db, domain),
+                    self._translate_tables(page["tables"], terminology_db, domain),
+                    self._translate_images(page["images"])
+                ])
+                
+                translated_page = {
+                    "page_num": page["page_num"],
+                    "blocks": translated_blocks
+                }
+                
+                if page["tables"]:
+                    table_data.append({
+                        "page_num": page["page_num"],
+                        "tables": translated_tables
+                    })
+                images.extend(translated_images)
+                table_screening.append(page["table_screening"])
+                
+                # 寫入本頁的翻譯數據
+                if page_count:
+                    f.write(',')
+                f.write('\n    ' + json.dumps(self._prepare_for_serialization(translated_page), ensure_ascii=False))
+                
+                # 寫入本頁的翻譯PDF
+                src_page = src_doc[page_idx]
+                dst_page = dst_doc.new_page(width=src_page.rect.width, height=src_page.rect.height * 2)
+                try:
+                    self._render_translated_page(src_doc, dst_page, page_idx, translated_page)
+                except Exception as e:
+                    logger.error(f"生成第 {page['page_num']} 頁PDF時出錯: {str(e)}")
+                
+                page_count += 1
+            
+            primary_language = self.pdf_processor.detect_language(language_sample[:1000]) if language_sample else "unknown"
+            
+            f.write('\n  ],\n')
+            f.write('  "table_data": ' + json.dumps(table_data, ensure_ascii=False) + ',\n')
+            f.write('  "images": ' + json.dumps(images, ensure_ascii=False) + ',\n')
+            f.write('  "table_screening": ' + json.dumps(table_screening, ensure_ascii=False) + ',\n')
+            f.write('  "primary_language": ' + json.dumps(primary_language) + '\n}\n')
+        
+        try:
+            dst_doc.save(output_path)
+            logger.info(f"已生成翻譯PDF: {output_path}")
+        except Exception as e:
+            logger.error(f"生成PDF時出錯: {str(e)}")
+        finally:
+            dst_doc.close()
+            src_doc.close()
+        
+        # 圖片路徑在解析時已是圖片存儲中的路徑，不再調用fix_image_paths（它會把整個JSON讀入內存）
+        table_count = sum(len(page["tables"]) for page in table_data)
+        logger.info(f"流式處理完成: {pdf_filename}，共 {page_count} 頁")
+        
+        return {
+            "original_pdf": pdf_filename,
+            "translated_pdf": f"translated_{pdf_filename}",
+            "translation_data": json_output,
+            "image_count": len(images),
+            "table_count": table_count
+        }
+    
+    def _translate_document(self, pdf_data, domain, context_pages=()):
         """翻譯文檔內容
         
         Args:
             pdf_data: PDF解析數據
             domain: 文檔領域
+            context_pages: 沿用上次結果、不重新翻譯的頁面（只用於頁眉頁腳檢測）
             
         Returns:
             翻譯後的數據
@@ -238,49 +653,102 @@ class PDFTranslationSystem:
         translated_data = pdf_data.copy()
         
         # 獲取術語資料庫（如果有）
-        terminology_db = self.terminology_rag.terminology_db if hasattr(self.terminology_rag, "terminology_db") else None
+        terminology_db = self._get_terminology_db()
         
-        # 處理每一頁
-        for page_idx, page in enumerate(tqdm(pdf_data["text_data"], desc="翻譯頁面")):
-            # 翻譯文本塊
+        self._mark_blocks(pdf_data, context_pages)
+        
+        # 整份文檔的文本塊、表格和圖片文字一起並發翻譯，
+        # 結果按提交順序返回，再按記錄的位置放回
+        coroutines = []
+        targets = []
+        for page_idx, page in enumerate(pdf_data["text_data"]):
             if "blocks" in page:
-                translated_blocks = self.translator.translate_document_section(
-                    page["blocks"],
-                    terminology_db,
-                    domain
-                )
-                translated_data["text_data"][page_idx]["blocks"] = translated_blocks
-        
-        # 處理表格
+                coroutines.append(self._translate_page_blocks(page["blocks"], terminology_db, domain))
+                targets.append((translated_data["text_data"][page_idx], "blocks"))
+        
         for page_idx, page in enumerate(pdf_data["table_data"]):
             if "tables" in page and page["tables"]:
-                translated_tables = []
-                for table in page["tables"]:
-                    translated_table = self.translator.translate_table(table)
-                    translated_tables.append(translated_table)
-                translated_data["table_data"][page_idx]["tables"] = translated_tables
-        
-        # 處理圖像中的文字
-        for img_idx, img_info in enumerate(pdf_data["images"]):
-            if "text_in_image" in img_info and img_info["text_in_image"]:
-                text_in_image = img_info["text_in_image"]
-                translated_text = self.translator.translate_image_text(text_in_image)
-                translated_data["images"][img_idx]["text_in_image_translated"] = translated_text
+                coroutines.append(self._translate_tables(page["tables"], terminology_db, domain))
+                targets.append((translated_data["table_data"][page_idx], "tables"))
+        
+        coroutines.append(self._translate_images(pdf_data["images"]))
+        targets.append((translated_data, "images"))
+        
+        results = self.translator.run_concurrently(coroutines, desc="翻譯頁面")
+        for (target, key), result in zip(targets, results):
+            target[key] = result
         
         return translated_data
     
+    def _mark_blocks(self, pdf_data, context_pages=()):
+        """翻譯前標記文本塊：分流標籤和頁眉頁腳
+        
+        Args:
+            pdf_data: PDF解析數據（增量處理時只包含改變的頁面）
+            context_pages: 沿用上次結果的頁面，與改變的頁面一起聚類頁眉頁腳
+        """
+        # 分流：不需要翻譯的塊（數字、標識符、中文、參考文獻等）不發送到API
+        if self.block_triage is not None:
+            counts = self.block_triage.triage_pages(pdf_data["text_data"])
+            logger.info(f"文本塊分流: 翻譯 {counts['translate']}，原樣保留 {counts['copy']}，參考文獻 {counts['reference']}")
+        
+        # 跨頁重複的頁眉頁腳：每類只翻譯一次，不與正文合併
+        if self.furniture_detector is not None:
+            furniture = self.furniture_detector.detect(pdf_data["text_data"], context_pages)
+            tagged = sum(len(page_nums) for page_nums in furniture.values())
+            logger.info(f"頁眉頁腳檢測: {len(furniture)} 類，共 {tagged} 頁次")
+    
+    def _get_terminology_db(self):
+        """獲取術語資料庫（如果有）"""
+        return self.terminology_rag.terminology_db if hasattr(self.terminology_rag, "terminology_db") else None
+    
+    async def _translate_page_blocks(self, blocks, terminology_db, domain):
+        """翻譯單頁的文本塊"""
+        return await self.translator.atranslate_document_section(blocks, terminology_db, domain)
+    
+    async def _translate_tables(self, tables, terminology_db, domain):
+        """翻譯表格數據和表格標題
+        
+        Args:
+            tables: 表格信息列表
+            terminology_db: 術語資料庫
+            domain: 文檔領域
+            
+        Returns:
+            添加了data_translated和caption_translated的表格列表
+        """
+        async def translate_table(table):
+            translated_table = table.copy()
+            if table.get("data"):
+                translated_table["data_translated"] = await self.translator.atranslate_table(table["data"])
+            if table.get("caption"):
+                translated_table["caption_translated"] = await self.translator.atranslate_text(table["caption"], terminology_db, domain)
+            return translated_table
+        
+        return list(await asyncio.gather(*(translate_table(table) for table in tables)))
+    
+    async def _translate_images(self, images):
+        """翻譯圖像中的文字"""
+        async def translate_image(img_info):
+            translated_info = img_info.copy()
+            if "text_in_image" in img_info and img_info["text_in_image"]:
+                translated_info["text_in_image_translated"] = await self.translator.atranslate_image_text(img_info["text_in_image"])
+            return translated_info
+        
+        return list(await asyncio.gather(*(translate_image(img_info) for img_info in images)))
+    
     def _generate_translated_pdf(self, original_pdf_path, translated_data, output_path):
         """生成翻譯後的PDF
         
         Args:
-            original_pdf_path: 原始PDF路徑
+            original_pdf_path: 原始PDF路徑或PDFSource
             translated_data: 翻譯後的數據
             output_path: 輸出PDF路徑
         """
         logger.info(f"生成翻譯後的PDF: {output_path}")
         
         # 使用PyMuPDF生成新的PDF
-        src_doc = fitz.open(original_pdf_path)
+        src_doc = open_fitz(original_pdf_path)
         dst_doc = fitz.open()
         
         # 首先，複製原始PDF的所有頁面
@@ -289,38 +757,7 @@ class PDFTranslationSystem:
         
         # 對每一頁添加翻譯
         for page_idx, page in enumerate(translated_data["text_data"]):
-            # 獲取目標頁面
-            dst_page = dst_doc[page_idx]
-            
-            # 複製原始頁面內容 - 修改這部分代碼
-            src_page = src_doc[page_idx]
-            # 創建一個矩形區域來放置原始頁面內容
-            rect = fitz.Rect(0, 0, dst_page.rect.width, src_page.rect.height)
-            dst_page.show_pdf_page(rect, src_doc, page_idx)
-            
-            # 在下方添加翻譯內容
-            translation_rect = fitz.Rect(0, src_page.rect.height, dst_page.rect.width, dst_page.rect.height)
-            
-            # 添加分隔線
-            dst_page.draw_line(
-                fitz.Point(0, src_page.rect.height),
-                fitz.Point(dst_page.rect.width, src_page.rect.height),
-                color=(0, 0, 0),
-                width=1
-            )
-            
-            # 添加"中文翻譯"標題
-            title_rect = fitz.Rect(10, src_page.rect.height + 10, dst_page.rect.width - 10, src_page.rect.height + 30)
-            dst_page.insert_text(title_rect.tl, "中文翻譯", fontsize=12, color=(0, 0, 0))
-            
-            # 添加翻譯文本
-            text_y = src_page.rect.height + 40
-            for block in page.get("blocks", []):
-                if "content_translated" in block:
-                    text = block["content_translated"]
-                    rect = fitz.Rect(20, text_y, dst_page.rect.width - 20, text_y + 1000)  # 高度足夠大
-                    text_height = dst_page.insert_text(rect, text, fontsize=10, color=(0, 0, 0))
-                    text_y += text_height + 10
+            self._render_translated_page(src_doc, dst_doc[page_idx], page_idx, page)
         
         # 保存新的PDF
         dst_doc.save(output_path)
@@ -329,6 +766,45 @@ class PDFTranslationSystem:
         
         logger.info(f"已生成翻譯PDF: {output_path}")
     
+    def _render_translated_page(self, src_doc, dst_page, page_idx, page):
+        """在目標頁面上方放置原始頁面，下方寫入翻譯內容
+        
+        Args:
+            src_doc: 原始PDF文檔對象
+            dst_page: 目標頁面（高度為原頁面兩倍）
+            page_idx: 頁面索引
+            page: 翻譯後的頁面數據
+        """
+        # 複製原始頁面內容 - 修改這部分代碼
+        src_page = src_doc[page_idx]
+        # 創建一個矩形區域來放置原始頁面內容
+        rect = fitz.Rect(0, 0, dst_page.rect.width, src_page.rect.height)
+        dst_page.show_pdf_page(rect, src_doc, page_idx)
+        
+        # 在下方添加翻譯內容
+        translation_rect = fitz.Rect(0, src_page.rect.height, dst_page.rect.width, dst_page.rect.height)
+        
+        # 添加分隔線
+        dst_page.draw_line(
+            fitz.Point(0, src_page.rect.height),
+            fitz.Point(dst_page.rect.width, src_page.rect.height),
+            color=(0, 0, 0),
+            width=1
+        )
+        
+        # 添加"中文翻譯"標題
+        title_rect = fitz.Rect(10, src_page.rect.height + 10, dst_page.rect.width - 10, src_page.rect.height + 30)
+        dst_page.insert_text(title_rect.tl, "中文翻譯", fontsize=12, color=(0, 0, 0))
+        
+        # 添加翻譯文本
+        text_y = src_page.rect.height + 40
+        for block in page.get("blocks", []):
+            if "content_translated" in block:
+                text = block["content_translated"]
+                rect = fitz.Rect(20, text_y, dst_page.rect.width - 20, text_y + 1000)  # 高度足夠大
+                text_height = dst_page.insert_text(rect, text, fontsize=10, color=(0, 0, 0))
+                text_y += text_height + 10
+    
     def _prepare_for_serialization(self, data):
         """準備數據以便JSON序列化
         
@@ -338,7 +814,9 @@ class PDFTranslationSystem:
         Returns:
             可序列化的數據
         """
-        if isinstance(data, dict):
+        if isinstance(data, BlockStore):
+            return [self._prepare_for_serialization(block) for block in data]
+        elif isinstance(data, Mapping):
             result = {}
             for k, v in data.items():
                 # 跳過無法序列化的部分
@@ -374,9 +852,90 @@ class PDFTranslationSystem:
         
         logger.info(f"處理完成，共翻譯 {len(results)} 個PDF文件")
         logger.info(f"API使用統計：總請求數 {usage_stats['total_requests']}，總輸入字符數 {usage_stats['total_input_chars']}，總輸出字符數 {usage_stats['total_output_chars']}")
+        token_usage = usage_stats["token_usage"]
+        logger.info(f"提示緩存：寫入 {token_usage['cache_creation_input_tokens']} 令牌，讀取 {token_usage['cache_read_input_tokens']} 令牌，未緩存輸入 {token_usage['input_tokens']} 令牌")
+        fuzzy = usage_stats["fuzzy_memory"]
+        if fuzzy is not None:
+            logger.info(f"模糊翻譯記憶：查詢 {fuzzy['lookups']} 次，直接沿用 {fuzzy['reused']} 段（{fuzzy['reuse_rate']:.1%}），作為參考 {fuzzy['referenced']} 段（{fuzzy['reference_rate']:.1%}）")
+        chunking = usage_stats["chunking"]
+        logger.info(f"分塊：{chunking['split_texts']} 段長文本按句子分塊，{usage_stats['truncated_responses']} 個回應被截斷，續寫 {usage_stats['continuations']} 次；令牌估計校準係數 輸入 {chunking['input_ratio']}，輸出 {chunking['output_ratio']}")
         
         return results
     
+    def process_all_pdfs_batch(self):
+        """以Message Batches模式處理所有PDF文件
+        
+        先解析所有PDF，把翻譯記憶中還沒有的內容作為批次提交，輪詢到結束後
+        把譯文寫入翻譯記憶，再按正常流程處理各文件（此時直接命中記憶）。
+        上次運行已提交、尚未取回結果的批次會先繼續輪詢，不重新提交。
+        
+        Returns:
+            處理結果列表
+        """
+        pdf_files = self.pdf_processor.get_pdf_files()
+        if not pdf_files:
+            logger.warning(f"在 {self.config['pdf_dir']} 中沒有找到PDF文件")
+            return []
+        
+        batch_translator = BatchTranslator(
+            self.translator,
+            state_path=self.config.get("batch_state_path", ".cache/batches/state.json"),
+            poll_interval=self.config.get("batch_poll_interval", 60),
+            max_requests_per_batch=self.config.get("batch_max_requests", 10000)
+        )
+        batch_translator.resume()
+        
+        domain = self.config.get("default_domain", "general")
+        terminology_db = self._get_terminology_db()
+        for pdf_file in pdf_files:
+            pdf_filename = os.path.basename(pdf_file)
+            pdf_path = os.path.join(self.config["pdf_dir"], pdf_filename)
+            if self.config.get("mmap_input", True):
+                pdf_path = PDFSource.from_file(pdf_path)
+            try:
+                pdf_data = self.pdf_processor.process_pdf(pdf_path)
+            finally:
+                if isinstance(pdf_path, PDFSource):
+                    pdf_path.close()
+            self._mark_blocks(pdf_data)
+            count = batch_translator.collect(pdf_data, terminology_db, domain)
+            logger.info(f"收集待批量翻譯的內容: {pdf_filename}，{count} 個單元")
+        
+        batch_translator.submit()
+        batch_translator.wait()
+        logger.info(f"批量翻譯統計: {batch_translator.get_statistics()}")
+        
+        return self.process_all_pdfs()
+    
+    def retry_failures(self):
+        """只重新翻譯失敗記錄中的單元，再重新生成受影響的文檔
+        
+        重新生成文檔時其餘內容直接命中翻譯記憶和解析緩存，只有失敗的單元會調用API。
+        
+        Returns:
+            重新生成的文檔的處理結果列表
+        """
+        if not len(self.failure_log):
+            logger.info("沒有失敗記錄")
+            return []
+        
+        documents = self.failure_log.documents()
+        logger.info(f"重新翻譯 {len(self.failure_log)} 個失敗的單元，涉及 {len(documents)} 個文檔")
+        remaining = self.translator.retry_failures(self._get_terminology_db())
+        if remaining:
+            logger.warning(f"仍有 {remaining} 個單元翻譯失敗")
+        
+        # 仍有失敗單元的文檔暫不重新生成
+        still_failed = set(self.failure_log.documents())
+        results = []
+        for pdf_filename in documents:
+            if pdf_filename in still_failed:
+                continue
+            result = self.process_pdf(pdf_filename)
+            if result:
+                results.append(result)
+        return results
+    
     def extract_terms_from_pdfs(self, max_pdfs=3, terms_per_pdf=50):
         """從PDF文件中提取可能的術語
         
@@ -483,6 +1042,13 @@ def main():
     parser.add_argument("--config", type=str, help="配置文件路徑")
     parser.add_argument("--pdf", type=str, help="要處理的單個PDF文件名")
     parser.add_argument("--extract-terms", action="store_true", help="從PDF中提取術語")
+    parser.add_argument("--stream", action="store_true", help="逐頁流式處理，適合超大PDF")
+    parser.add_argument("--no-parse-cache", action="store_true", help="不使用解析緩存，強制重新解析PDF")
+    parser.add_argument("--no-translation-memory", action="store_true", help="不使用持久化翻譯記憶")
+    parser.add_argument("--no-incremental", action="store_true", help="不沿用上次未改變頁面的結果，完整重新處理")
+    parser.add_argument("--batch", action="store_true", help="使用Message Batches批量翻譯raw_pdfs中的所有PDF")
+    parser.add_argument("--fake-api", action="store_true", help="使用本地模擬的API端點（不需要網絡，用於端到端測試）")
+    parser.add_argument("--retry-failures", action="store_true", help="只重新翻譯上次記錄的失敗單元，並重新生成受影響的文檔")
     args = parser.parse_args()
     
     # 載入配置
@@ -491,6 +1057,23 @@ def main():
         with open(args.config, 'r', encoding='utf-8') as f:
             config = json.load(f)
     
+    if args.stream:
+        config = {**(config or {}), "stream_pages": True}
+    if args.no_parse_cache:
+        config = {**(config or {}), "parse_cache": False}
+    if args.no_translation_memory:
+        config = {**(config or {}), "translation_memory": False}
+    if args.no_incremental:
+        config = {**(config or {}), "incremental": False}
+    
+    fake_server = None
+    if args.fake_api:
+        from .fake_batch_server import FakeBatchServer
+        fake_server = FakeBatchServer().start()
+        os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+        config = {**(config or {}), "api_base_url": fake_server.url, "batch_poll_interval": 1}
+        logger.info(f"使用本地模擬API端點: {fake_server.url}")
+    
     # 初始化系統
     system = PDFTranslationSystem(config)
     
@@ -499,6 +1082,11 @@ def main():
         system.extract_terms_from_pdfs()
         return
     
+    if args.retry_failures:
+        results = system.retry_failures()
+        logger.info(f"已重新生成 {len(results)} 個文檔")
+        return
+    
     # 處理單個PDF或所有PDF
     if args.pdf:
         result = system.process_pdf(args.pdf)
@@ -506,7 +1094,7 @@ def main():
             logger.info(f"已處理文件：{args.pdf}")
             logger.info(f"翻譯結果保存在：{result['translated_pdf']}")
     else:
-        results = system.process_all_pdfs()
+        results = system.process_all_pdfs_batch() if args.batch else system.process_all_pdfs()
         if results:
             summary_path = system.create_translation_summary(results)
             logger.info(f"所有文件處理完成，摘要報告：{summary_path}")
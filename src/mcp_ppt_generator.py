@@ -10,6 +10,8 @@ import re
 import base64
 from io import BytesIO
 from PIL import Image
+from .rate_limiter import RateLimiter
+from .retry_policy import RetryPolicy
 
 # 配置日誌
 logging.basicConfig(
@@ -25,21 +27,25 @@ logger = logging.getLogger(__name__)
 class MCPPPTGenerator:
     """使用MCP協議自動生成PPT的模組"""
     
-    def __init__(self, api_key=None, model="claude-3-7-sonnet-20250219"):
+    def __init__(self, api_key=None, model="claude-3-7-sonnet-20250219", rate_limiter=None, retry_policy=None):
         """初始化MCP PPT生成器
         
         Args:
             api_key: Anthropic API密鑰
             model: 使用的Claude模型
+            rate_limiter: RateLimiter實例，與ClaudeTranslator共享時兩者合計不超過限額
+            retry_policy: RetryPolicy實例，與ClaudeTranslator共享時服務過載會同時暫停兩者
         """
         # 獲取API密鑰
         self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("需要Anthropic API密鑰")
             
-        # 初始化Claude客戶端
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        # 初始化Claude客戶端（重試由retry_policy處理）
+        self.client = anthropic.Anthropic(api_key=self.api_key, max_retries=0)
         self.model = model
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
     
     def generate_ppt_from_translation(self, translation_data, output_path):
         """從翻譯數據生成PPT
@@ -125,13 +131,7 @@ class MCPPPTGenerator:
         
         try:
             # 調用Claude API
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            response = self.retry_policy.call(self._create_message, prompt)
             
             # 提取JSON結構
             ppt_structure = self._extract_json_from_response(response.content[0].text)
@@ -149,6 +149,25 @@ class MCPPPTGenerator:
             # 使用備用結構
             return self._create_fallback_structure(content)
     
+    def _create_message(self, prompt):
+        """發出一次API請求（受限速器約束，由retry_policy負責重試）"""
+        input_tokens = RateLimiter.estimate_tokens(prompt)
+        output_tokens = 4000
+        self.rate_limiter.acquire(input_tokens, output_tokens)
+        try:
+            response = self.client.messages.create(
+                model=self.model,
+                max_tokens=4000,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
+        except Exception:
+            self.rate_limiter.reconcile(input_tokens, output_tokens)
+            raise
+        self.rate_limiter.reconcile(input_tokens, output_tokens, getattr(response, "usage", None))
+        return response
+    
     def _create_mcp_prompt(self, content):
         """創建MCP提示
         
@@ -0,0 +1,199 @@
+import os
+import io
+import json
+import hashlib
+import pytesseract  # 用於OCR
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+
+class OCREngine:
+    """基於本地Tesseract的OCR引擎
+    
+    批量識別圖片中的文字，可分配到進程池並行執行。結果按
+    (圖片內容哈希, 語言, 配置) 緩存在磁盤上，同一張圖片（例如每篇論文
+    都有的出版商標誌）只識別一次。完全離線運行，只依賴本地tesseract程序。
+    """
+    
+    def __init__(self, cache_dir=".cache/ocr", workers=1, lang="eng", min_confidence=60):
+        """初始化OCR引擎
+        
+        Args:
+            cache_dir: 識別結果緩存目錄（None表示不緩存）
+            workers: 並行識別的進程數（1表示在當前進程中識別）
+            lang: Tesseract語言代碼
+            min_confidence: 低於此置信度（0-100）的單詞會被丟棄
+        """
+        self.cache_dir = cache_dir
+        self.workers = max(1, int(workers or 1))
+        self.lang = lang
+        self.min_confidence = min_confidence
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        # 統計
+        self.recognized = 0
+        self.cache_hits = 0
+    
+    @staticmethod
+    def is_available():
+        """檢查本地是否安裝了tesseract程序"""
+        try:
+            pytesseract.get_tesseract_version()
+            return True
+        except Exception:
+            return False
+    
+    def _cache_key(self, image_bytes):
+        sha = hashlib.sha256(image_bytes)
+        sha.update(f"|{self.lang}|{self.min_confidence}".encode("utf-8"))
+        return sha.hexdigest()
+    
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    def _load_cached(self, key):
+        """讀取緩存的識別結果，未命中時返回None"""
+        if not self.cache_dir:
+            return None
+        cache_path = self._cache_path(key)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"讀取OCR緩存時出錯: {e}")
+            return None
+    
+    def _save_cached(self, key, result):
+        """原子寫入識別結果緩存"""
+        if not self.cache_dir:
+            return
+        cache_path = self._cache_path(key)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    
+    def recognize_batch(self, images):
+        """批量識別圖片中的文字
+        
+        Args:
+            images: 圖片字節數據列表
+        
+        Returns:
+            與images對應的結果列表，每項為
+            {"text": 全部文字, "confidence": 平均置信度, "width", "height",
+             "blocks": [{"text", "bbox"（像素座標）, "confidence"}, ...]}，
+            識別失敗的項為None
+        """
+        results = [None] * len(images)
+        
+        # 先查緩存，同一批中內容相同的圖片也只識別一次
+        pending = {}
+        keys = []
+        for idx, image_bytes in enumerate(images):
+            key = self._cache_key(image_bytes)
+            keys.append(key)
+            cached = self._load_cached(key)
+            if cached is not None:
+                results[idx] = cached
+                self.cache_hits += 1
+            elif key not in pending:
+                pending[key] = image_bytes
+        
+        if pending:
+            pending_keys = list(pending)
+            if self.workers > 1 and len(pending_keys) > 1:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(pending_keys))) as executor:
+                    recognized = list(executor.map(
+                        _recognize_worker,
+                        [pending[key] for key in pending_keys],
+                        [self.lang] * len(pending_keys),
+                        [self.min_confidence] * len(pending_keys)
+                    ))
+            else:
+                recognized = [_recognize(pending[key], self.lang, self.min_confidence) for key in pending_keys]
+            
+            recognized_by_key = {}
+            for key, result in zip(pending_keys, recognized):
+                if result is not None:
+                    self._save_cached(key, result)
+                    self.recognized += 1
+                recognized_by_key[key] = result
+            
+            for idx, key in enumerate(keys):
+                if results[idx] is None:
+                    results[idx] = recognized_by_key.get(key)
+        
+        return results
+    
+    def get_statistics(self):
+        """獲取識別統計"""
+        return {
+            "recognized": self.recognized,
+            "cache_hits": self.cache_hits
+        }
+
+def _recognize(image_bytes, lang, min_confidence):
+    """用Tesseract識別一張圖片，按段落組合成文本塊
+    
+    Args:
+        image_bytes: 圖片字節數據
+        lang: Tesseract語言代碼
+        min_confidence: 低於此置信度的單詞會被丟棄
+    
+    Returns:
+        識別結果字典，失敗時返回None
+    """
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        data = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        print(f"OCR識別時出錯: {e}")
+        return None
+    
+    # {(區塊號, 段落號): {"lines": {行號: [單詞...]}, "bbox": [...], "confidences": [...]}}
+    paragraphs = {}
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        confidence = float(data["conf"][i])
+        if not word or confidence < min_confidence:
+            continue
+        
+        key = (data["block_num"][i], data["par_num"][i])
+        x0, y0 = data["left"][i], data["top"][i]
+        x1, y1 = x0 + data["width"][i], y0 + data["height"][i]
+        
+        paragraph = paragraphs.setdefault(key, {"lines": {}, "bbox": [x0, y0, x1, y1], "confidences": []})
+        paragraph["lines"].setdefault(data["line_num"][i], []).append(word)
+        bbox = paragraph["bbox"]
+        paragraph["bbox"] = [min(bbox[0], x0), min(bbox[1], y0), max(bbox[2], x1), max(bbox[3], y1)]
+        paragraph["confidences"].append(confidence)
+    
+    blocks = []
+    all_confidences = []
+    for key in sorted(paragraphs):
+        paragraph = paragraphs[key]
+        text = "\n".join(" ".join(words) for _, words in sorted(paragraph["lines"].items()))
+        blocks.append({
+            "text": text,
+            "bbox": paragraph["bbox"],
+            "confidence": round(sum(paragraph["confidences"]) / len(paragraph["confidences"]), 1)
+        })
+        all_confidences.extend(paragraph["confidences"])
+    
+    return {
+        "text": "\n\n".join(block["text"] for block in blocks),
+        "confidence": round(sum(all_confidences) / len(all_confidences), 1) if all_confidences else 0.0,
+        "width": img.width,
+        "height": img.height,
+        "blocks": blocks
+    }
+
+def _recognize_worker(image_bytes, lang, min_confidence):
+    """進程池工作函數：識別一張圖片"""
+    return _recognize(image_bytes, lang, min_confidence)
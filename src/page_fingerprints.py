@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+from .pdf_source import open_fitz
+
+class PageFingerprintStore:
+    """頁面指紋存儲
+    
+    每頁的指紋是頁面尺寸、內容流、頁面文本以及頁面引用圖片的原始數據的哈希。
+    指紋保存在翻譯數據JSON旁邊（<PDF名>_page_fingerprints.json），
+    下次處理同名PDF時，指紋相同的頁面可以直接沿用上次的解析和翻譯結果。
+    """
+    
+    def __init__(self, json_output):
+        """初始化指紋存儲
+        
+        Args:
+            json_output: 翻譯數據JSON的路徑
+        """
+        self.json_output = json_output
+        self.path = f"{os.path.splitext(json_output)[0]}_page_fingerprints.json"
+    
+    @staticmethod
+    def compute(pdf_path):
+        """計算PDF每一頁的指紋
+        
+        Args:
+            pdf_path: PDF文件路徑或PDFSource
+        
+        Returns:
+            指紋列表，按頁面順序排列
+        """
+        fingerprints = []
+        with open_fitz(pdf_path) as doc:
+            for page in doc:
+                sha = hashlib.sha256()
+                sha.update(repr(tuple(page.rect)).encode("utf-8"))
+                sha.update(page.read_contents())
+                sha.update(page.get_text("text").encode("utf-8", "surrogatepass"))
+                # 內容流只按名稱引用圖片，圖片本身被替換時也要改變指紋
+                for img in page.get_images(full=True):
+                    try:
+                        sha.update(doc.xref_stream_raw(img[0]) or b"")
+                    except Exception:
+                        sha.update(str(img[0]).encode("utf-8"))
+                fingerprints.append(sha.hexdigest())
+        return fingerprints
+    
+    def load(self):
+        """讀取上次保存的指紋記錄
+        
+        Returns:
+            {"settings": {...}, "fingerprints": [...]}，不存在或讀取失敗時返回None
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"讀取頁面指紋時出錯: {e}")
+            return None
+    
+    def save(self, fingerprints, settings):
+        """保存指紋記錄
+        
+        Args:
+            fingerprints: 指紋列表
+            settings: 影響解析和翻譯結果的設置（解析器版本、模型等），
+                      設置改變時上次的結果不再沿用
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"settings": settings, "fingerprints": fingerprints}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+    
+    def clear(self):
+        """刪除指紋記錄，下次處理時所有頁面重新計算"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def match(self, fingerprints, settings):
+        """找出與上次記錄相同的頁面
+        
+        頁面按指紋匹配而不是按位置匹配，插入或刪除頁面後其餘頁面仍可沿用。
+        
+        Args:
+            fingerprints: 本次計算的指紋列表
+            settings: 本次的設置
+        
+        Returns:
+            {本次頁面索引: 上次頁面索引}，上次記錄不可用時返回空字典
+        """
+        previous = self.load()
+        if not previous or previous.get("settings") != settings:
+            return {}
+        
+        previous_index = {}
+        for page_idx, fingerprint in enumerate(previous.get("fingerprints", [])):
+            previous_index.setdefault(fingerprint, page_idx)
+        
+        return {
+            page_idx: previous_index[fingerprint]
+            for page_idx, fingerprint in enumerate(fingerprints)
+            if fingerprint in previous_index
+        }
@@ -0,0 +1,152 @@
+import re
+from collections import defaultdict
+
+DIGITS_PATTERN = re.compile(r'\d+')
+SPACES_PATTERN = re.compile(r'\s+')
+
+class PageFurnitureDetector:
+    """跨頁重複的頁眉、頁腳檢測
+    
+    期刊PDF每頁都重複相同的頁眉、頁腳和 "VOLUME 5, 2017" 這類行。
+    按規範化文本（小寫、數字替換為#、合併空白）和頁面上的垂直位置
+    把各頁頂部和底部的短文本塊聚類，出現在足夠多頁面上的類標記為頁面固定內容，
+    寫入block["furniture"]（類的鍵）。同一類只需翻譯一次，
+    其他頁面的塊沿用該翻譯（數字按本塊的數字替換）。
+    """
+    
+    def __init__(self, min_pages=3, position_tolerance=8.0, max_length=150, edge_blocks=3):
+        """初始化檢測器
+        
+        Args:
+            min_pages: 至少出現在多少頁上才算頁面固定內容
+            position_tolerance: 判斷垂直位置相同的容差（PDF點）
+            max_length: 只考慮不超過此長度的文本塊
+            edge_blocks: 只考慮每頁最上方和最下方各多少個文本塊
+        """
+        self.min_pages = min_pages
+        self.position_tolerance = position_tolerance
+        self.max_length = max_length
+        self.edge_blocks = edge_blocks
+        
+        # 流式模式下的 {類的鍵: 已出現的頁碼集合}
+        self._seen_pages = defaultdict(set)
+    
+    @staticmethod
+    def normalize(text):
+        """規範化文本：小寫、數字替換為#、合併空白"""
+        return SPACES_PATTERN.sub(" ", DIGITS_PATTERN.sub("#", text.lower())).strip()
+    
+    def _cluster_key(self, block):
+        """文本塊所屬類的鍵，不是候選塊時返回None"""
+        if block.get("type") != "text":
+            return None
+        content = block.get("content", "").strip()
+        if not content or len(content) > self.max_length:
+            return None
+        bbox = block.get("bbox")
+        if not bbox:
+            return None
+        band = int(round(bbox[1] / self.position_tolerance))
+        return f"{band}|{self.normalize(content)}"
+    
+    def _page_candidates(self, blocks):
+        """列出頁面頂部和底部的候選塊
+        
+        Returns:
+            [(塊, 類的鍵), ...]
+        """
+        keyed = []
+        for block in blocks:
+            key = self._cluster_key(block)
+            if key is not None:
+                keyed.append((block.get("bbox")[1], block, key))
+        if len(keyed) > 2 * self.edge_blocks:
+            keyed.sort(key=lambda item: item[0])
+            keyed = keyed[:self.edge_blocks] + keyed[-self.edge_blocks:]
+        return [(block, key) for _, block, key in keyed]
+    
+    def detect(self, pages, context_pages=()):
+        """檢測整個文檔中的頁面固定內容並標記塊
+        
+        Args:
+            pages: 頁面數據列表（每頁包含page_num和blocks）
+            context_pages: 只參與聚類、不標記的頁面（增量處理時沿用上次結果的頁面），
+                使只有少數頁面改變時仍能按整份文檔判斷頁眉頁腳
+        
+        Returns:
+            {類的鍵: 出現的頁碼列表}，只包含被標記的類
+        """
+        # {類的鍵: [(頁碼, 塊或None), ...]}，context_pages中的成員只計頁碼
+        clusters = defaultdict(list)
+        for page in pages:
+            for block, key in self._page_candidates(page.get("blocks", [])):
+                clusters[key].append((page.get("page_num"), block))
+        for page in context_pages:
+            for _, key in self._page_candidates(page.get("blocks", [])):
+                clusters[key].append((page.get("page_num"), None))
+        
+        furniture = {}
+        for key, members in clusters.items():
+            page_nums = sorted({page_num for page_num, _ in members})
+            if len(page_nums) < self.min_pages:
+                continue
+            tagged_pages = []
+            for page_num, block in members:
+                if block is not None:
+                    block["furniture"] = key
+                    tagged_pages.append(page_num)
+            if tagged_pages:
+                furniture[key] = sorted(set(tagged_pages))
+        return furniture
+    
+    def reset(self):
+        """開始處理新文檔（流式模式）"""
+        self._seen_pages = defaultdict(set)
+    
+    def tag_page(self, page_num, blocks):
+        """流式模式下逐頁標記頁面固定內容
+        
+        無法預先看到整個文檔，塊所屬的類在之前的頁面上已出現
+        min_pages - 1 次時才標記；前幾頁的頁眉頁腳按普通文本處理。
+        
+        Args:
+            page_num: 頁碼
+            blocks: 該頁的塊列表或BlockStore
+        
+        Returns:
+            本頁標記的塊數
+        """
+        tagged = 0
+        for block, key in self._page_candidates(blocks):
+            seen = self._seen_pages[key]
+            if len(seen - {page_num}) >= self.min_pages - 1:
+                block["furniture"] = key
+                tagged += 1
+            seen.add(page_num)
+        return tagged
+
+def apply_template_translation(source, translated, content):
+    """把同一類中另一個塊的翻譯套用到本塊
+    
+    同一類的塊只有數字不同（頁碼、卷號等），翻譯中的數字按出現順序
+    換成本塊的數字。譯文中的數字與原文的數字不是同一順序（如 "VOLUME 5, 2017"
+    譯為 "2017年第5卷"）或個數對不上時無法可靠替換，返回None，
+    由調用方單獨翻譯本塊，不沿用其他頁面的數字。
+    
+    Args:
+        source: 已翻譯塊的原文
+        translated: 已翻譯塊的譯文
+        content: 本塊的原文
+    
+    Returns:
+        本塊的譯文，無法套用時返回None
+    """
+    source_digits = DIGITS_PATTERN.findall(source)
+    content_digits = DIGITS_PATTERN.findall(content)
+    if content == source or content_digits == source_digits:
+        return translated
+    if DIGITS_PATTERN.findall(translated) != source_digits or len(source_digits) != len(content_digits):
+        return None
+    
+    replacements = iter(content_digits)
+    return DIGITS_PATTERN.sub(lambda match: next(replacements), translated)
@@ -0,0 +1,147 @@
+import os
+import hashlib
+import pickle
+import time
+from .pdf_source import PDFSource
+
+class ParseCache:
+    """以PDF內容哈希為鍵的磁盤解析緩存
+    
+    緩存鍵由PDF文件內容的SHA-256和解析器版本組成，文件內容或解析邏輯
+    改變都會使緩存失效。緩存總大小超過上限時按最近使用時間淘汰（LRU）。
+    """
+    
+    def __init__(self, cache_dir=".cache/parse", max_size_mb=512):
+        """初始化解析緩存
+        
+        Args:
+            cache_dir: 緩存目錄
+            max_size_mb: 緩存總大小上限（MB）
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # 統計
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def hash_file(pdf_path, chunk_size=1024 * 1024):
+        """計算文件內容的SHA-256（PDFSource直接哈希內存中的數據）"""
+        if isinstance(pdf_path, PDFSource):
+            return pdf_path.sha256()
+        sha = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+    
+    def make_key(self, pdf_path, parser_version):
+        """生成緩存鍵
+        
+        Args:
+            pdf_path: PDF文件路徑或PDFSource
+            parser_version: 解析器版本
+        
+        Returns:
+            緩存鍵字符串
+        """
+        return f"{self.hash_file(pdf_path)}-v{parser_version}"
+    
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+    
+    def get(self, key):
+        """讀取緩存
+        
+        Args:
+            key: 緩存鍵
+        
+        Returns:
+            緩存的解析結果，未命中時返回None
+        """
+        entry_path = self._entry_path(key)
+        if not os.path.exists(entry_path):
+            self.misses += 1
+            return None
+        
+        try:
+            with open(entry_path, 'rb') as f:
+                result = pickle.load(f)
+        except Exception as e:
+            print(f"讀取解析緩存時出錯: {e}")
+            self.misses += 1
+            return None
+        
+        # 更新訪問時間，用於LRU淘汰
+        now = time.time()
+        os.utime(entry_path, (now, now))
+        
+        self.hits += 1
+        return result
+    
+    def put(self, key, result):
+        """寫入緩存並按大小淘汰最舊的條目
+        
+        Args:
+            key: 緩存鍵
+            result: 解析結果
+        """
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # 原子替換，避免並行運行時讀到半寫入的文件
+            os.replace(tmp_path, entry_path)
+        except Exception as e:
+            print(f"寫入解析緩存時出錯: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        
+        self._evict()
+    
+    def invalidate(self, key):
+        """刪除指定緩存條目"""
+        entry_path = self._entry_path(key)
+        if os.path.exists(entry_path):
+            os.remove(entry_path)
+    
+    def _evict(self):
+        """緩存總大小超過上限時，按最近使用時間從舊到新刪除條目"""
+        entries = []
+        total_size = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+        
+        if total_size <= self.max_size_bytes:
+            return
+        
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+                print(f"解析緩存超出上限，已淘汰: {os.path.basename(path)}")
+            except OSError:
+                pass
+    
+    def get_statistics(self):
+        """獲取緩存命中統計"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -1,21 +1,72 @@
 import os
-import re
 import fitz  # PyMuPDF
-import pdfplumber
 from PIL import Image
 import io
 import numpy as np
-import pytesseract  # 用於OCR
 from langdetect import detect  # 語言檢測
+from concurrent.futures import ProcessPoolExecutor
+from .image_store import ImageStore
+from .spatial_index import PageTextIndex
+from .formula_classifier import FormulaClassifier
+from .figure_rasterizer import FigureRasterizer
+from .parse_cache import ParseCache
+from .table_screener import TableScreener
+from .block_store import BlockStore
+from .ocr_engine import OCREngine
+from .pdf_source import as_pdf_source, open_fitz, open_pdfplumber, worker_path
+
+# 解析器版本，解析結果的結構或內容改變時遞增，使舊的解析緩存失效
+PARSER_VERSION = 8
+
+# 提取文本字典時不解碼圖片數據，圖片塊改由page.get_image_info()提供輕量句柄
+TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# 逐頁解析時每隔這麼多頁把累積的圖片條目寫入一次清單，而不是每頁重寫整個清單文件
+MANIFEST_FLUSH_PAGES = 16
 
 class PDFProcessor:
-    def __init__(self, pdf_dir="raw_pdfs"):
+    def __init__(self, pdf_dir="raw_pdfs", parse_workers=1, parse_chunk_size=8, parse_cache=None, formula_thresholds=None,
+                 figure_dpi=144, figure_format="png", figure_workers=1, table_screening=True,
+                 compact_blocks=False, ocr_enabled=True, ocr_lang="eng", ocr_dpi=300, ocr_workers=1,
+                 ocr_min_chars=20, ocr_cache_dir=".cache/ocr"):
         """初始化PDF處理器
         
         Args:
             pdf_dir: PDF文件所在的目錄
+            parse_workers: 並行解析的進程數（1表示串行解析）
+            parse_chunk_size: 並行解析時每個任務處理的頁數
+            parse_cache: ParseCache實例（None表示不使用解析緩存）
+            formula_thresholds: 公式分類閾值，如 {"min_symbols": 1, "min_indicators": 4, "max_length": 100}
+            figure_dpi: 圖表區域截圖的分辨率
+            figure_format: 圖表區域截圖的格式（png、jpeg或webp）
+            figure_workers: 並行渲染圖表區域的進程數
+            table_screening: 是否先預篩選可能包含表格的頁面，只對候選頁運行表格提取器
+            compact_blocks: 是否以BlockStore（按列保存的緊湊結構）保存每頁的塊
+            ocr_enabled: 是否對沒有文本層的頁面和提取的圖片運行OCR（本地未安裝tesseract時自動關閉）
+            ocr_lang: Tesseract語言代碼
+            ocr_dpi: 掃描頁面渲染後交給OCR的分辨率
+            ocr_workers: 並行OCR的進程數
+            ocr_min_chars: 文本層少於此字符數、且含有圖片的頁面視為掃描頁面
+            ocr_cache_dir: OCR結果緩存目錄
         """
         self.pdf_dir = pdf_dir
+        self.parse_cache = parse_cache
+        self.formula_thresholds = dict(formula_thresholds or {})
+        self.formula_classifier = FormulaClassifier(**self.formula_thresholds)
+        self.figure_dpi = figure_dpi
+        self.figure_format = figure_format
+        self.figure_workers = max(1, int(figure_workers or 1))
+        self.table_screening = table_screening
+        self.table_screener = TableScreener() if table_screening else None
+        self.compact_blocks = compact_blocks
+        self.ocr_lang = ocr_lang
+        self.ocr_dpi = int(ocr_dpi)
+        self.ocr_workers = max(1, int(ocr_workers or 1))
+        self.ocr_min_chars = ocr_min_chars
+        self.ocr_cache_dir = ocr_cache_dir
+        self.ocr_enabled = ocr_enabled and self._ocr_available()
+        self.parse_workers = max(1, int(parse_workers or 1))
+        self.parse_chunk_size = max(1, int(parse_chunk_size or 1))
         self.processed_data = {}
         
     def get_pdf_files(self):
@@ -28,56 +79,34 @@ class PDFProcessor:
     
     def extract_text_with_pymupdf(self, pdf_path):
         """使用PyMuPDF提取PDF文本，保留基本結構"""
-        doc = fitz.open(pdf_path)
+        pdf_path = self._as_source(pdf_path)
+        doc = open_fitz(pdf_path)
         text_data = []
         
         for page_num, page in enumerate(doc):
             # 提取頁面文本
-            text = page.get_text("dict")
-            blocks = text["blocks"]
+            text_dict = page.get_text("dict", flags=TEXT_DICT_FLAGS)
             
-            page_data = {
+            text_data.append({
                 "page_num": page_num + 1,
-                "blocks": []
-            }
-            
-            for block in blocks:
-                if "lines" in block:  # 文本塊
-                    block_text = ""
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            block_text += span["text"] + " "
-                    
-                    # 判斷是否可能是公式（簡單啟發式方法）
-                    is_formula = self._check_if_formula(block_text)
-                    
-                    page_data["blocks"].append({
-                        "type": "formula" if is_formula else "text",
-                        "content": block_text.strip(),
-                        "bbox": block["bbox"]  # 座標，用於之後重建結構
-                    })
-                elif "image" in block:  # 圖像塊
-                    # 儲存圖像以供後續處理
-                    image_data = {
-                        "type": "image",
-                        "bbox": block["bbox"],
-                        "image": block["image"]  # 圖像數據
-                    }
-                    page_data["blocks"].append(image_data)
-            
-            text_data.append(page_data)
+                "blocks": self._extract_page_blocks(pdf_path, page, text_dict, PageTextIndex(text_dict))
+            })
         
         doc.close()
         return text_data
     
     def extract_text_with_pdfplumber(self, pdf_path):
         """使用pdfplumber提取文本，更適合表格處理"""
-        with pdfplumber.open(pdf_path) as pdf:
+        pdf_path = self._as_source(pdf_path)
+        with open_pdfplumber(pdf_path) as pdf, open_fitz(pdf_path) as doc:
             text_data = []
             
             for page_num, page in enumerate(pdf.pages):
-                # 提取表格
-                tables = page.extract_tables()
+                # 提取表格（只在預篩選的候選頁上運行）
+                fitz_page = doc[page_num]
+                text_dict = fitz_page.get_text("dict", flags=TEXT_DICT_FLAGS)
+                screening = self._screen_page(fitz_page, text_dict, PageTextIndex(text_dict))
+                tables = page.extract_tables() if screening["candidate"] else []
                 
                 # 提取文字
                 text = page.extract_text()
@@ -101,109 +130,22 @@ class PDFProcessor:
         Returns:
             提取的圖片信息列表
         """
+        pdf_path = self._as_source(pdf_path)
         images = []
-        
-        # 創建圖片保存目錄（與HTML文件在同一目錄）
+        image_store = ImageStore(self._get_images_dir(pdf_path))
         output_basename = os.path.splitext(os.path.basename(pdf_path))[0]
-        # 創建輸出目錄結構
-        output_dir = os.path.join(os.path.dirname(os.path.dirname(pdf_path)), "translated_pdfs")
-        images_dir = os.path.join(output_dir, "images")
-        os.makedirs(images_dir, exist_ok=True)
-        
-        print(f"圖片將被保存到: {images_dir}")
         
         # 打開PDF
-        doc = fitz.open(pdf_path)
+        doc = open_fitz(pdf_path)
         
         # 處理每一頁
         for page_idx, page in enumerate(doc):
-            # 獲取頁面上的圖片
-            image_list = page.get_images(full=True)
-            
-            for img_idx, img in enumerate(image_list):
-                try:
-                    # 提取圖片
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    
-                    # 確定圖片類型
-                    ext = base_image["ext"]
-                    
-                    # 創建圖片文件名和保存路徑
-                    img_filename = f"{output_basename}_page{page_idx+1}_img{img_idx+1}.{ext}"
-                    img_path = os.path.join(images_dir, img_filename)
-                    
-                    # 保存圖片
-                    with open(img_path, "wb") as img_file:
-                        img_file.write(image_bytes)
-                    
-                    # 獲取圖片在頁面中的位置
-                    bbox = page.get_image_bbox(img)
-                    
-                    # 尋找圖片附近的可能圖表標題
-                    caption = self._find_image_caption(page, bbox)
-                    
-                    # 添加圖片信息
-                    images.append({
-                        "type": "image",
-                        "page_num": page_idx + 1,
-                        "img_index": img_idx,
-                        "bbox": [float(coord) for coord in bbox],
-                        "image_path": os.path.join("images", img_filename),  # 使用相對路徑
-                        "caption": caption
-                    })
-                    
-                    print(f"已提取並保存圖片: {img_path}")
-                    
-                except Exception as e:
-                    print(f"處理圖片時出錯: {e}")
-            
-            # 新增部分：檢測頁面中無法直接提取的圖表
-            try:
-                # 查找可能含有"Figure"或"Table"字樣的文本塊
-                text_blocks = page.get_text("dict")["blocks"]
-                for block_idx, block in enumerate(text_blocks):
-                    if "lines" in block:
-                        block_text = ""
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                block_text += span["text"] + " "
-                        
-                        # 檢查是否是圖表標題
-                        if re.search(r'(figure|fig\.?|圖)\s*\d+', block_text, re.IGNORECASE):
-                            # 這個塊可能是圖表標題，檢查上方的區域
-                            caption = block_text.strip()
-                            x0, y0, x1, y1 = block["bbox"]
-                            
-                            # 假設圖表在標題上方約200-300像素
-                            figure_area = (x0-50, max(0, y0-300), x1+50, y0-5)
-                            
-                            # 創建截圖文件名
-                            fig_filename = f"{output_basename}_page{page_idx+1}_fig{block_idx}.png"
-                            fig_path = os.path.join(images_dir, fig_filename)
-                            
-                            # 使用PyMuPDF的pixmap對象截取這個區域
-                            try:
-                                pix = page.get_pixmap(clip=figure_area, matrix=fitz.Matrix(2, 2))
-                                pix.save(fig_path)
-                                
-                                # 添加到圖片列表
-                                images.append({
-                                    "type": "figure",
-                                    "page_num": page_idx + 1,
-                                    "img_index": 1000 + block_idx,  # 避免與直接提取的圖片索引衝突
-                                    "bbox": [float(coord) for coord in figure_area],
-                                    "image_path": os.path.join("images", fig_filename),
-                                    "caption": caption
-                                })
-                                print(f"已提取可能的圖表區域: {fig_path}")
-                            except Exception as e:
-                                print(f"截取圖表區域時出錯: {e}")
-            except Exception as e:
-                print(f"尋找頁面中的圖表區域時出錯: {e}")
+            page_index = PageTextIndex(page.get_text("dict", flags=TEXT_DICT_FLAGS))
+            images.extend(self._extract_page_images(doc, page, page_idx, page_index, image_store, output_basename))
         
+        images = self._rasterize_figures(pdf_path, doc, images, image_store)
         doc.close()
+        self._record_image_manifest(image_store, images)
         return images
     
     def extract_tables(self, pdf_path):
@@ -215,144 +157,787 @@ class PDFProcessor:
         Returns:
             提取的表格信息列表
         """
+        pdf_path = self._as_source(pdf_path)
         tables = []
+        doc = open_fitz(pdf_path)
+        
+        # 預篩選可能包含表格的頁面
+        candidate_pages = set()
+        page_indexes = {}
+        for page_idx, page in enumerate(doc):
+            text_dict = page.get_text("dict", flags=TEXT_DICT_FLAGS)
+            page_indexes[page_idx] = PageTextIndex(text_dict)
+            if self._screen_page(page, text_dict, page_indexes[page_idx])["candidate"]:
+                candidate_pages.add(page_idx)
         
         try:
             # 使用pdfplumber提取表格
-            with pdfplumber.open(pdf_path) as pdf:
-                for page_idx, page in enumerate(pdf.pages):
-                    # 提取表格
-                    extracted_tables = page.extract_tables()
-                    
-                    if extracted_tables:
-                        for table_idx, table_data in enumerate(extracted_tables):
-                            # 過濾空行和空單元格
-                            filtered_table = []
-                            for row in table_data:
-                                if any(cell and str(cell).strip() for cell in row):
-                                    filtered_row = [str(cell).strip() if cell else "" for cell in row]
-                                    filtered_table.append(filtered_row)
-                            
-                            if filtered_table:
-                                # 嘗試查找表格標題
-                                caption = self._find_table_caption(page, table_idx)
-                                
-                                # 添加表格信息
-                                tables.append({
-                                    "type": "table",
-                                    "page_num": page_idx + 1,
-                                    "table_idx": table_idx,
-                                    "data": filtered_table,
-                                    "has_header": True,  # 通常第一行為表頭
-                                    "caption": caption
-                                })
-                                
-                                print(f"已提取表格: 頁面 {page_idx+1}, 表格 {table_idx}")
+            with open_pdfplumber(pdf_path) as pdf:
+                for page_idx in sorted(candidate_pages):
+                    tables.extend(self._extract_page_tables(page_indexes[page_idx], pdf.pages[page_idx], page_idx))
         except Exception as e:
             print(f"使用pdfplumber提取表格時出錯: {str(e)}")
         
         # 如果pdfplumber未能提取表格，嘗試使用PyMuPDF
         if not tables:
+            tables = self._extract_tables_with_pymupdf(doc, pages=candidate_pages)
+        
+        doc.close()
+        return tables
+    
+    def parse_document(self, pdf_path):
+        """單次遍歷解析PDF
+        
+        文件只用PyMuPDF和pdfplumber各打開一次，每頁的文本字典只計算一次，
+        文本塊、圖片、圖表截圖和表格都由同一次遍歷產生。
+        當parse_workers大於1時，按頁面範圍分配到進程池並行解析；
+        純內存的文檔（工作進程無法按路徑重新打開）始終串行解析。
+        
+        Args:
+            pdf_path: PDF文件路徑或PDFSource
+            
+        Returns:
+            包含text_data、images、tables和table_screening的字典
+        """
+        pdf_path = self._as_source(pdf_path)
+        images_dir = self._get_images_dir(pdf_path)
+        output_basename = os.path.splitext(os.path.basename(pdf_path))[0]
+        
+        if self.parse_workers > 1 and worker_path(pdf_path) is not None:
+            with open_fitz(pdf_path) as doc:
+                page_count = len(doc)
+            
+            if page_count > self.parse_chunk_size:
+                # PDF內容哈希只在主進程計算一次，各工作進程渲染圖表時直接使用
+                pdf_hash = ParseCache.hash_file(pdf_path)
+                parsed = self._parse_document_parallel(worker_path(pdf_path), page_count, images_dir, output_basename, pdf_hash)
+                self._record_image_manifest(ImageStore(images_dir), parsed["images"])
+                return parsed
+        
+        parsed = self._parse_page_range(pdf_path, 0, None, images_dir, output_basename, table_fallback=True)
+        self._record_image_manifest(ImageStore(images_dir), parsed["images"])
+        return parsed
+    
+    def _parse_document_parallel(self, pdf_path, page_count, images_dir, output_basename, pdf_hash=None):
+        """將頁面範圍分配到進程池並行解析，並按頁面順序合併結果
+        
+        每個工作進程按路徑重新打開文檔，返回可序列化的單頁結果，
+        合併後的結構與串行解析完全一致。
+        
+        Args:
+            pdf_path: PDF文件路徑
+            page_count: 文檔頁數
+            images_dir: 圖片保存目錄
+            output_basename: 圖片文件名前綴
+            pdf_hash: PDF內容哈希（用於圖表渲染記錄）
+            
+        Returns:
+            包含text_data、images、tables和table_screening的字典
+        """
+        page_ranges = [
+            (start, min(start + self.parse_chunk_size, page_count))
+            for start in range(0, page_count, self.parse_chunk_size)
+        ]
+        workers = min(self.parse_workers, len(page_ranges))
+        print(f"使用 {workers} 個進程並行解析 {page_count} 頁（每塊 {self.parse_chunk_size} 頁）")
+        
+        text_data = []
+        images = []
+        tables = []
+        table_screening = []
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_parse_page_range_worker, self._worker_options(), pdf_path, start, end, images_dir, output_basename, pdf_hash)
+                for start, end in page_ranges
+            ]
+            # 按提交順序（即頁面順序）合併
+            for future in futures:
+                chunk = future.result()
+                text_data.extend(chunk["text_data"])
+                images.extend(chunk["images"])
+                tables.extend(chunk["tables"])
+                table_screening.extend(chunk["table_screening"])
+            
+            # 與串行路徑一致：整個文檔都沒有pdfplumber表格時才使用PyMuPDF（同樣只處理候選頁）
+            if not tables:
+                candidate_pages = self._candidate_pages(table_screening)
+                futures = [
+                    executor.submit(_pymupdf_tables_worker, self.pdf_dir, pdf_path, start, end, candidate_pages)
+                    for start, end in page_ranges
+                ]
+                for future in futures:
+                    tables.extend(future.result())
+        
+        self._report_table_screening(table_screening)
+        
+        return {
+            "text_data": text_data,
+            "images": images,
+            "tables": tables,
+            "table_screening": table_screening
+        }
+    
+    def _parse_page_range(self, pdf_path, start, end, images_dir, output_basename, table_fallback=False, pdf_hash=None):
+        """解析指定頁面範圍 [start, end)
+        
+        Args:
+            pdf_path: PDF文件路徑
+            start: 起始頁索引（從0開始）
+            end: 結束頁索引（不包含），None表示到文檔末尾
+            images_dir: 圖片保存目錄
+            output_basename: 圖片文件名前綴
+            table_fallback: 範圍內沒有pdfplumber表格時是否使用PyMuPDF提取
+            pdf_hash: PDF內容哈希（None表示渲染圖表時計算）
+            
+        Returns:
+            包含text_data、images、tables和table_screening的字典
+        """
+        text_data = []
+        images = []
+        tables = []
+        table_screening = []
+        image_store = ImageStore(images_dir)
+        
+        doc = open_fitz(pdf_path)
+        if end is None:
+            end = len(doc)
+        
+        plumber_pdf = None
+        try:
+            plumber_pdf = open_pdfplumber(pdf_path)
+        except Exception as e:
+            print(f"使用pdfplumber打開PDF時出錯: {str(e)}")
+        
+        for page_idx in range(start, end):
+            page_result = self._parse_page(doc, plumber_pdf, page_idx, image_store, output_basename)
+            text_data.append(page_result["text_data"])
+            images.extend(page_result["images"])
+            tables.extend(page_result["tables"])
+            table_screening.append(page_result["table_screening"])
+        
+        if plumber_pdf is not None:
+            plumber_pdf.close()
+        
+        # 整個範圍的圖表區域統一渲染
+        images = self._rasterize_figures(pdf_path, doc, images, image_store, pdf_hash=pdf_hash)
+        
+        # 掃描頁面和提取的圖片統一OCR
+        self._apply_ocr(doc, text_data, images, image_store)
+        
+        # 如果pdfplumber未能提取表格，在同一個文檔對象上使用PyMuPDF
+        if table_fallback and not tables:
+            tables = self._extract_tables_with_pymupdf(doc, start, end, pages=self._candidate_pages(table_screening))
+        
+        doc.close()
+        
+        if table_fallback:
+            self._report_table_screening(table_screening)
+        
+        return {
+            "text_data": text_data,
+            "images": images,
+            "tables": tables,
+            "table_screening": table_screening
+        }
+    
+    def _parse_page(self, doc, plumber_pdf, page_idx, image_store, output_basename):
+        """解析單頁：文本字典只計算一次，供文本塊、圖片和表格提取共用
+        
+        Args:
+            doc: PyMuPDF文檔對象
+            plumber_pdf: 同一文檔的pdfplumber對象（打開失敗時為None）
+            page_idx: 頁面索引（從0開始）
+            image_store: 圖片存儲
+            output_basename: 圖片文件名前綴
+            
+        Returns:
+            包含text_data（該頁的頁面數據）、images、tables和table_screening（該頁的預篩選結果）的字典
+        """
+        page = doc[page_idx]
+        text_dict = page.get_text("dict", flags=TEXT_DICT_FLAGS)
+        
+        # 每頁只建立一次空間索引，標題查找和圖表檢測都查詢它
+        page_index = PageTextIndex(text_dict)
+        
+        # 只有預篩選判定為候選的頁面才運行pdfplumber
+        screening = self._screen_page(page, text_dict, page_index)
+        
+        tables = []
+        if plumber_pdf is not None and screening["candidate"]:
             try:
-                doc = fitz.open(pdf_path)
-                for page_idx, page in enumerate(doc):
-                    # 使用PyMuPDF的表格檢測功能
-                    tab = page.find_tables()
-                    if tab and tab.tables:
-                        for table_idx, table in enumerate(tab.tables):
-                            # 從表格單元格中提取數據
-                            table_data = []
-                            
-                            # 按行組織單元格
-                            rows = {}
-                            for cell in table.cells:
-                                row_key = round(cell.y0)  # 使用y0坐標作為行標識
-                                if row_key not in rows:
-                                    rows[row_key] = []
-                                
-                                # 獲取單元格文本
-                                text = page.get_text("text", clip=cell.rect).strip()
-                                rows[row_key].append((cell.x0, text))  # 保存x坐標以便後續排序
-                            
-                            # 按行y坐標排序並創建表格數據
-                            for row_y in sorted(rows.keys()):
-                                # 按x坐標排序單元格
-                                cells = rows[row_y]
-                                cells.sort(key=lambda c: c[0])
-                                
-                                row_data = [text for _, text in cells]
-                                if any(text.strip() for text in row_data):  # 確保行不是空的
-                                    table_data.append(row_data)
-                            
-                            if table_data:
-                                # 尋找表格標題
-                                caption = self._find_table_caption(page, table_idx)
-                                
-                                tables.append({
-                                    "type": "table",
-                                    "page_num": page_idx + 1,
-                                    "table_idx": table_idx,
-                                    "data": table_data,
-                                    "has_header": True,
-                                    "caption": caption
-                                })
-                                
-                                print(f"已使用PyMuPDF提取表格: 頁面 {page_idx+1}, 表格 {table_idx}")
+                tables = self._extract_page_tables(page_index, plumber_pdf.pages[page_idx], page_idx)
+            except Exception as e:
+                print(f"使用pdfplumber提取表格時出錯: {str(e)}")
+        
+        return {
+            "text_data": {
+                "page_num": page_idx + 1,
+                "blocks": self._extract_page_blocks(doc.name, page, text_dict, page_index)
+            },
+            "images": self._extract_page_images(doc, page, page_idx, page_index, image_store, output_basename),
+            "tables": tables,
+            "table_screening": screening
+        }
+    
+    def iter_pages(self, pdf_path, pages=None, name=None):
+        """逐頁解析PDF的生成器，內存佔用不隨文檔長度增長
+        
+        每次產出一個完整解析的頁面，調用方處理完後即可釋放。
+        由於無法預知整個文檔是否有pdfplumber表格，PyMuPDF表格備用方案
+        在此模式下按頁判斷：該頁沒有pdfplumber表格時才使用。
+        
+        Args:
+            pdf_path: PDF文件路徑、PDFSource或PDF數據
+            pages: 只解析這些頁面索引（從0開始，按給定順序），None表示所有頁面
+            name: PDF數據的文件名
+            
+        Yields:
+            {"page_num": ..., "blocks": [...], "images": [...], "tables": [...], "table_screening": {...}}
+        """
+        pdf_path = self._as_source(pdf_path, name)
+        image_store = ImageStore(self._get_images_dir(pdf_path))
+        output_basename = os.path.splitext(os.path.basename(pdf_path))[0]
+        
+        doc = open_fitz(pdf_path)
+        plumber_pdf = None
+        try:
+            plumber_pdf = open_pdfplumber(pdf_path)
+        except Exception as e:
+            print(f"使用pdfplumber打開PDF時出錯: {str(e)}")
+        
+        # PDF內容哈希在第一個有圖表的頁面計算，整個文檔只計算一次
+        pdf_hash = None
+        # 尚未寫入清單的圖片，以及自上次寫入以來處理的頁數
+        pending_images = []
+        pending_pages = 0
+        
+        try:
+            for page_idx in (range(len(doc)) if pages is None else pages):
+                page_result = self._parse_page(doc, plumber_pdf, page_idx, image_store, output_basename)
+                if pdf_hash is None and self._pending_figures(page_result["images"]):
+                    pdf_hash = ParseCache.hash_file(pdf_path)
+                # 逐頁模式下在當前進程渲染，不為每頁啟動進程池
+                page_result["images"] = self._rasterize_figures(
+                    pdf_path, doc, page_result["images"], image_store, workers=1, pdf_hash=pdf_hash
+                )
+                self._apply_ocr(doc, [page_result["text_data"]], page_result["images"], image_store, workers=1)
+                pending_images.extend(page_result["images"])
+                pending_pages += 1
+                if pending_pages >= MANIFEST_FLUSH_PAGES:
+                    self._record_image_manifest(image_store, pending_images)
+                    pending_images, pending_pages = [], 0
+                
+                tables = page_result["tables"]
+                if not tables and page_result["table_screening"]["candidate"]:
+                    tables = self._extract_tables_with_pymupdf(doc, page_idx, page_idx + 1)
+                
+                page_data = page_result["text_data"]
+                page_data["images"] = page_result["images"]
+                page_data["tables"] = tables
+                page_data["table_screening"] = page_result["table_screening"]
                 
-                doc.close()
+                yield page_data
+                
+                # pdfplumber會緩存已解析頁面的對象，處理完即釋放
+                if plumber_pdf is not None:
+                    plumber_pdf.pages[page_idx].flush_cache()
+        finally:
+            # 調用方提前停止迭代時也寫入已處理頁面的圖片
+            self._record_image_manifest(image_store, pending_images)
+            if plumber_pdf is not None:
+                plumber_pdf.close()
+            doc.close()
+    
+    def _screen_page(self, page, text_dict, page_index):
+        """預篩選頁面是否可能包含表格，並記錄判斷依據
+        
+        Args:
+            page: PyMuPDF頁面對象
+            text_dict: 該頁的文本字典
+            page_index: 該頁的PageTextIndex
+            
+        Returns:
+            該頁的預篩選結果（未啟用預篩選時所有頁面都是候選頁）
+        """
+        if self.table_screener is None:
+            return {"page_num": page.number + 1, "candidate": True, "reasons": ["screening_disabled"]}
+        
+        screening = self.table_screener.screen(page, text_dict, page_index)
+        decision = "候選" if screening["candidate"] else "跳過"
+        print(f"表格預篩選: 頁面 {screening['page_num']} {decision} "
+              f"(標題: {screening['caption']}, 表格線: {screening['rulings']}, 對齊行: {screening['aligned_rows']})")
+        return screening
+    
+    def _candidate_pages(self, table_screening):
+        """從預篩選結果中取出候選頁的頁面索引（從0開始）"""
+        return {screening["page_num"] - 1 for screening in table_screening if screening["candidate"]}
+    
+    def _report_table_screening(self, table_screening):
+        """輸出整個文檔的預篩選摘要"""
+        if self.table_screener is None or not table_screening:
+            return
+        candidates = len(self._candidate_pages(table_screening))
+        print(f"表格預篩選: {candidates}/{len(table_screening)} 頁交給表格提取器")
+    
+    def _as_source(self, pdf_path, name=None):
+        """把PDF數據包裝為PDFSource（邏輯路徑在pdf_dir下），文件路徑原樣返回"""
+        return as_pdf_source(pdf_path, os.path.join(self.pdf_dir, name or "document.pdf"))
+    
+    def _get_images_dir(self, pdf_path):
+        """獲取並創建圖片保存目錄（與HTML文件在同一目錄）"""
+        # 創建輸出目錄結構
+        output_dir = os.path.join(os.path.dirname(os.path.dirname(pdf_path)), "translated_pdfs")
+        images_dir = os.path.join(output_dir, "images")
+        os.makedirs(images_dir, exist_ok=True)
+        
+        print(f"圖片將被保存到: {images_dir}")
+        return images_dir
+    
+    def _record_image_manifest(self, image_store, images):
+        """把圖片的邏輯名稱和存儲路徑寫入圖片清單"""
+        entries = {}
+        for img in images:
+            if img.get("image_name") and img.get("image_path"):
+                entries[img["image_name"]] = os.path.relpath(
+                    os.path.join(os.path.dirname(image_store.root_dir), img["image_path"]),
+                    image_store.root_dir
+                )
+        image_store.update_manifest(entries)
+    
+    def _worker_options(self):
+        """進程池工作進程重建PDFProcessor所需的參數
+        
+        工作進程本身已在進程池中，圖表區域在進程內串行渲染，OCR也在進程內串行執行。
+        ocr_enabled是已檢查過tesseract的結果。
+        """
+        return {
+            "pdf_dir": self.pdf_dir,
+            "formula_thresholds": self.formula_thresholds,
+            "figure_dpi": self.figure_dpi,
+            "figure_format": self.figure_format,
+            "table_screening": self.table_screening,
+            "compact_blocks": self.compact_blocks,
+            "ocr_enabled": self.ocr_enabled,
+            "ocr_lang": self.ocr_lang,
+            "ocr_dpi": self.ocr_dpi,
+            "ocr_min_chars": self.ocr_min_chars,
+            "ocr_cache_dir": self.ocr_cache_dir
+        }
+    
+    def _pending_figures(self, images):
+        """圖片列表中待截圖的圖表區域"""
+        return [img for img in images if img["type"] == "figure" and not img.get("image_path")]
+    
+    def _rasterize_figures(self, pdf_path, doc, images, image_store, workers=None, pdf_hash=None):
+        """渲染圖片列表中待截圖的圖表區域
+        
+        Args:
+            pdf_path: PDF文件路徑
+            doc: 已打開的PyMuPDF文檔對象
+            images: 圖片信息列表（圖表區域的image_path為None）
+            image_store: 圖片存儲
+            workers: 並行渲染的進程數，None表示使用figure_workers
+            pdf_hash: PDF內容哈希（None表示由柵格化器計算；同一文檔分多次渲染時應傳入）
+            
+        Returns:
+            去掉渲染失敗項後的圖片信息列表
+        """
+        figures = self._pending_figures(images)
+        if not figures:
+            return images
+        
+        rasterizer = FigureRasterizer(
+            image_store,
+            dpi=self.figure_dpi,
+            image_format=self.figure_format,
+            workers=self.figure_workers if workers is None else workers
+        )
+        rasterizer.rasterize(pdf_path, figures, doc=doc, pdf_hash=pdf_hash)
+        
+        stats = rasterizer.get_statistics()
+        print(f"圖表區域渲染: 新渲染 {stats['rendered']} 個，沿用已有渲染 {stats['reused']} 個")
+        
+        return [img for img in images if img.get("image_path")]
+    
+    def _ocr_available(self):
+        """檢查本地tesseract是否可用，不可用時提示並跳過OCR"""
+        if OCREngine.is_available():
+            return True
+        print("未找到tesseract程序，跳過OCR（掃描頁面和圖片中的文字不會被提取）")
+        return False
+    
+    def _ocr_fingerprint(self):
+        """OCR設置的指紋，用於解析緩存鍵"""
+        if not self.ocr_enabled:
+            return "noocr"
+        return f"ocr{self.ocr_lang}.{self.ocr_dpi}.{self.ocr_min_chars}"
+    
+    def _is_scanned_page(self, blocks):
+        """判斷頁面是否為沒有文本層的掃描頁面（文本很少且含有圖片）"""
+        text_chars = sum(len(block.get("content", "")) for block in blocks if block.get("type") != "image")
+        has_image = any(block.get("type") == "image" for block in blocks)
+        return has_image and text_chars < self.ocr_min_chars
+    
+    def _apply_ocr(self, doc, text_data, images, image_store, workers=None):
+        """對掃描頁面和提取的圖片運行OCR
+        
+        掃描頁面按ocr_dpi渲染後識別，識別出的段落作為文本塊追加到頁面，
+        與普通文本塊走相同的翻譯流程；提取的圖片識別結果寫入text_in_image。
+        
+        Args:
+            doc: 已打開的PyMuPDF文檔對象
+            text_data: 頁面數據列表（原地修改blocks）
+            images: 圖片信息列表（原地填寫text_in_image和ocr_confidence）
+            image_store: 圖片存儲
+            workers: 並行OCR的進程數，None表示使用ocr_workers
+        """
+        if not self.ocr_enabled:
+            return
+        
+        # [(圖片字節數據, ("page", 頁面數據) 或 ("image", 圖片信息))]
+        jobs = []
+        for page_data in text_data:
+            if not self._is_scanned_page(page_data["blocks"]):
+                continue
+            try:
+                pix = doc[page_data["page_num"] - 1].get_pixmap(dpi=self.ocr_dpi)
+                jobs.append((pix.tobytes("png"), ("page", page_data)))
             except Exception as e:
-                print(f"使用PyMuPDF提取表格時出錯: {str(e)}")
+                print(f"渲染掃描頁面時出錯: {str(e)}")
         
-        return tables
+        # 只識別直接提取的圖片；圖表區域截圖來自頁面本身，文字已在文本層中
+        for img in images:
+            if img["type"] != "image" or not img.get("image_path"):
+                continue
+            try:
+                with open(os.path.join(os.path.dirname(image_store.root_dir), img["image_path"]), 'rb') as f:
+                    jobs.append((f.read(), ("image", img)))
+            except Exception as e:
+                print(f"讀取待OCR圖片時出錯: {str(e)}")
+        
+        if not jobs:
+            return
+        
+        engine = OCREngine(
+            cache_dir=self.ocr_cache_dir,
+            workers=self.ocr_workers if workers is None else workers,
+            lang=self.ocr_lang
+        )
+        results = engine.recognize_batch([data for data, _ in jobs])
+        
+        for (_, (kind, target)), result in zip(jobs, results):
+            if not result or not result["text"]:
+                continue
+            if kind == "page":
+                page = doc[target["page_num"] - 1]
+                target["blocks"] = self._ocr_page_blocks(target["blocks"], result, page.rect)
+            else:
+                target["text_in_image"] = result["text"]
+                target["ocr_confidence"] = result["confidence"]
+        
+        stats = engine.get_statistics()
+        print(f"OCR: 新識別 {stats['recognized']} 張，沿用緩存 {stats['cache_hits']} 張")
     
-    def _find_table_caption(self, page, table_idx):
-        """查找表格的標題
+    def _ocr_page_blocks(self, blocks, result, page_rect):
+        """把掃描頁面的OCR結果轉換為文本塊並追加到頁面塊之後
         
         Args:
-            page: PDF頁面對象
-            table_idx: 表格索引
+            blocks: 頁面原有的塊（列表或BlockStore）
+            result: OCREngine的識別結果（座標為渲染圖片的像素）
+            page_rect: 頁面矩形，用於把像素座標換算回PDF座標
+        
+        Returns:
+            新的塊列表（compact_blocks為True時為BlockStore）
+        """
+        scale = 72.0 / self.ocr_dpi
+        texts = [ocr_block["text"] for ocr_block in result["blocks"]]
+        formula_scores = self.formula_classifier.score_batch(texts)
+        is_formula = self.formula_classifier.decide(formula_scores)
+        
+        page_blocks = blocks.to_dicts() if isinstance(blocks, BlockStore) else list(blocks)
+        for pos, ocr_block in enumerate(result["blocks"]):
+            x0, y0, x1, y1 = ocr_block["bbox"]
+            page_blocks.append({
+                "type": "formula" if is_formula[pos] else "text",
+                "content": ocr_block["text"],
+                "bbox": (page_rect.x0 + x0 * scale, page_rect.y0 + y0 * scale,
+                         page_rect.x0 + x1 * scale, page_rect.y0 + y1 * scale),
+                "formula_score": round(float(formula_scores["score"][pos]), 3),
+                "source": "ocr",
+                "ocr_confidence": ocr_block["confidence"]
+            })
+        
+        if self.compact_blocks:
+            return BlockStore.from_dicts(page_blocks)
+        return page_blocks
+    
+    def _extract_page_blocks(self, pdf_path, page, text_dict, page_index):
+        """從頁面文本字典中提取文本塊、公式塊和圖像塊
+        
+        圖像塊不再攜帶解碼後的圖片數據，只保存PDF路徑、頁碼、xref和邊界框，
+        需要圖片內容時通過load_image_bytes()按需讀取。
+        
+        Args:
+            pdf_path: PDF文件路徑（保存在圖像塊中，用於按需讀取圖片）
+            page: PyMuPDF頁面對象
+            text_dict: page.get_text("dict", flags=TEXT_DICT_FLAGS)的結果
+            page_index: 該頁的PageTextIndex（提供拼接好的塊文本）
             
         Returns:
-            可能的表格標題
+            頁面的塊列表（compact_blocks為True時為BlockStore）
         """
-        try:
-            # 獲取頁面文本
-            text = ""
-            if hasattr(page, 'extract_text'):  # pdfplumber頁面
-                text = page.extract_text()
-            else:  # PyMuPDF頁面
-                text = page.get_text("text")
+        # [(塊編號, 塊)]，最後按塊編號合併文本塊和圖像塊，保持頁面中的順序
+        numbered_blocks = []
+        
+        # 整頁的文本塊一次性批量判斷是否可能是公式
+        block_texts = [entry["text"] for entry in page_index.entries]
+        formula_scores = self.formula_classifier.score_batch(block_texts)
+        is_formula = self.formula_classifier.decide(formula_scores)
+        text_block_pos = {entry["block_idx"]: pos for pos, entry in enumerate(page_index.entries)}
+        
+        for block_idx, block in enumerate(text_dict["blocks"]):
+            if "lines" in block:  # 文本塊
+                pos = text_block_pos[block_idx]
+                
+                numbered_blocks.append((block.get("number", block_idx), {
+                    "type": "formula" if is_formula[pos] else "text",
+                    "content": block_texts[pos].strip(),
+                    "bbox": block["bbox"],  # 座標，用於之後重建結構
+                    "formula_score": round(float(formula_scores["score"][pos]), 3)
+                }))
+        
+        # 圖像塊：只記錄句柄（內嵌圖片的xref為0，按需讀取時按邊界框渲染）
+        for info in page.get_image_info(xrefs=True):
+            numbered_blocks.append((info.get("number", len(numbered_blocks)), {
+                "type": "image",
+                "bbox": tuple(info["bbox"]),
+                "pdf_path": pdf_path,
+                "page_num": page.number + 1,
+                "xref": info.get("xref", 0)
+            }))
+        
+        numbered_blocks.sort(key=lambda item: item[0])
+        page_blocks = [block for _, block in numbered_blocks]
+        
+        if self.compact_blocks:
+            return BlockStore.from_dicts(page_blocks)
+        return page_blocks
+    
+    def _extract_page_images(self, doc, page, page_idx, page_index, image_store, output_basename):
+        """提取並保存單頁的圖片和可能的圖表區域
+        
+        Args:
+            doc: PyMuPDF文檔對象
+            page: PyMuPDF頁面對象
+            page_idx: 頁面索引（從0開始）
+            page_index: 該頁的PageTextIndex
+            image_store: 圖片存儲（按內容去重）
+            output_basename: 文檔名稱，用於圖片清單和同文檔xref去重
             
-            # 尋找各種形式的表格標題
-            patterns = [
-                r'Table\s+\d+[\.\:]\s*([^\n]+)',
-                r'Table\s+\d+\s+([^\n]+)',
-                r'表\s*\d+[\.\:]\s*([^\n]+)',
-                r'Tab\.\s*\d+[\.\:]\s*([^\n]+)'
-            ]
+        Returns:
+            該頁的圖片信息列表
+        """
+        images = []
+        
+        # 獲取頁面上的圖片
+        image_list = page.get_images(full=True)
+        
+        for img_idx, img in enumerate(image_list):
+            try:
+                # 同一文檔中重複引用的xref只提取一次
+                xref = img[0]
+                blob_path = image_store.lookup_xref(output_basename, xref)
+                if blob_path is None:
+                    # 提取圖片並按內容保存（相同內容跨文檔只存一份）
+                    base_image = doc.extract_image(xref)
+                    blob_path = image_store.put_bytes(base_image["image"], base_image["ext"])
+                    image_store.remember_xref(output_basename, xref, blob_path)
+                img_path = os.path.join(image_store.root_dir, blob_path)
+                
+                # 獲取圖片在頁面中的位置
+                bbox = page.get_image_bbox(img)
+                
+                # 尋找圖片附近的可能圖表標題
+                caption = self._find_image_caption(page_index, bbox)
+                
+                # 添加圖片信息
+                images.append({
+                    "type": "image",
+                    "page_num": page_idx + 1,
+                    "img_index": img_idx,
+                    "bbox": [float(coord) for coord in bbox],
+                    "image_path": os.path.join("images", blob_path),  # 使用相對路徑
+                    "image_name": ImageStore.logical_name(output_basename, page_idx + 1, "img", img_idx + 1),
+                    "caption": caption
+                })
+                
+                print(f"已提取並保存圖片: {img_path}")
+                
+            except Exception as e:
+                print(f"處理圖片時出錯: {e}")
+        
+        # 檢測頁面中無法直接提取的圖表
+        try:
+            # 查找空間索引中標記為圖表標題的文本塊
+            for entry in page_index.entries:
+                block_idx = entry["block_idx"]
+                
+                # 檢查是否是圖表標題
+                if entry["is_figure_caption"]:
+                    # 這個塊可能是圖表標題，檢查上方的區域
+                    caption = entry["text"].strip()
+                    x0, y0, x1, y1 = entry["bbox"]
+                    
+                    # 假設圖表在標題上方約200-300像素
+                    figure_area = (x0-50, max(0, y0-300), x1+50, y0-5)
+                    
+                    # 只記錄區域，由_rasterize_figures統一渲染
+                    images.append({
+                        "type": "figure",
+                        "page_num": page_idx + 1,
+                        "img_index": 1000 + block_idx,  # 避免與直接提取的圖片索引衝突
+                        "bbox": [float(coord) for coord in figure_area],
+                        "clip": figure_area,
+                        "image_path": None,
+                        "image_name": ImageStore.logical_name(output_basename, page_idx + 1, "fig", block_idx),
+                        "caption": caption
+                    })
+        except Exception as e:
+            print(f"尋找頁面中的圖表區域時出錯: {e}")
+        
+        return images
+    
+    def _extract_page_tables(self, page_index, plumber_page, page_idx):
+        """使用pdfplumber提取單頁的表格
+        
+        Args:
+            page_index: 該頁的PageTextIndex（用於查找標題）
+            plumber_page: 同一頁的pdfplumber頁面對象
+            page_idx: 頁面索引（從0開始）
             
-            # 查找所有匹配
-            all_matches = []
-            for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                all_matches.extend([(m.start(), m.group(0)) for m in matches])
+        Returns:
+            該頁的表格信息列表
+        """
+        tables = []
+        
+        for table_idx, table in enumerate(plumber_page.find_tables()):
+            # 過濾空行和空單元格
+            filtered_table = []
+            for row in table.extract():
+                if any(cell and str(cell).strip() for cell in row):
+                    filtered_row = [str(cell).strip() if cell else "" for cell in row]
+                    filtered_table.append(filtered_row)
             
-            # 按位置排序
-            all_matches.sort()
+            if filtered_table:
+                # 嘗試查找表格標題
+                caption = self._find_table_caption(page_index, table.bbox)
+                
+                # 添加表格信息
+                tables.append({
+                    "type": "table",
+                    "page_num": page_idx + 1,
+                    "table_idx": table_idx,
+                    "data": filtered_table,
+                    "has_header": True,  # 通常第一行為表頭
+                    "caption": caption
+                })
+                
+                print(f"已提取表格: 頁面 {page_idx+1}, 表格 {table_idx}")
+        
+        return tables
+    
+    def _extract_tables_with_pymupdf(self, doc, start=0, end=None, pages=None):
+        """使用PyMuPDF的表格檢測功能提取表格（pdfplumber的備用方案）
+        
+        Args:
+            doc: 已打開的PyMuPDF文檔對象
+            start: 起始頁索引（從0開始）
+            end: 結束頁索引（不包含），None表示到文檔末尾
+            pages: 只處理這些頁面索引（預篩選的候選頁），None表示處理範圍內所有頁面
             
-            # 嘗試找到對應這個表格的標題
-            if table_idx < len(all_matches):
-                return all_matches[table_idx][1].strip()
+        Returns:
+            提取的表格信息列表
+        """
+        tables = []
+        if end is None:
+            end = len(doc)
+        
+        try:
+            for page_idx in range(start, end):
+                if pages is not None and page_idx not in pages:
+                    continue
+                tables.extend(self._extract_page_tables_with_pymupdf(doc[page_idx], page_idx))
         except Exception as e:
-            print(f"查找表格標題時出錯: {e}")
+            print(f"使用PyMuPDF提取表格時出錯: {str(e)}")
         
-        return ""
+        return tables
     
-    def _find_image_caption(self, page, bbox):
+    def _extract_page_tables_with_pymupdf(self, page, page_idx):
+        """使用PyMuPDF提取單頁的表格
+        
+        Args:
+            page: PyMuPDF頁面對象
+            page_idx: 頁面索引（從0開始）
+            
+        Returns:
+            該頁的表格信息列表
+        """
+        tables = []
+        
+        tab = page.find_tables()
+        if tab and tab.tables:
+            page_index = PageTextIndex(page.get_text("dict", flags=TEXT_DICT_FLAGS))
+            for table_idx, table in enumerate(tab.tables):
+                # 從表格中提取數據，確保行不是空的
+                table_data = []
+                for row in table.extract():
+                    row_data = [str(cell).strip() if cell else "" for cell in row]
+                    if any(row_data):
+                        table_data.append(row_data)
+                
+                if table_data:
+                    # 尋找表格標題
+                    caption = self._find_table_caption(page_index, table.bbox)
+                    
+                    tables.append({
+                        "type": "table",
+                        "page_num": page_idx + 1,
+                        "table_idx": table_idx,
+                        "data": table_data,
+                        "has_header": True,
+                        "caption": caption
+                    })
+                    
+                    print(f"已使用PyMuPDF提取表格: 頁面 {page_idx+1}, 表格 {table_idx}")
+        
+        return tables
+    
+    def group_tables_by_page(self, tables):
+        """按頁面組織表格數據
+        
+        Args:
+            tables: 表格信息列表
+            
+        Returns:
+            [{"page_num": ..., "tables": [...]}, ...]
+        """
+        table_data = []
+        max_page = max([table["page_num"] for table in tables], default=0)
+        for page_num in range(1, max_page + 1):
+            page_tables = [table for table in tables if table["page_num"] == page_num]
+            if page_tables:
+                table_data.append({
+                    "page_num": page_num,
+                    "tables": page_tables
+                })
+        return table_data
+    
+    def _find_image_caption(self, page_index, bbox):
         """查找圖片附近的標題文本
         
         Args:
-            page: PDF 頁面對象
+            page_index: 該頁的PageTextIndex
             bbox: 圖片邊界框
             
         Returns:
@@ -361,36 +946,16 @@ class PDFProcessor:
         x0, y0, x1, y1 = bbox
         
         # 檢查圖片下方的文本 (常見的圖表標題位置)
-        below_text = page.get_text("text", clip=(x0, y1, x1, y1 + 50))
-        if below_text and re.search(r'(figure|fig\.?|圖)\s*\d+', below_text, re.IGNORECASE):
-            return below_text.strip()
+        below_text = page_index.find_caption((x0, y1, x1, y1 + 50), "figure")
+        if below_text:
+            return below_text
         
         # 檢查圖片上方的文本
-        above_text = page.get_text("text", clip=(x0, max(0, y0 - 50), x1, y0))
-        if above_text and re.search(r'(figure|fig\.?|圖)\s*\d+', above_text, re.IGNORECASE):
-            return above_text.strip()
-        
-        return ""
+        return page_index.find_caption((x0, max(0, y0 - 50), x1, y0), "figure")
     
     def _check_if_formula(self, text):
-        """簡單檢查文本是否可能是數學公式"""
-        # 數學符號的簡單檢測
-        math_symbols = ['∫', '∑', '∏', '√', '≈', '≠', '≤', '≥', '±', '∞', '∂', '∇', '∆', '∈', '∉', '∩', '∪']
-        formula_indicators = ['=', '+', '-', '*', '/', '^', '(', ')', '[', ']', '{', '}']
-        
-        # 檢查LaTeX風格的公式標記
-        if '\\begin{equation}' in text or '\\end{equation}' in text:
-            return True
-        
-        # 檢查常見數學符號
-        symbol_count = sum(1 for symbol in math_symbols if symbol in text)
-        indicator_count = sum(1 for indicator in formula_indicators if indicator in text)
-        
-        # 如果包含多個數學符號和指標，可能是公式
-        if (symbol_count > 0) or (indicator_count > 3 and len(text) < 100):
-            return True
-            
-        return False
+        """簡單檢查文本是否可能是數學公式（單塊版本，批量判斷見FormulaClassifier）"""
+        return self.formula_classifier.classify_one(text)
     
     def detect_language(self, text):
         """檢測文本語言"""
@@ -399,36 +964,79 @@ class PDFProcessor:
         except:
             return "unknown"
     
-    def process_pdf(self, pdf_path):
+    def process_pdf(self, pdf_path, name=None):
         """處理單個 PDF 文件
         
         Args:
-            pdf_path: PDF 文件路徑
+            pdf_path: PDF 文件路徑、PDFSource，或PDF數據（bytes、memoryview、mmap）
+            name: PDF數據的文件名（圖片目錄和輸出文件名依此確定）
             
         Returns:
             處理結果字典
         """
+        pdf_path = self._as_source(pdf_path, name)
         filename = os.path.basename(pdf_path)
         print(f"處理 {filename}...")
         
-        # 提取文本和結構
-        text_data = self.extract_text_with_pymupdf(pdf_path)
-        
-        # 提取表格
-        table_data = self.extract_text_with_pdfplumber(pdf_path)
-        
-        # 提取圖像 - 使用修改後的方法
-        images = self.extract_images(pdf_path)
+        # 單次遍歷提取文本、圖像和表格（命中解析緩存時直接使用緩存結果）
+        parsed = self._parse_with_cache(pdf_path)
+        text_data = parsed["text_data"]
         
         # 組織結果
         result = {
             "filename": filename,
             "text_data": text_data,
-            "table_data": table_data,
-            "images": images
+            "table_data": self.group_tables_by_page(parsed["tables"]),
+            "images": parsed["images"],
+            "table_screening": parsed.get("table_screening", [])
         }
         
         # 檢測文檔主要語言
+        result["primary_language"] = self._detect_primary_language(text_data)
+        
+        self.processed_data[filename] = result
+        return result
+    
+    def process_pages(self, pdf_path, page_indices, name=None):
+        """只解析指定頁面（增量處理時用於重新提取已改變的頁面）
+        
+        按頁解析，PyMuPDF表格備用方案按頁判斷，與iter_pages相同。
+        結果格式與process_pdf相同，只包含指定頁面。
+        
+        Args:
+            pdf_path: PDF文件路徑、PDFSource或PDF數據
+            page_indices: 頁面索引列表（從0開始）
+            name: PDF數據的文件名
+            
+        Returns:
+            處理結果字典
+        """
+        pdf_path = self._as_source(pdf_path, name)
+        filename = os.path.basename(pdf_path)
+        print(f"重新解析 {filename} 的 {len(page_indices)} 頁...")
+        
+        text_data = []
+        images = []
+        tables = []
+        table_screening = []
+        
+        for page in self.iter_pages(pdf_path, pages=sorted(page_indices)):
+            images.extend(page.pop("images"))
+            tables.extend(page.pop("tables"))
+            table_screening.append(page.pop("table_screening"))
+            text_data.append(page)
+        
+        return {
+            "filename": filename,
+            "text_data": text_data,
+            "table_data": self.group_tables_by_page(tables),
+            "images": images,
+            "table_screening": table_screening,
+            "primary_language": self._detect_primary_language(text_data)
+        }
+    
+    def _detect_primary_language(self, text_data):
+        """根據文本塊檢測文檔主要語言"""
         all_text = ""
         for page in text_data:
             for block in page["blocks"]:
@@ -436,12 +1044,50 @@ class PDFProcessor:
                     all_text += block["content"] + " "
         
         if all_text:
-            result["primary_language"] = self.detect_language(all_text[:1000])
-        else:
-            result["primary_language"] = "unknown"
+            return self.detect_language(all_text[:1000])
+        return "unknown"
+    
+    def _parse_with_cache(self, pdf_path):
+        """通過解析緩存獲取解析結果
         
-        self.processed_data[filename] = result
-        return result
+        緩存命中且圖片文件仍然存在時，不調用fitz或pdfplumber；
+        否則重新解析並寫入緩存。
+        
+        Args:
+            pdf_path: PDF文件路徑
+            
+        Returns:
+            parse_document格式的解析結果
+        """
+        if self.parse_cache is None:
+            return self.parse_document(pdf_path)
+        
+        # 公式分類閾值、圖表渲染、表格預篩選和OCR設置會改變解析結果，也計入緩存鍵
+        cache_key = self.parse_cache.make_key(
+            pdf_path,
+            f"{PARSER_VERSION}-{self.formula_classifier.fingerprint()}-{self.figure_dpi}{self.figure_format}"
+            f"-{'screened' if self.table_screening else 'all'}{'-compact' if self.compact_blocks else ''}"
+            f"-{self._ocr_fingerprint()}"
+        )
+        parsed = self.parse_cache.get(cache_key)
+        
+        if parsed is not None:
+            if self._cached_images_exist(pdf_path, parsed["images"]):
+                print(f"使用解析緩存: {os.path.basename(pdf_path)}")
+                return parsed
+            print(f"解析緩存中的圖片文件已缺失，重新解析: {os.path.basename(pdf_path)}")
+        
+        parsed = self.parse_document(pdf_path)
+        self.parse_cache.put(cache_key, parsed)
+        return parsed
+    
+    def _cached_images_exist(self, pdf_path, images):
+        """檢查緩存結果引用的圖片文件是否都還在磁盤上"""
+        output_dir = os.path.join(os.path.dirname(os.path.dirname(pdf_path)), "translated_pdfs")
+        return all(
+            os.path.exists(os.path.join(output_dir, img["image_path"]))
+            for img in images if img.get("image_path")
+        )
     
     def _detect_tables(self, page):
         """檢測頁面中的表格
@@ -456,6 +1102,7 @@ class PDFProcessor:
         
         # 使用 PyMuPDF 的表格檢測功能
         try:
+            page_index = PageTextIndex(page.get_text("dict", flags=TEXT_DICT_FLAGS))
             tab = page.find_tables()
             if tab and tab.tables:
                 for idx, table in enumerate(tab.tables):
@@ -503,7 +1150,7 @@ class PDFProcessor:
                     table_html += "</tbody></table>"
                     
                     # 尋找表格附近的標題
-                    caption = self._find_table_caption(page, table.bbox)
+                    caption = self._find_table_caption(page_index, table.bbox)
                     
                     tables.append({
                         "type": "table",
@@ -516,11 +1163,11 @@ class PDFProcessor:
         
         return tables
 
-    def _find_table_caption(self, page, bbox):
+    def _find_table_caption(self, page_index, bbox):
         """尋找表格附近的標題
         
         Args:
-            page: 頁面對象
+            page_index: 該頁的PageTextIndex
             bbox: 表格邊界框
             
         Returns:
@@ -529,16 +1176,12 @@ class PDFProcessor:
         x0, y0, x1, y1 = bbox
         
         # 檢查表格上方的文本 (常見的表格標題位置)
-        above_text = page.get_text("text", clip=(x0, max(0, y0 - 50), x1, y0))
-        if above_text and re.search(r'(table|tab\.?|表)\s*\d+', above_text, re.IGNORECASE):
-            return above_text.strip()
+        above_text = page_index.find_caption((x0, max(0, y0 - 50), x1, y0), "table")
+        if above_text:
+            return above_text
         
         # 檢查表格下方的文本
-        below_text = page.get_text("text", clip=(x0, y1, x1, y1 + 50))
-        if below_text and re.search(r'(table|tab\.?|表)\s*\d+', below_text, re.IGNORECASE):
-            return below_text.strip()
-        
-        return ""
+        return page_index.find_caption((x0, y1, x1, y1 + 50), "table")
     
     def process_all_pdfs(self):
         """處理目錄中所有PDF文件"""
@@ -549,6 +1192,57 @@ class PDFProcessor:
         print(f"已處理 {len(pdf_files)} 個PDF文件")
         return self.processed_data
 
+def load_image_bytes(block, pdf_path=None, doc=None, dpi=150):
+    """按需讀取圖像塊的圖片數據
+    
+    Args:
+        block: 圖像塊（包含pdf_path、page_num、xref和bbox）
+        pdf_path: 覆蓋塊中記錄的PDF路徑（例如文件已移動），也可以是PDFSource
+                  （內存中的文檔在塊中記錄的路徑為空，需要傳入PDFSource或doc）
+        doc: 已打開的PyMuPDF文檔對象，批量讀取時可避免反覆打開文件
+        dpi: 內嵌圖片（xref為0）按邊界框渲染時的分辨率
+        
+    Returns:
+        (圖片字節數據, 擴展名)，讀取失敗時返回 (None, None)
+    """
+    # 兼容舊的解析結果：塊中直接帶有圖片數據
+    if block.get("image"):
+        return block["image"], "png"
+    
+    own_doc = doc is None
+    try:
+        if own_doc:
+            doc = open_fitz(pdf_path or block["pdf_path"])
+        
+        xref = block.get("xref", 0)
+        if xref:
+            base_image = doc.extract_image(xref)
+            if base_image:
+                return base_image["image"], base_image["ext"]
+        
+        page = doc[block["page_num"] - 1]
+        pix = page.get_pixmap(clip=fitz.Rect(block["bbox"]), dpi=dpi)
+        return pix.tobytes("png"), "png"
+    except Exception as e:
+        print(f"讀取圖像塊數據時出錯: {str(e)}")
+        return None, None
+    finally:
+        if own_doc and doc is not None:
+            doc.close()
+
+def _parse_page_range_worker(processor_options, pdf_path, start, end, images_dir, output_basename, pdf_hash=None):
+    """進程池工作函數：按路徑重新打開文檔並解析一個頁面範圍"""
+    # ocr_enabled是父進程檢查tesseract後的結果，工作進程直接沿用，不再逐個任務檢查和提示
+    processor = PDFProcessor(**dict(processor_options, ocr_enabled=False))
+    processor.ocr_enabled = processor_options["ocr_enabled"]
+    return processor._parse_page_range(pdf_path, start, end, images_dir, output_basename, pdf_hash=pdf_hash)
+
+def _pymupdf_tables_worker(pdf_dir, pdf_path, start, end, pages=None):
+    """進程池工作函數：使用PyMuPDF提取一個頁面範圍的表格"""
+    processor = PDFProcessor(pdf_dir=pdf_dir, ocr_enabled=False)
+    with fitz.open(pdf_path) as doc:
+        return processor._extract_tables_with_pymupdf(doc, start, end, pages=pages)
+
 # 使用示例
 if __name__ == "__main__":
     processor = PDFProcessor(pdf_dir="raw_pdfs")
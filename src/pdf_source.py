@@ -0,0 +1,125 @@
+import io
+import os
+import mmap
+import hashlib
+import fitz  # PyMuPDF
+import pdfplumber
+
+class PDFSource:
+    """內存中的PDF（bytes、memoryview或mmap）
+    
+    所有提取器共用同一份緩衝區：PyMuPDF通過fitz.open(stream=...)打開（mmap、bytearray經memoryview傳入，不複製），
+    pdfplumber直接讀取同一緩衝區（mmap本身即是文件對象；bytes包裝為BytesIO，不複製）。
+    from_file打開的文檔也在內存中讀取，磁盤路徑只用於進程池工作進程重新打開。
+    實現了os.PathLike，path是邏輯路徑（用於圖片目錄、輸出文件名），
+    網絡上傳的文檔不需要先寫入raw_pdfs。
+    """
+    
+    def __init__(self, data, path="document.pdf", on_disk=False):
+        """包裝PDF數據
+        
+        Args:
+            data: bytes、bytearray、memoryview或mmap對象
+            path: 邏輯路徑（文件不必存在）
+            on_disk: path是否是磁盤上內容相同的真實文件（只用於進程池工作進程按路徑重新打開）
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+            raise TypeError(f"不支持的PDF數據類型: {type(data).__name__}")
+        self.data = data
+        self.path = os.fspath(path)
+        self.on_disk = on_disk
+        self._buffer = None
+        self._sha256 = None
+    
+    @classmethod
+    def from_file(cls, path):
+        """以只讀mmap打開磁盤上的PDF，一次映射供所有提取器使用"""
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(data, path, on_disk=True)
+    
+    def __fspath__(self):
+        return self.path
+    
+    def __str__(self):
+        return self.path
+    
+    def __repr__(self):
+        return f"PDFSource({self.path!r}, {len(self.data)} bytes)"
+    
+    def as_buffer(self):
+        """取得可作為PyMuPDF stream參數的緩衝區，不複製數據
+        
+        bytes和memoryview直接返回（覆蓋整個bytes對象的memoryview返回其底層對象）；
+        mmap和bytearray返回覆蓋它們的memoryview（fitz.open不接受裸mmap）。
+        """
+        if self._buffer is None:
+            data = self.data
+            if isinstance(data, memoryview) and isinstance(data.obj, bytes) and data.nbytes == len(data.obj):
+                self._buffer = data.obj
+            elif isinstance(data, (bytes, memoryview)):
+                self._buffer = data
+            else:
+                self._buffer = memoryview(data)
+        return self._buffer
+    
+    def open_fitz(self):
+        """用PyMuPDF打開，讀取同一緩衝區"""
+        return fitz.open(stream=self.as_buffer(), filetype="pdf")
+    
+    def open_pdfplumber(self):
+        """用pdfplumber打開，讀取同一緩衝區（bytearray和memoryview需要BytesIO複製一次）"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.seek(0)
+            return pdfplumber.open(self.data)
+        return pdfplumber.open(io.BytesIO(self.as_buffer()))
+    
+    def sha256(self):
+        """計算並緩存數據的SHA-256"""
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+    
+    def close(self):
+        """釋放mmap（數據為bytes時無需調用）
+        
+        仍有打開的PyMuPDF文檔引用緩衝區時mmap無法關閉，隨這些文檔一起釋放。
+        """
+        self._buffer = None
+        if isinstance(self.data, mmap.mmap) and not self.data.closed:
+            try:
+                self.data.close()
+            except BufferError:
+                pass
+
+def as_pdf_source(source, name=None):
+    """把bytes、memoryview或mmap包裝為PDFSource，文件路徑和PDFSource原樣返回
+    
+    Args:
+        source: 文件路徑、PDFSource或PDF數據
+        name: 內存數據的邏輯文件名
+    
+    Returns:
+        文件路徑或PDFSource
+    """
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        return PDFSource(source, name or "document.pdf")
+    return source
+
+def open_fitz(source):
+    """用PyMuPDF打開文件路徑或PDFSource"""
+    if isinstance(source, PDFSource):
+        return source.open_fitz()
+    return fitz.open(source)
+
+def open_pdfplumber(source):
+    """用pdfplumber打開文件路徑或PDFSource"""
+    if isinstance(source, PDFSource):
+        return source.open_pdfplumber()
+    return pdfplumber.open(source)
+
+def worker_path(source):
+    """進程池工作進程可重新打開的路徑，純內存的數據返回None"""
+    if isinstance(source, PDFSource):
+        return source.path if source.on_disk else None
+    return source
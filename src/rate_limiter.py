@@ -0,0 +1,169 @@
+import time
+import asyncio
+import threading
+
+class TokenBucket:
+    """令牌桶
+    
+    容量為每分鐘限額，按限額/60的速率持續補充。
+    調用前按估計值扣除，調用後按實際用量補差，桶內餘量可以暫時為負（欠額），
+    欠額補足前後續請求需要等待。
+    """
+    
+    def __init__(self, per_minute):
+        """初始化令牌桶
+        
+        Args:
+            per_minute: 每分鐘限額
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    
+    def refill(self, now):
+        """按經過的時間補充令牌"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount):
+        """取得amount個令牌還需要等待的秒數（已補充到當前時間）"""
+        # 單次請求超過容量時按容量計算，否則永遠無法滿足
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+class RateLimiter:
+    """按請求數、輸入令牌數和輸出令牌數限速
+    
+    三個令牌桶分別對應每分鐘請求數、每分鐘輸入令牌數和每分鐘輸出令牌數。
+    每次調用前用acquire()/aacquire()按估計的令牌數扣除（三個桶都足夠時才一起扣除），
+    調用完成後用reconcile()按response.usage補差。
+    內部狀態由線程鎖保護，同步接口和asyncio接口可以混用，
+    同一實例可在ClaudeTranslator和MCPPPTGenerator之間共享，使兩者合計不超過組織限額。
+    """
+    
+    def __init__(self, requests_per_minute=50, input_tokens_per_minute=20000, output_tokens_per_minute=8000):
+        """初始化限速器
+        
+        Args:
+            requests_per_minute: 每分鐘請求數上限
+            input_tokens_per_minute: 每分鐘輸入令牌數上限
+            output_tokens_per_minute: 每分鐘輸出令牌數上限
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.input_tokens = TokenBucket(input_tokens_per_minute)
+        self.output_tokens = TokenBucket(output_tokens_per_minute)
+        self._lock = threading.Lock()
+        
+        # 統計
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.used_input_tokens = 0
+        self.used_output_tokens = 0
+    
+    @staticmethod
+    def estimate_tokens(text):
+        """粗略估計文本的令牌數
+        
+        英文約4個字符一個令牌，中日韓等非ASCII字符約一個字符一個令牌。
+        只用於調用前的扣除，誤差由reconcile()修正。
+        
+        Args:
+            text: 提示文本
+        
+        Returns:
+            估計的令牌數
+        """
+        if not text:
+            return 0
+        non_ascii = len(text.encode("utf-8")) - len(text)
+        # UTF-8中中日韓字符佔3字節，多出的字節數除以2約等於非ASCII字符數
+        wide = non_ascii // 2
+        return (len(text) - wide) // 4 + wide + 1
+    
+    def _try_acquire(self, input_tokens, output_tokens):
+        """三個桶都足夠時一起扣除
+        
+        Returns:
+            0表示已扣除，否則為需要等待的秒數
+        """
+        with self._lock:
+            now = time.monotonic()
+            buckets = ((self.requests, 1), (self.input_tokens, input_tokens), (self.output_tokens, output_tokens))
+            wait = 0.0
+            for bucket, amount in buckets:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+            if wait > 0:
+                return wait
+            for bucket, amount in buckets:
+                bucket.level -= amount
+            self.acquired += 1
+            return 0.0
+    
+    def _record_wait(self, wait):
+        with self._lock:
+            self.throttled += 1
+            self.total_wait += wait
+    
+    def acquire(self, input_tokens=0, output_tokens=0):
+        """同步等待直到可以發出請求
+        
+        Args:
+            input_tokens: 估計的輸入令牌數
+            output_tokens: 估計的輸出令牌數
+        """
+        wait = self._try_acquire(input_tokens, output_tokens)
+        while wait > 0:
+            self._record_wait(wait)
+            time.sleep(wait)
+            wait = self._try_acquire(input_tokens, output_tokens)
+    
+    async def aacquire(self, input_tokens=0, output_tokens=0):
+        """acquire的異步版本，等待期間不阻塞事件循環"""
+        wait = self._try_acquire(input_tokens, output_tokens)
+        while wait > 0:
+            self._record_wait(wait)
+            await asyncio.sleep(wait)
+            wait = self._try_acquire(input_tokens, output_tokens)
+    
+    def reconcile(self, input_tokens, output_tokens, usage=None):
+        """按實際用量修正調用前扣除的估計值
+        
+        Args:
+            input_tokens: 調用前估計的輸入令牌數
+            output_tokens: 調用前估計的輸出令牌數
+            usage: response.usage（None表示請求失敗，退回估計的令牌）
+        """
+        actual_input = 0
+        actual_output = 0
+        if usage is not None:
+            actual_input = (getattr(usage, "input_tokens", 0) or 0) \
+                + (getattr(usage, "cache_creation_input_tokens", 0) or 0) \
+                + (getattr(usage, "cache_read_input_tokens", 0) or 0)
+            actual_output = getattr(usage, "output_tokens", 0) or 0
+        
+        with self._lock:
+            now = time.monotonic()
+            self.input_tokens.refill(now)
+            self.output_tokens.refill(now)
+            self.input_tokens.level += input_tokens - actual_input
+            self.output_tokens.level += output_tokens - actual_output
+            self.input_tokens.level = min(self.input_tokens.level, self.input_tokens.capacity)
+            self.output_tokens.level = min(self.output_tokens.level, self.output_tokens.capacity)
+            self.used_input_tokens += actual_input
+            self.used_output_tokens += actual_output
+    
+    def get_statistics(self):
+        """獲取限速統計"""
+        with self._lock:
+            return {
+                "requests": self.acquired,
+                "throttled": self.throttled,
+                "total_wait_seconds": round(self.total_wait, 2),
+                "input_tokens": self.used_input_tokens,
+                "output_tokens": self.used_output_tokens
+            }
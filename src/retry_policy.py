@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+# 可以重試的HTTP狀態碼：請求超時、衝突、限流、服務器錯誤和過載
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+# 表示服務過載的狀態碼，連續出現時觸發斷路器
+OVERLOAD_STATUS = frozenset({429, 503, 529})
+
+def status_code(exc):
+    """取得API異常的HTTP狀態碼（連接錯誤等沒有狀態碼時返回None）"""
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        response = getattr(exc, "response", None)
+        code = getattr(response, "status_code", None)
+    return code
+
+def is_retryable(exc):
+    """判斷異常是否值得重試
+    
+    可重試：連接錯誤、超時和RETRYABLE_STATUS中的狀態碼；
+    請求本身有問題（400、401、403、404等）時重試沒有意義。
+    """
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    name = type(exc).__name__
+    return name in ("APIConnectionError", "APITimeoutError") or isinstance(exc, (ConnectionError, TimeoutError))
+
+def retry_after(exc):
+    """讀取回應頭中的retry-after（秒數或HTTP日期），沒有時返回None"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """斷路器
+    
+    連續failure_threshold次過載錯誤（429、503、529）後斷開cooldown秒，
+    期間所有共享此斷路器的調用（所有並發請求、翻譯器和PPT生成器）都等待，
+    不再向已過載的服務發送請求。冷卻結束後恢復調用，
+    若第一個請求仍然過載則立即再次斷開。
+    """
+    
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        """初始化斷路器
+        
+        Args:
+            failure_threshold: 連續多少次過載錯誤後斷開
+            cooldown: 斷開後暫停的秒數
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+        self.trips = 0
+    
+    def remaining(self):
+        """斷開狀態剩餘的秒數（0表示可以調用）"""
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+    
+    def record_failure(self, exc):
+        """記錄一次失敗，過載錯誤累計到閾值時斷開"""
+        if status_code(exc) not in OVERLOAD_STATUS:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + self.cooldown
+                # 冷卻後的第一個請求再失敗就重新斷開
+                self._failures = self.failure_threshold - 1
+                self.trips += 1
+                print(f"服務持續過載，暫停所有請求 {self.cooldown:.0f} 秒")
+
+class RetryPolicy:
+    """API調用的重試策略
+    
+    可重試的錯誤按指數退避加隨機抖動重試，回應帶retry-after時按其等待；
+    每次嘗試前檢查共享的斷路器。同一實例可在多個翻譯器和PPT生成器之間共享。
+    """
+    
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0, breaker=None):
+        """初始化重試策略
+        
+        Args:
+            max_retries: 最多重試次數（不含第一次調用）
+            base_delay: 第一次重試的基準等待時間（秒）
+            max_delay: 單次等待時間上限（秒）
+            breaker: CircuitBreaker實例（None表示新建一個默認斷路器）
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.gave_up = 0
+    
+    def delay(self, attempt, exc):
+        """第attempt次重試前的等待秒數"""
+        server_delay = retry_after(exc)
+        if server_delay is not None:
+            return min(server_delay, self.max_delay)
+        # 等待時間的一半固定、一半隨機，避免並發請求同時重試
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return cap / 2 + random.uniform(0, cap / 2)
+    
+    def _should_retry(self, attempt, exc):
+        """記錄失敗並判斷是否重試"""
+        self.breaker.record_failure(exc)
+        with self._lock:
+            if attempt < self.max_retries and is_retryable(exc):
+                self.retries += 1
+                return True
+            self.gave_up += 1
+            return False
+    
+    def call(self, fn, *args, **kwargs):
+        """同步調用fn，失敗時按策略重試
+        
+        Returns:
+            fn的返回值；重試用盡或錯誤不可重試時拋出最後一次的異常
+        """
+        attempt = 0
+        while True:
+            pause = self.breaker.remaining()
+            if pause > 0:
+                time.sleep(pause)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                wait = self.delay(attempt, e)
+                print(f"API調用失敗（{type(e).__name__}），{wait:.1f} 秒後重試（第 {attempt + 1} 次）")
+                time.sleep(wait)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+    
+    async def acall(self, fn, *args, **kwargs):
+        """call的異步版本，fn是協程函數，等待期間不阻塞事件循環"""
+        attempt = 0
+        while True:
+            pause = self.breaker.remaining()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                wait = self.delay(attempt, e)
+                print(f"API調用失敗（{type(e).__name__}），{wait:.1f} 秒後重試（第 {attempt + 1} 次）")
+                await asyncio.sleep(wait)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+    
+    def get_statistics(self):
+        """獲取重試統計"""
+        return {
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+            "breaker_trips": self.breaker.trips
+        }
+
+class FailureLog:
+    """重試後仍失敗的翻譯單元記錄
+    
+    保存在JSON文件中，後續運行可以只重新翻譯這些單元（--retry-failures），
+    不需要重新處理整份文檔。失敗的單元不會寫入翻譯記憶。
+    """
+    
+    def __init__(self, path=".cache/translation_failures.json"):
+        """初始化失敗記錄
+        
+        Args:
+            path: JSON文件路徑（None表示只保存在內存中）
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # 當前正在處理的文檔，寫入每條記錄，便於重新生成受影響的文檔
+        self._document = None
+        # 當前文檔處理期間失敗（新增或再次失敗）的單元
+        self._document_failures = set()
+        self.entries = self._load()
+    
+    @property
+    def document(self):
+        return self._document
+    
+    @document.setter
+    def document(self, document):
+        """切換當前文檔，並重新開始記錄此文檔的失敗單元"""
+        with self._lock:
+            self._document = document
+            self._document_failures = set()
+    
+    def document_failures(self):
+        """設置當前文檔以來失敗的單元數
+        
+        包括再次失敗的已有記錄，不受其他單元成功後從記錄中刪除的影響，
+        可據此判斷當前文檔的譯文是否有空缺。
+        """
+        with self._lock:
+            return len(self._document_failures)
+    
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"讀取失敗記錄時出錯: {e}")
+            return []
+    
+    def _save(self):
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+    
+    def add(self, kind, source, domain, error):
+        """記錄一個失敗的單元（同一單元只保留一條）
+        
+        Args:
+            kind: 調用類型（text、formula、table、image）
+            source: 完整原文（表格為JSON字符串）
+            domain: 領域
+            error: 異常或錯誤說明
+        """
+        with self._lock:
+            self._document_failures.add((kind, source, domain))
+            for entry in self.entries:
+                if entry["kind"] == kind and entry["source"] == source and entry["domain"] == domain:
+                    entry["error"] = str(error)
+                    entry["time"] = time.time()
+                    if self.document and self.document not in entry["documents"]:
+                        entry["documents"].append(self.document)
+                    break
+            else:
+                self.entries.append({
+                    "kind": kind,
+                    "source": source,
+                    "domain": domain,
+                    "error": str(error),
+                    "time": time.time(),
+                    "documents": [self.document] if self.document else []
+                })
+            self._save()
+    
+    def remove(self, kind, source, domain):
+        """刪除已成功翻譯的單元"""
+        with self._lock:
+            before = len(self.entries)
+            self.entries = [
+                entry for entry in self.entries
+                if not (entry["kind"] == kind and entry["source"] == source and entry["domain"] == domain)
+            ]
+            if len(self.entries) != before:
+                self._save()
+    
+    def documents(self):
+        """有失敗單元的文檔"""
+        with self._lock:
+            return sorted({document for entry in self.entries for document in entry["documents"]})
+    
+    def __len__(self):
+        return len(self.entries)
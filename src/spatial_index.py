@@ -0,0 +1,107 @@
+import re
+from collections import defaultdict
+
+# 圖表標題的匹配模式
+FIGURE_CAPTION_PATTERN = re.compile(r'(figure|fig\.?|圖)\s*\d+', re.IGNORECASE)
+TABLE_CAPTION_PATTERN = re.compile(r'(table|tab\.?|表)\s*\d+', re.IGNORECASE)
+
+class PageTextIndex:
+    """單頁文本塊的網格空間索引
+
+    每頁只根據page.get_text("dict")的結果建立一次，保存每個文本塊的邊界框、
+    拼接好的文本以及是否為圖/表標題的標記。查找標題時只需查詢索引，
+    不必再用clip反覆調用MuPDF。
+    """
+
+    def __init__(self, text_dict, cell_size=64):
+        """建立索引
+
+        Args:
+            text_dict: page.get_text("dict")的結果
+            cell_size: 網格單元大小（PDF點）
+        """
+        self.cell_size = cell_size
+
+        # 文本塊條目，按在頁面中的順序排列
+        self.entries = []
+        # {塊索引: 條目}
+        self._by_block_idx = {}
+        # {(列, 行): [條目序號, ...]}
+        self._grid = defaultdict(list)
+
+        for block_idx, block in enumerate(text_dict["blocks"]):
+            if "lines" not in block:
+                continue
+
+            text = ""
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    text += span["text"] + " "
+
+            entry = {
+                "block_idx": block_idx,
+                "bbox": tuple(block["bbox"]),
+                "text": text,
+                "is_figure_caption": bool(FIGURE_CAPTION_PATTERN.search(text)),
+                "is_table_caption": bool(TABLE_CAPTION_PATTERN.search(text))
+            }
+            entry_idx = len(self.entries)
+            self.entries.append(entry)
+            self._by_block_idx[block_idx] = entry
+
+            for cell in self._cells(entry["bbox"]):
+                self._grid[cell].append(entry_idx)
+
+    def _cells(self, bbox):
+        """列出邊界框覆蓋的所有網格單元"""
+        x0, y0, x1, y1 = bbox
+        col0, col1 = int(x0 // self.cell_size), int(x1 // self.cell_size)
+        row0, row1 = int(y0 // self.cell_size), int(y1 // self.cell_size)
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                yield (col, row)
+
+    def block_text(self, block_idx):
+        """返回指定文本塊拼接好的文本（非文本塊返回None）"""
+        entry = self._by_block_idx.get(block_idx)
+        return entry["text"] if entry else None
+
+    def query(self, rect):
+        """查詢與矩形相交的文本塊
+
+        Args:
+            rect: (x0, y0, x1, y1)
+
+        Returns:
+            相交的條目列表，按在頁面中的順序排列
+        """
+        x0, y0, x1, y1 = rect
+        if x1 <= x0 or y1 <= y0:
+            return []
+
+        candidates = set()
+        for cell in self._cells(rect):
+            candidates.update(self._grid.get(cell, ()))
+
+        result = []
+        for entry_idx in sorted(candidates):
+            bx0, by0, bx1, by1 = self.entries[entry_idx]["bbox"]
+            if bx0 < x1 and bx1 > x0 and by0 < y1 and by1 > y0:
+                result.append(self.entries[entry_idx])
+        return result
+
+    def find_caption(self, rect, kind):
+        """在矩形區域內查找圖/表標題
+
+        Args:
+            rect: 查找區域 (x0, y0, x1, y1)
+            kind: "figure" 或 "table"
+
+        Returns:
+            區域內文本塊的文本（含標題時），否則返回空字符串
+        """
+        flag = "is_figure_caption" if kind == "figure" else "is_table_caption"
+        entries = self.query(rect)
+        if any(entry[flag] for entry in entries):
+            return "\n".join(entry["text"].strip() for entry in entries).strip()
+        return ""
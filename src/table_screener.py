@@ -0,0 +1,117 @@
+from collections import defaultdict
+
+class TableScreener:
+    """表格頁面預篩選
+
+    只用PyMuPDF已經得到的頁面數據（矢量繪圖中的表格線、文本行的列對齊、
+    "Table N"標題）判斷頁面是否可能包含表格，只有候選頁面才交給
+    pdfplumber或find_tables這類代價較高的表格提取器。
+    每頁的判斷結果和依據都會返回，便於核查召回率。
+    """
+
+    def __init__(self, min_rulings=3, min_aligned_rows=3, min_columns=3, align_tolerance=3.0):
+        """初始化預篩選器
+
+        Args:
+            min_rulings: 判定為候選頁所需的最少表格線數量
+            min_aligned_rows: 判定為候選頁所需的最少列對齊行數
+            min_columns: 一行至少有多少個分開的文本片段才算表格行
+            align_tolerance: 判斷行內位置和列起點對齊的容差（PDF點）
+        """
+        self.min_rulings = min_rulings
+        self.min_aligned_rows = min_aligned_rows
+        self.min_columns = min_columns
+        self.align_tolerance = align_tolerance
+
+    def screen(self, page, text_dict, page_index):
+        """判斷頁面是否可能包含表格
+
+        Args:
+            page: PyMuPDF頁面對象
+            text_dict: 該頁的文本字典
+            page_index: 該頁的PageTextIndex
+
+        Returns:
+            {"page_num", "candidate", "reasons", "caption", "rulings", "aligned_rows"}
+        """
+        caption = any(entry["is_table_caption"] for entry in page_index.entries)
+        rulings = self._count_rulings(page)
+        aligned_rows = self._count_aligned_rows(text_dict)
+
+        reasons = []
+        if caption:
+            reasons.append("caption")
+        if rulings >= self.min_rulings:
+            reasons.append("rulings")
+        if aligned_rows >= self.min_aligned_rows:
+            reasons.append("aligned_columns")
+
+        return {
+            "page_num": page.number + 1,
+            "candidate": bool(reasons),
+            "reasons": reasons,
+            "caption": caption,
+            "rulings": rulings,
+            "aligned_rows": aligned_rows
+        }
+
+    def _count_rulings(self, page, min_length=20.0, max_thickness=2.0):
+        """統計頁面繪圖中水平或垂直的細線（包括畫成細長矩形的線）"""
+        count = 0
+        try:
+            drawings = page.get_drawings()
+        except Exception as e:
+            print(f"讀取頁面繪圖時出錯: {str(e)}")
+            return 0
+
+        for drawing in drawings:
+            for item in drawing.get("items", ()):
+                if item[0] == "l":
+                    p1, p2 = item[1], item[2]
+                    dx, dy = abs(p2.x - p1.x), abs(p2.y - p1.y)
+                    if (dy <= max_thickness and dx >= min_length) or (dx <= max_thickness and dy >= min_length):
+                        count += 1
+                elif item[0] == "re":
+                    rect = item[1]
+                    if (rect.height <= max_thickness and rect.width >= min_length) or \
+                       (rect.width <= max_thickness and rect.height >= min_length):
+                        count += 1
+        return count
+
+    def _count_aligned_rows(self, text_dict):
+        """統計有多個分開的文本片段、且片段起點與其他行對齊的行數
+
+        表格的每一行在文本字典中通常是同一高度上的多個行對象；
+        正文段落一行只有一個行對象，雙欄排版也只有兩個。
+        """
+        tolerance = self.align_tolerance
+
+        # {行高度: [片段起點x, ...]}
+        rows = defaultdict(list)
+        for block in text_dict["blocks"]:
+            for line in block.get("lines", ()):
+                if not any(span["text"].strip() for span in line["spans"]):
+                    continue
+                x0, _, _, y1 = line["bbox"]
+                rows[round(y1 / tolerance)].append(x0)
+
+        table_rows = [
+            sorted(round(x / tolerance) for x in starts)
+            for starts in rows.values() if len(starts) >= self.min_columns
+        ]
+        if len(table_rows) < self.min_aligned_rows:
+            return 0
+
+        # 每個列起點出現在多少行中
+        column_counts = defaultdict(int)
+        for starts in table_rows:
+            for x in set(starts):
+                column_counts[x] += 1
+
+        # 至少有min_columns個起點與其他行共用的行才算列對齊
+        aligned = 0
+        for starts in table_rows:
+            shared = sum(1 for x in set(starts) if column_counts[x] >= 2)
+            if shared >= self.min_columns:
+                aligned += 1
+        return aligned
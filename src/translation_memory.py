@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+class TranslationMemory:
+    """持久化的翻譯記憶（SQLite）
+    
+    鍵是 (調用類型, 完整原文, 模型, 領域, 提示模板版本) 的SHA-256，
+    不同段落即使開頭相同也不會互相命中。數據庫使用WAL模式，
+    多個進程或線程可同時讀寫；每個線程使用自己的連接。
+    條目超過保留天數或總數超過上限時，按最近訪問時間淘汰。
+    """
+    
+    # 每寫入多少條檢查一次淘汰
+    EVICT_INTERVAL = 200
+    
+    def __init__(self, db_path=".cache/translation_memory.sqlite", max_entries=200000, max_age_days=None):
+        """初始化翻譯記憶
+        
+        Args:
+            db_path: SQLite數據庫路徑
+            max_entries: 最多保留的條目數（None表示不限制）
+            max_age_days: 超過此天數未被訪問的條目會被淘汰（None表示不限制）
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        
+        # 統計
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    model TEXT,
+                    domain TEXT,
+                    prompt_version INTEGER,
+                    source TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            # 舊版數據庫沒有prompt_version列，補上（舊條目為NULL，不參與按版本的遍歷）
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(translations)")]
+            if "prompt_version" not in columns:
+                conn.execute("ALTER TABLE translations ADD COLUMN prompt_version INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_accessed ON translations (accessed)")
+    
+    def _connection(self):
+        """取得當前線程的數據庫連接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def make_key(kind, source, model, domain, prompt_version):
+        """生成條目的鍵
+        
+        Args:
+            kind: 調用類型（text、formula、table、image）
+            source: 完整原文
+            model: 模型名稱
+            domain: 領域
+            prompt_version: 提示模板版本
+        
+        Returns:
+            十六進制SHA-256字符串
+        """
+        raw_key = json.dumps([kind, source, model, domain, prompt_version], ensure_ascii=False)
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """讀取譯文
+        
+        Args:
+            key: make_key生成的鍵
+        
+        Returns:
+            譯文（表格為二維列表），未命中時返回None
+        """
+        try:
+            with self._connection() as conn:
+                row = conn.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE translations SET accessed = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            print(f"讀取翻譯記憶時出錯: {e}")
+            row = None
+        
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if row is None else json.loads(row[0])
+    
+    def put(self, key, kind, source, translation, model=None, domain=None, prompt_version=None):
+        """寫入譯文
+        
+        Args:
+            key: make_key生成的鍵
+            kind: 調用類型
+            source: 完整原文
+            translation: 譯文（可JSON序列化，表格為二維列表）
+            model: 模型名稱
+            domain: 領域
+            prompt_version: 提示模板版本
+        """
+        now = time.time()
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO translations "
+                    "(key, kind, model, domain, prompt_version, source, translation, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, kind, model, domain, prompt_version, source,
+                     json.dumps(translation, ensure_ascii=False), now, now)
+                )
+        except sqlite3.Error as e:
+            print(f"寫入翻譯記憶時出錯: {e}")
+            return
+        
+        with self._lock:
+            self.writes += 1
+            self._puts_since_evict += 1
+            evict = self._puts_since_evict >= self.EVICT_INTERVAL
+            if evict:
+                self._puts_since_evict = 0
+        if evict:
+            self.evict()
+    
+    def iter_entries(self, kind=None, model=None, prompt_version=None, limit=None):
+        """按最近訪問時間從新到舊遍歷條目
+        
+        Args:
+            kind: 只遍歷此調用類型的條目（None表示全部）
+            model: 只遍歷此模型的條目（None表示全部）
+            prompt_version: 只遍歷此提示模板版本的條目（None表示全部）
+            limit: 最多返回的條目數（None表示不限制）
+        
+        Yields:
+            (原文, 譯文, 領域)
+        """
+        query = "SELECT source, translation, domain FROM translations"
+        conditions = []
+        params = []
+        for column, value in (("kind", kind), ("model", model), ("prompt_version", prompt_version)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY accessed DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        try:
+            rows = self._connection().execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"讀取翻譯記憶時出錯: {e}")
+            return
+        for source, translation, domain in rows:
+            yield source, json.loads(translation), domain
+    
+    def evict(self):
+        """淘汰過期條目，並把條目數控制在上限以內
+        
+        Returns:
+            刪除的條目數
+        """
+        removed = 0
+        try:
+            with self._connection() as conn:
+                if self.max_age_days is not None:
+                    cutoff = time.time() - self.max_age_days * 86400
+                    removed += conn.execute("DELETE FROM translations WHERE accessed < ?", (cutoff,)).rowcount
+                if self.max_entries is not None:
+                    count = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+                    if count > self.max_entries:
+                        removed += conn.execute(
+                            "DELETE FROM translations WHERE key IN "
+                            "(SELECT key FROM translations ORDER BY accessed LIMIT ?)",
+                            (count - self.max_entries,)
+                        ).rowcount
+        except sqlite3.Error as e:
+            print(f"淘汰翻譯記憶條目時出錯: {e}")
+        if removed:
+            print(f"翻譯記憶已淘汰 {removed} 條")
+        return removed
+    
+    def __len__(self):
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+    
+    def get_statistics(self):
+        """獲取命中統計"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "entries": len(self)
+        }
+    
+    def close(self):
+        """關閉當前線程的連接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None